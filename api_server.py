@@ -4,21 +4,32 @@ Turkcell Fatura Asistanı API Server
 FastAPI tabanlı REST API - Frontend için backend servisi
 """
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Literal, Optional
 import pandas as pd
 from pathlib import Path
+import asyncio
 import json
+import os
+import time
+import uuid
 
 # Import our engines
-from general_scripts.data_prep import read_csvs, standardize_types
-from general_scripts.anomaly_engine import load_artifacts, detect_anomalies_for
-from general_scripts.whatif_engine import load_all, scenario_cost, enumerate_top3
+from general_scripts.dataset_store import DatasetStore, fingerprint
+from general_scripts.fast_json import FastJSONResponse, dumps, frame_records, frame_to_json, iter_frame_json
+from general_scripts.payload_builder import PayloadBuilder, RULES_CATEGORY_LABELS
+from general_scripts.request_log import RequestLogger, parse_body
+from general_scripts.metrics import (REGISTRY, RECENT_PROFILES, SamplingProfiler,
+                                     begin_request, end_request, rows_scanned, span)
+from general_scripts.anomaly_engine import detect_anomalies_for, get_config as anomaly_config
+from general_scripts.whatif_engine import scenario_cost, enumerate_top3
 from general_scripts.llm_client import render_bill_summary_llm
-from general_scripts.rules_engine import analyze_bill, alloc_taxes, unit_costs
-from general_scripts.cohort_analysis import analyze_cohort_comparison
+from general_scripts.rules_engine import analyze_bill, alloc_taxes, unit_costs, get_config as rules_config
+from general_scripts.cohort_analysis import analyze_cohort_comparison, build_cohort_index
+from general_scripts.similarity_index import DEFAULT_K, MAX_K, build_similarity_index
 from general_scripts.autofix_engine import generate_autofix_recommendation
 
 app = FastAPI(
@@ -36,9 +47,83 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global data cache
-DATA_CACHE = {}
-ARTIFACTS_CACHE = {}
+# İstek bazında örnekleyici profil (X-Profile: 1 başlığı veya ?profile=1) - varsayılan kapalı
+API_PROFILING = os.getenv("API_PROFILING", "0") == "1"
+
+# Global data store - tek referans, reload ile atomik olarak değişir
+STORE = DatasetStore(Path("data"), Path("artifacts"))
+
+# Başlangıçta tabloları arka planda önceden yükle (0 = yalnızca ilk erişimde)
+PREWARM_ON_STARTUP = os.getenv("PREWARM_ON_STARTUP", "1") != "0"
+
+# Dosya izleyici: >0 ise bu aralıkla (sn) data/artifacts değişikliği kontrol edilir
+DATA_WATCH_INTERVAL = float(os.getenv("DATA_WATCH_INTERVAL", "0"))
+
+# /api/whatif/top3 sonuç önbelleği (snapshot başına, LRU)
+TOP3_CACHE_ENTRIES = int(os.getenv("TOP3_CACHE_ENTRIES", "10000"))
+
+# İstek kaydı: REQUEST_LOG=<yol> ise /api/* istekleri JSONL'ye yazılır (replay_requests.py ile oynatılır)
+REQUEST_LOG = os.getenv("REQUEST_LOG", "")
+REQUEST_LOGGER = RequestLogger(REQUEST_LOG) if REQUEST_LOG else None
+
+if REQUEST_LOGGER is not None:
+    @app.middleware("http")
+    async def request_log_middleware(request: Request, call_next):
+        if not REQUEST_LOGGER.wants(request.url.path):
+            return await call_next(request)
+        ts = time.time()
+        body = await request.body()
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            path = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+            REQUEST_LOGGER.write({
+                "ts": round(ts, 6),
+                "method": request.method,
+                "path": path,
+                "endpoint": getattr(route, "path", "unmatched"),
+                "body": parse_body(body),
+                "status": status,
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+            })
+
+# Metrics middleware - endpoint gecikmesi, aşama süreleri, taranan satırlar
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    req, token = begin_request()
+    profiler = None
+    if API_PROFILING and (request.headers.get("x-profile") == "1" or request.query_params.get("profile") == "1"):
+        profiler = SamplingProfiler().start()
+    t0 = time.perf_counter()
+    response = None
+    try:
+        response = await call_next(request)
+        return response
+    finally:
+        elapsed = time.perf_counter() - t0
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        status = response.status_code if response is not None else 500
+        REGISTRY.observe_request(request.method, endpoint, status, elapsed, req)
+        end_request(token)
+        if profiler is not None:
+            profiler.stop()
+            profile_id = uuid.uuid4().hex[:12]
+            RECENT_PROFILES.append({"id": profile_id, "endpoint": endpoint, "seconds": round(elapsed, 4),
+                                    "stages": req.stages, **profiler.report()})
+            if response is not None:
+                response.headers["X-Profile-Id"] = profile_id
+
+def _respond(payload, headers: Optional[Dict[str, str]] = None) -> FastJSONResponse:
+    """Yanıtı handler içinde doğrudan bayta serileştir (jsonable_encoder turu yok;
+    serialize aşaması da ölçülebilir)."""
+    with span("serialize"):
+        return FastJSONResponse(payload, headers=headers)
 
 # Pydantic models
 class ExplainRequest(BaseModel):
@@ -47,6 +132,8 @@ class ExplainRequest(BaseModel):
 class AnomalyRequest(BaseModel):
     user_id: int
     period: str
+    detector: Literal["zscore", "ewma", "mad"] = "zscore"  # ewma/mad: robust dedektörler (detectors.py)
+    profile: str = "default"  # eşik profili: default | sensitive | conservative
 
 class WhatIfRequest(BaseModel):
     user_id: int
@@ -60,58 +147,133 @@ class CheckoutRequest(BaseModel):
 class CohortRequest(BaseModel):
     user_id: int
     period: str
-    cohort_data: Dict[str, Any]
+    cohort_data: Optional[Dict[str, Any]] = None  # verilmezse CohortIndex kullanılır
+    method: Literal["segment", "similar"] = "segment"  # segment: (tip, plan, dönem) kohortu | similar: en yakın k kullanıcı
+    k: int = Field(DEFAULT_K, ge=1, le=MAX_K)
 
 class TaxAnalysisRequest(BaseModel):
     user_id: int
     period: str
+    profile: str = "default"  # eşik profili: default | sensitive | conservative
 
 class AutofixRequest(BaseModel):
     user_id: int
     period: str
 
+class ReloadRequest(BaseModel):
+    force: bool = False
+    wait: bool = False
+
 # Startup event - data loading
 @app.on_event("startup")
 async def startup_event():
     """Uygulama başladığında verileri yükle"""
-    global DATA_CACHE, ARTIFACTS_CACHE
-    
-    data_dir = Path("data")
-    artifacts_dir = Path("artifacts")
-    
-    if data_dir.exists():
-        print("Loading data...")
-        dfs = read_csvs(data_dir)
-        dfs = standardize_types(dfs)
-        DATA_CACHE = load_all(data_dir)
-        print(f"Loaded {len(DATA_CACHE)} dataframes")
-    
-    if artifacts_dir.exists():
-        print("Loading artifacts...")
+    snap = STORE.open()
+    print(f"Dataset opened (version {snap.version}): {len(snap.data)} tables, {len(snap.artifacts)} artifacts - loading lazily")
+    for w in snap.warnings:
+        print(f"Warning: {w}")
+
+    # Tablolar ilk istekte de yüklenir; arka planda ısıtmak soğuk başlangıcı kısaltır
+    if PREWARM_ON_STARTUP:
+        task = asyncio.create_task(_prewarm_in_background())
+        task.add_done_callback(_log_reload_failure)
+
+    if DATA_WATCH_INTERVAL > 0:
+        asyncio.create_task(_watch_data_dirs(DATA_WATCH_INTERVAL))
+
+async def _prewarm_in_background():
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, STORE.prewarm)
+    print("Data prewarmed")
+
+async def _reload_in_background(force: bool = False):
+    """Yeni snapshot'ı thread'de kur; event loop istek servis etmeye devam eder."""
+    loop = asyncio.get_running_loop()
+    snap = await loop.run_in_executor(None, STORE.reload, force)
+    print(f"Dataset reloaded (version {snap.version})")
+    return snap
+
+def _log_reload_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Warning: Background data task failed: {task.exception()}")
+
+async def _watch_data_dirs(interval: float):
+    """Dosya izleyici: değişiklik iki ardışık kontrolde sabitse reload et
+    (kopyalanması süren dosyaların yarım okunmasını önler)."""
+    pending = None
+    while True:
+        await asyncio.sleep(interval)
         try:
-            bill_summary, cat_breakdown = load_artifacts(artifacts_dir)
-            ARTIFACTS_CACHE = {
-                "bill_summary": bill_summary,
-                "category_breakdown": cat_breakdown
-            }
-            print("Artifacts loaded successfully")
+            fp = fingerprint(STORE.data_dir, STORE.artifacts_dir)
+            if fp == STORE.current.version or STORE.reloading:
+                pending = None
+                continue
+            if fp != pending:
+                pending = fp
+                continue
+            pending = None
+            await _reload_in_background()
         except Exception as e:
-            print(f"Warning: Could not load artifacts: {e}")
+            print(f"Warning: Dataset reload failed: {e}")
 
 # Health check
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "data_loaded": len(DATA_CACHE) > 0}
+    snap = STORE.current
+    tables = snap.table_status()
+    return {
+        "status": "ok",
+        "data_loaded": len(snap.data) > 0,
+        "ready": bool(tables) and all(t["ready"] for t in tables.values()),
+        "dataset_version": snap.version,
+        "tables": tables,
+    }
+
+# Metrics endpoints
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metin formatında istek metrikleri"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/profiles")
+async def metrics_profiles(limit: int = Query(10, ge=1, le=50)):
+    """Son örnekleyici profiller (API_PROFILING=1 iken X-Profile: 1 ile işaretlenen istekler)"""
+    return {"enabled": API_PROFILING, "profiles": list(RECENT_PROFILES)[-limit:][::-1]}
+
+# Admin endpoints
+@app.post("/admin/reload", status_code=202)
+async def admin_reload(response: Response, request: Optional[ReloadRequest] = None):
+    """Veriyi yeniden başlatmadan tazele: arka planda kur, doğrula, atomik değiştir"""
+    request = request or ReloadRequest()
+    if STORE.reloading:
+        return {"status": "already_running", **STORE.status()}
+
+    if request.wait:
+        try:
+            await _reload_in_background(request.force)
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Reload rejected: {e}")
+        response.status_code = 200
+        return {"status": "reloaded", **STORE.status()}
+
+    task = asyncio.create_task(_reload_in_background(request.force))
+    task.add_done_callback(_log_reload_failure)
+    return {"status": "accepted", **STORE.status()}
+
+@app.get("/admin/reload")
+async def admin_reload_status():
+    """Geçerli snapshot sürümü ve son reload durumu"""
+    return STORE.status()
 
 # User endpoints
 @app.get("/api/users/{user_id}")
 async def get_user(user_id: int):
     """Kullanıcı bilgilerini getir"""
-    if not DATA_CACHE:
+    snap = STORE.current  # istek boyunca aynı snapshot
+    if not snap.data:
         raise HTTPException(status_code=503, detail="Data not loaded")
     
-    users = DATA_CACHE["users"]
-    user = users[users["user_id"] == user_id]
+    user = snap.data.rows("users", "user_id", user_id)
     
     if user.empty:
         raise HTTPException(status_code=404, detail="User not found")
@@ -119,7 +281,7 @@ async def get_user(user_id: int):
     user_data = user.iloc[0].to_dict()
     
     # Plan bilgilerini de ekle
-    plans = DATA_CACHE["plans"]
+    plans = snap.data["plans"]
     plan = plans[plans["plan_id"] == user_data["current_plan_id"]]
     if not plan.empty:
         user_data["current_plan"] = plan.iloc[0].to_dict()
@@ -127,25 +289,34 @@ async def get_user(user_id: int):
     return user_data
 
 @app.get("/api/users")
-async def list_users():
-    """Tüm kullanıcıları listele"""
-    if not DATA_CACHE:
+async def list_users(
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    stream: bool = Query(False),
+):
+    """Tüm kullanıcıları listele (opsiyonel sayfalama: offset/limit, parça parça: stream=true)"""
+    snap = STORE.current  # istek boyunca aynı snapshot
+    if not snap.data:
         raise HTTPException(status_code=503, detail="Data not loaded")
     
-    users = DATA_CACHE["users"]
-    return users.to_dict("records")
+    users = snap.data["users"]
+    headers = {"X-Total-Count": str(len(users))}
+    page = users.iloc[offset:offset + limit] if limit else users.iloc[offset:]
+    rows_scanned(len(page))
+    if stream:
+        return StreamingResponse(iter_frame_json(page), media_type="application/json", headers=headers)
+    with span("serialize"):
+        return FastJSONResponse(frame_to_json(page), headers=headers)
 
 # Bill endpoints
 @app.get("/api/bills/{user_id}")
 async def get_user_bills(user_id: int, period: Optional[str] = Query(None)):
     """Kullanıcının faturalarını getir"""
-    if not DATA_CACHE:
+    snap = STORE.current  # istek boyunca aynı snapshot
+    if not snap.data:
         raise HTTPException(status_code=503, detail="Data not loaded")
     
-    bh = DATA_CACHE["bill_headers"]
-    bi = DATA_CACHE["bill_items"]
-    
-    user_bills = bh[bh["user_id"] == user_id].copy()
+    user_bills = snap.data.rows("bill_headers", "user_id", user_id)
     
     if period:
         user_bills = user_bills[user_bills["period"] == period]
@@ -153,159 +324,152 @@ async def get_user_bills(user_id: int, period: Optional[str] = Query(None)):
     if user_bills.empty:
         raise HTTPException(status_code=404, detail="No bills found")
     
-    # Her fatura için items'ları da ekle
-    result = []
-    for _, bill in user_bills.iterrows():
-        bill_data = bill.to_dict()
-        bill_items = bi[bi["bill_id"] == bill["bill_id"]].to_dict("records")
-        bill_data["items"] = bill_items
-        result.append(bill_data)
+    # Her fatura için items'ları da ekle (kolon bazında dönüşüm, iterrows yok)
+    result = frame_records(user_bills)
+    for bill_data in result:
+        bill_data["items"] = frame_records(snap.data.rows("bill_items", "bill_id", bill_data["bill_id"]))
     
-    return result if len(result) > 1 else result[0]
+    return _respond(result if len(result) > 1 else result[0])
 
 # Catalog endpoints
 @app.get("/api/catalog")
 async def get_catalog():
     """Tüm katalog verilerini getir"""
-    if not DATA_CACHE:
+    snap = STORE.current  # istek boyunca aynı snapshot
+    if not snap.data:
         raise HTTPException(status_code=503, detail="Data not loaded")
     
+    # Katalog snapshot boyunca değişmez: serileştirilmiş bayt önbellekte tutulur
+    return FastJSONResponse(snap.memo("catalog_json", lambda: _build_catalog(snap.data)))
+
+def _build_catalog(data) -> bytes:
     catalog = {}
     
     # Plans
-    if "plans" in DATA_CACHE:
-        catalog["plans"] = DATA_CACHE["plans"].to_dict("records")
+    if "plans" in data:
+        catalog["plans"] = frame_records(data["plans"])
     
     # Add-ons
-    if "add_on_packs" in DATA_CACHE:
-        catalog["addons"] = DATA_CACHE["add_on_packs"].to_dict("records")
+    if "add_on_packs" in data:
+        catalog["addons"] = frame_records(data["add_on_packs"])
     
     # VAS catalog
-    if "vas_catalog" in DATA_CACHE:
-        catalog["vas"] = DATA_CACHE["vas_catalog"].to_dict("records")
+    if "vas_catalog" in data:
+        catalog["vas"] = frame_records(data["vas_catalog"])
     
     # Premium SMS catalog
-    if "premium_sms_catalog" in DATA_CACHE:
-        catalog["premium_sms"] = DATA_CACHE["premium_sms_catalog"].to_dict("records")
+    if "premium_sms_catalog" in data:
+        catalog["premium_sms"] = frame_records(data["premium_sms_catalog"])
     
-    return catalog
+    with span("serialize"):
+        return dumps(catalog)
 
 # Explain endpoint
 @app.post("/api/explain")
 async def explain_bill(request: ExplainRequest):
     """Faturayı açıkla"""
-    if not DATA_CACHE or not ARTIFACTS_CACHE:
+    snap = STORE.current  # istek boyunca aynı snapshot
+    if not snap.data:
         raise HTTPException(status_code=503, detail="Data not loaded")
     
     bill_id = request.bill_id
+    builder = _builder(snap)
     
     # Bill header'ı bul
-    bh = DATA_CACHE["bill_headers"]
-    bill = bh[bh["bill_id"] == bill_id]
-    if bill.empty:
-        raise HTTPException(status_code=404, detail="Bill not found")
-    
-    bill_data = bill.iloc[0]
-    user_id = bill_data["user_id"]
-    period = bill_data["period"]
-    
-    # Bill items'ları kategorilere göre grupla
-    bi = DATA_CACHE["bill_items"]
-    items = bi[bi["bill_id"] == bill_id]
-    
-    # Kategori bazında toplamlar
-    breakdown = []
-    for category in items["category"].unique():
-        cat_items = items[items["category"] == category]
-        total = cat_items["amount"].sum()
-        
-        # Her kalem için açıklama
-        lines = []
-        for _, item in cat_items.iterrows():
-            line = {
-                "text": f"{item['description']} - {item['quantity']}x{item['unit_price']} TL",
-                "amount": float(item["amount"])
-            }
-            lines.append(line)
-        
-        breakdown.append({
-            "category": category,
-            "total": float(total),
-            "lines": lines
-        })
-    
-    # Kullanım özeti
-    usage = DATA_CACHE["usage_daily"]
-    bill_start = bill_data["period_start"]
-    bill_end = bill_data["period_end"]
-    
-    period_usage = usage[
-        (usage["user_id"] == user_id) & 
-        (usage["date"] >= bill_start) & 
-        (usage["date"] <= bill_end)
-    ]
-    
-    usage_summary = {
-        "gb": float(period_usage["mb_used"].sum()) / 1024.0,
-        "minutes": float(period_usage["minutes_used"].sum()),
-        "sms": int(period_usage["sms_used"].sum()),
-        "roaming_gb": float(period_usage["roaming_mb"].sum()) / 1024.0
-    }
+    with span("lookup"):
+        try:
+            builder.header(bill_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Bill not found")
+        rows_scanned(len(builder.items(bill_id)) + 1)
     
-    # Özet
-    summary = {
-        "period": period,
-        "total": float(bill_data["total_amount"]),
-        "taxes": float(items[items["category"] == "tax"]["amount"].sum()),
-        "usage_summary": usage_summary,
-        "baseline_total_mean": 0.0,  # TODO: geçmiş ortalaması hesapla
-        "total_delta": 0.0
-    }
+    # Kategori bazında toplamlar + kalem satırları (tek sıralama/gruplama)
+    with span("breakdown"):
+        breakdown = builder.breakdown(bill_id)
+    
+    # Kullanım özeti + önceki aylar ortalaması
+    with span("summary"):
+        summary = builder.summary(bill_id)
     
     # LLM özeti
-    payload = {
-        "summary": summary,
-        "breakdown": breakdown,
-        "contributors": []  # TODO: katkıda bulunanları hesapla
-    }
+    with span("contributors"):
+        payload = builder.payload(bill_id)
     
-    try:
-        llm_summary = render_bill_summary_llm(payload)
-    except Exception as e:
-        llm_summary = f"Fatura özeti: {summary['total']} TL toplam tutar."
+    with span("llm"):
+        try:
+            llm_summary = render_bill_summary_llm(payload)
+        except Exception as e:
+            llm_summary = f"Fatura özeti: {summary['total']} TL toplam tutar."
     
-    return {
+    return _respond({
         "summary": summary,
         "breakdown": breakdown,
         "llm_summary": llm_summary
-    }
+    })
 
 # Anomaly endpoint
 @app.post("/api/anomalies")
 async def detect_anomalies(request: AnomalyRequest):
     """Anomalileri tespit et"""
-    if not ARTIFACTS_CACHE:
+    snap = STORE.current  # istek boyunca aynı snapshot
+    if not snap.artifacts:
         raise HTTPException(status_code=503, detail="Artifacts not loaded")
     
     user_id = request.user_id
     period = request.period
+    config = _profile_or_400(anomaly_config, request.profile)
     
     try:
-        result = detect_anomalies_for(
-            ARTIFACTS_CACHE["bill_summary"],
-            ARTIFACTS_CACHE["category_breakdown"],
-            user_id,
-            period
-        )
+        bill_summary = snap.artifacts["bill_summary"]
+        cat_breakdown = snap.artifacts["category_breakdown"]
+        with span("compute"):
+            result = detect_anomalies_for(
+                bill_summary,
+                cat_breakdown,
+                user_id,
+                period,
+                detector=request.detector,
+                config=config,
+            )
+        rows_scanned(len(bill_summary) + len(cat_breakdown))
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/anomalies/table")
+async def anomaly_table(
+    period: Optional[str] = Query(None, description="YYYY-MM"),
+    category: Optional[str] = Query(None),
+    severity: Optional[Literal["high", "medium"]] = Query(None),
+    segment: Optional[str] = Query(None),
+    plan_id: Optional[int] = Query(None),
+    user_id: Optional[int] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=10000),
+):
+    """Gece işinin ürettiği anomali tablosundan filtreli/sayfalı okuma (yeniden hesaplama yok)"""
+    snap = STORE.current  # istek boyunca aynı snapshot
+    if not snap.artifacts or "anomalies" not in snap.artifacts:
+        raise HTTPException(status_code=503, detail="Anomaly table not built (python -m general_scripts.anomaly_table)")
+    
+    with span("lookup"):
+        table = snap.artifacts["anomalies"]
+        rows = snap.artifacts.rows("anomalies", "period", period) if period else table
+        rows_scanned(len(rows))
+        for col, value in (("category", category and category.lower()), ("severity", severity),
+                           ("segment", segment), ("plan_id", plan_id), ("user_id", user_id)):
+            if value is not None:
+                rows = rows[rows[col] == value]
+    headers = {"X-Total-Count": str(len(rows))}
+    with span("serialize"):
+        return FastJSONResponse(frame_to_json(rows.iloc[offset:offset + limit]), headers=headers)
+
 # What-if endpoint
 @app.post("/api/whatif")
 async def what_if_simulation(request: WhatIfRequest):
     """What-if simülasyonu"""
-    if not DATA_CACHE:
+    snap = STORE.current  # istek boyunca aynı snapshot
+    if not snap.data:
         raise HTTPException(status_code=503, detail="Data not loaded")
     
     user_id = request.user_id
@@ -319,27 +483,55 @@ async def what_if_simulation(request: WhatIfRequest):
         disable_vas = scenario.get("disable_vas", False)
         block_premium_sms = scenario.get("block_premium_sms", False)
         
-        result = scenario_cost(
-            user_id, period, DATA_CACHE,
-            plan_id=plan_id,
-            addons=addons,
-            disable_vas=disable_vas,
-            block_premium_sms=block_premium_sms
-        )
+        with span("compute"):
+            result = scenario_cost(
+                user_id, period, snap.data,
+                plan_id=plan_id,
+                addons=addons,
+                disable_vas=disable_vas,
+                block_premium_sms=block_premium_sms
+            )
+        rows_scanned(len(snap.data["bill_headers"]) + len(snap.data["usage_daily"]) + len(snap.data["bill_items"]))
         
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _builder(snap) -> PayloadBuilder:
+    """Snapshot başına tek PayloadBuilder; bölümler fatura bazında önbellekte kalır"""
+    return snap.memo("payload_builder", lambda: PayloadBuilder(snap.data))
+
+def _bill_id_or_404(builder: PayloadBuilder, user_id: int, period: str) -> int:
+    if builder.user_bills(user_id).empty:
+        raise HTTPException(status_code=404, detail="User bill not found")
+    bill_id = builder.bill_id_for(user_id, period)
+    if bill_id is None:
+        raise HTTPException(status_code=404, detail="Bill for period not found")
+    return bill_id
+
+def _profile_or_400(get_config, name: str):
+    """Değişmez eşik profili; istekler arasında paylaşılır, hiçbir global değiştirilmez."""
+    try:
+        return get_config(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _top3(snap, user_id: int, period: str):
+    """enumerate_top3 pahalı; sonuç snapshot sürümüne bağlı, sınırlı (LRU) önbellekte tutulur"""
+    with span("compute"):
+        return snap.memo_lru(("top3", user_id, period), lambda: enumerate_top3(user_id, period, snap.data),
+                             TOP3_CACHE_ENTRIES)
+
 # Top 3 scenarios endpoint
 @app.get("/api/whatif/top3/{user_id}")
 async def get_top3_scenarios(user_id: int, period: str):
     """En iyi 3 senaryoyu getir"""
-    if not DATA_CACHE:
+    snap = STORE.current  # istek boyunca aynı snapshot
+    if not snap.data:
         raise HTTPException(status_code=503, detail="Data not loaded")
     
     try:
-        scenarios = enumerate_top3(user_id, period, DATA_CACHE)
+        scenarios = _top3(snap, user_id, period)
         return {"scenarios": scenarios}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -367,42 +559,41 @@ async def checkout(request: CheckoutRequest):
 @app.post("/api/cohort")
 async def cohort_comparison(request: CohortRequest):
     """Kohort kıyası: benzer kullanıcıların ortalamasına göre fark"""
-    if not ARTIFACTS_CACHE:
-        raise HTTPException(status_code=503, detail="Artifacts not loaded")
+    snap = STORE.current  # istek boyunca aynı snapshot
+    if not snap.data:
+        raise HTTPException(status_code=503, detail="Data not loaded")
     
     user_id = request.user_id
     period = request.period
     cohort_data = request.cohort_data
     
     try:
-        # Kullanıcının fatura verilerini al
-        bill_summary = ARTIFACTS_CACHE["bill_summary"]
-        user_bills = bill_summary[bill_summary["user_id"] == user_id]
-        
-        if user_bills.empty:
-            raise HTTPException(status_code=404, detail="User bill not found")
-        
-        # Fatura verilerini hazırla
-        bill_data = user_bills[user_bills["period"] == period]
-        if bill_data.empty:
-            raise HTTPException(status_code=404, detail="Bill for period not found")
+        # Payload özeti (toplam + dönem kullanımı) ortak üreticiden
+        with span("lookup"):
+            builder = _builder(snap)
+            bill_id = _bill_id_or_404(builder, user_id, period)
+            payload = {"summary": builder.summary(bill_id)}
         
-        # Payload formatına çevir
-        payload = {
-            "summary": {
-                "total": float(bill_data["total_amount"].iloc[0]),
-                "usage_summary": {
-                    "gb": float(bill_data["data"].iloc[0]),
-                    "minutes": float(bill_data["voice"].iloc[0]),
-                    "sms": float(bill_data["sms"].iloc[0])
-                }
-            }
-        }
-        
-        # Kohort analizi yap
-        result = analyze_cohort_comparison(payload, cohort_data)
+        # Kohort analizi yap (cohort_data verilmediyse gerçek kohort dağılımı)
+        with span("compute"):
+            if cohort_data is not None:
+                result = analyze_cohort_comparison(payload, cohort_data)
+            elif request.method == "similar":
+                if not snap.artifacts:
+                    raise HTTPException(status_code=503, detail="Artifacts not loaded")
+                index = snap.memo("similarity_index",
+                                  lambda: build_similarity_index(snap.data, snap.artifacts["bill_summary"]))
+                cohort = index.cohort(user_id, period, k=request.k)
+                if cohort is None:
+                    raise HTTPException(status_code=404, detail="No similar users for period")
+                result = analyze_cohort_comparison(payload, cohort=cohort)
+            else:
+                index = snap.memo("cohort_index", lambda: build_cohort_index(snap.data))
+                result = analyze_cohort_comparison(payload, cohort=index.for_user(user_id, period))
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -410,54 +601,31 @@ async def cohort_comparison(request: CohortRequest):
 @app.post("/api/tax-analysis")
 async def tax_analysis(request: TaxAnalysisRequest):
     """Vergi ayrıştırma ve birim maliyet analizi"""
-    if not ARTIFACTS_CACHE:
-        raise HTTPException(status_code=503, detail="Artifacts not loaded")
+    snap = STORE.current  # istek boyunca aynı snapshot
+    if not snap.data:
+        raise HTTPException(status_code=503, detail="Data not loaded")
     
     user_id = request.user_id
     period = request.period
+    config = _profile_or_400(rules_config, request.profile)
     
     try:
-        # Kullanıcının fatura verilerini al
-        bill_summary = ARTIFACTS_CACHE["bill_summary"]
-        cat_breakdown = ARTIFACTS_CACHE["category_breakdown"]
-        
-        user_bills = bill_summary[bill_summary["user_id"] == user_id]
-        if user_bills.empty:
-            raise HTTPException(status_code=404, detail="User bill not found")
-        
-        bill_data = user_bills[user_bills["period"] == period]
-        if bill_data.empty:
-            raise HTTPException(status_code=404, detail="Bill for period not found")
-        
-        # Kategori breakdown'ını al
-        bill_id = bill_data["bill_id"].iloc[0]
-        categories = cat_breakdown[cat_breakdown["bill_id"] == bill_id]
-        
-        # Payload formatına çevir
-        payload = {
-            "summary": {
-                "total": float(bill_data["total_amount"].iloc[0]),
-                "taxes": float(bill_data["tax"].iloc[0]),
-                "usage_summary": {
-                    "gb": float(bill_data["data"].iloc[0]),
-                    "minutes": float(bill_data["voice"].iloc[0]),
-                    "sms": float(bill_data["sms"].iloc[0])
-                }
-            },
-            "breakdown": []
-        }
-        
-        # Kategori breakdown'ını ekle
-        for _, cat in categories.iterrows():
-            payload["breakdown"].append({
-                "category": cat["category"],
-                "total": float(cat["total_amount"])
-            })
+        # Payload (özet + rules_engine etiketli breakdown/contributors) ortak üreticiden
+        with span("lookup"):
+            builder = _builder(snap)
+            bill_id = _bill_id_or_404(builder, user_id, period)
+            payload = builder.payload(bill_id, labels=RULES_CATEGORY_LABELS)
+            user = snap.data.rows("users", "user_id", user_id)
+            if not user.empty:
+                config = config.for_segment(user.iloc[0].get("type"), user.iloc[0].get("current_plan_id"))
         
         # Rules engine ile analiz yap
-        result = analyze_bill(payload)
+        with span("compute"):
+            result = analyze_bill(payload, config=config)
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -465,7 +633,8 @@ async def tax_analysis(request: TaxAnalysisRequest):
 @app.post("/api/autofix")
 async def autofix_recommendation(request: AutofixRequest):
     """Otomatik "autofix" önerisi: tek tıkla en iyi senaryo + gerekçe"""
-    if not DATA_CACHE or not ARTIFACTS_CACHE:
+    snap = STORE.current  # istek boyunca aynı snapshot
+    if not snap.data:
         raise HTTPException(status_code=503, detail="Data not loaded")
     
     user_id = request.user_id
@@ -473,36 +642,44 @@ async def autofix_recommendation(request: AutofixRequest):
     
     try:
         # Önce what-if senaryolarını al
-        scenarios = enumerate_top3(user_id, period, DATA_CACHE)
+        scenarios = _top3(snap, user_id, period)
         
         if not scenarios:
             raise HTTPException(status_code=404, detail="No scenarios found")
         
-        # Kullanıcının mevcut fatura verilerini al
-        bill_summary = ARTIFACTS_CACHE["bill_summary"]
-        user_bills = bill_summary[bill_summary["user_id"] == user_id]
-        
-        if user_bills.empty:
-            raise HTTPException(status_code=404, detail="User bill not found")
-        
-        bill_data = user_bills[user_bills["period"] == period]
-        if bill_data.empty:
-            raise HTTPException(status_code=404, detail="Bill for period not found")
-        
-        # Payload formatına çevir
-        payload = {
-            "summary": {
-                "total": float(bill_data["total_amount"].iloc[0])
-            }
-        }
+        # Kullanıcının mevcut fatura özeti
+        with span("lookup"):
+            builder = _builder(snap)
+            bill_id = _bill_id_or_404(builder, user_id, period)
+            payload = {"summary": builder.summary(bill_id)}
         
         # Autofix önerisi oluştur
-        result = generate_autofix_recommendation(payload, scenarios)
+        with span("compute"):
+            result = generate_autofix_recommendation(payload, scenarios)
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def parse_args():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    ap.add_argument("--profile-startup", action="store_true",
+                    help="Sunucuyu başlatmadan import/tablo yükleme profilini çıkar")
+    ap.add_argument("--profile-out", default="startup_profile.json", help="Profil JSON çıktısı")
+    return ap.parse_args()
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    args = parse_args()
+    if args.profile_startup:
+        from general_scripts.startup_profile import profile_startup
+        report = profile_startup(DatasetStore(STORE.data_dir, STORE.artifacts_dir), Path(args.profile_out))
+        print(f"Import: {report['imports']['total_ms']} ms, load: {report['load']['total_s']} s, "
+              f"RSS: {report['rss_mb_end']} MB -> {args.profile_out}")
+    else:
+        import uvicorn
+        uvicorn.run(app, host=args.host, port=args.port) 
\ No newline at end of file
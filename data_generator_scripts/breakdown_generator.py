@@ -1,55 +1,49 @@
-# === make_category_breakdown (pure Python, no shell) ===
-import pandas as pd
+# -*- coding: utf-8 -*-
+"""
+breakdown_generator.py — category_breakdown.csv üretimi (geriye uyumluluk)
+
+category_breakdown artık data_prep.py içinde bill_summary ile aynı geçişte üretilir
+(data_prep.build_category_breakdown). Bu betik yalnızca o artifact'i yeniden
+yazmak için ince bir sarmalayıcıdır.
+
+Kullanım:
+    python data_generator_scripts/breakdown_generator.py --data data --out artifacts
+"""
+from __future__ import annotations
+
+import argparse
+import sys
 from pathlib import Path
 
-# KÖK klasörünü kendi yoluna göre ayarla (gerekirse değiştir)
-BASE = Path(r"D:\GIT\turkcell_codenight")
-DATA = BASE / "data"
-OUT  = BASE / "artifacts"
-OUT.mkdir(parents=True, exist_ok=True)
-
-# 1) bill_items.csv oku (sağlam okuma)
-bi = pd.read_csv(DATA / "bill_items.csv")
-
-# a) kategorileri normalize et
-bi["category"] = bi["category"].astype(str).str.lower().str.strip()
-if "subtype" in bi.columns:
-    bi["subtype"] = bi["subtype"].astype(str).str.lower().str.strip()
-
-# b) sayısal alanları zorla sayıya çevir (virgül/nokta olursa düzelt)
-def to_num(s):
-    # "12,50" gibi değerler için
-    return pd.to_numeric(
-        pd.Series(s, dtype="string")
-          .str.replace(".", "", regex=False)   # "1.234,56" -> "1234,56"
-          .str.replace(",", ".", regex=False), # "1234,56" -> "1234.56"
-        errors="coerce"
-    )
-
-for c in ["amount","unit_price","quantity","tax_rate"]:
-    if c in bi.columns:
-        bi[c] = to_num(bi[c]) if bi[c].dtype == "object" else pd.to_numeric(bi[c], errors="coerce")
-
-for c in ["bill_id","item_id"]:
-    if c in bi.columns:
-        bi[c] = pd.to_numeric(bi[c], errors="coerce")
-
-# NaN amount -> 0
-bi["amount"] = bi["amount"].fillna(0.0)
-
-# 2) breakdown üret
-cat = (
-    bi.groupby(["bill_id","category"], dropna=False)
-      .agg(
-          category_total=("amount","sum"),
-          n_items=("item_id","count"),
-          unit_price_avg=("unit_price","mean"),
-          tax_rate_avg=("tax_rate","mean"),
-      ).reset_index()
-)
-
-# 3) yaz ve raporla
-cat.to_csv(OUT / "category_breakdown.csv", index=False, encoding="utf-8")
-print(f"✓ category_breakdown.csv yazıldı → {OUT}")
-print("satır sayısı:", len(cat))
-print("örnek kategoriler:", cat['category'].unique()[:10])
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from general_scripts.data_prep import build_category_breakdown, read_table, standardize_types
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", default=str(ROOT / "data"), help="Girdi klasörü (bill_items.csv)")
+    ap.add_argument("--out", default=str(ROOT / "artifacts"), help="Çıktı klasörü")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    data, out = Path(args.data), Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+
+    bi = read_table(data, "bill_items")
+    if bi is None:
+        raise FileNotFoundError(f"Eksik: {data / 'bill_items.csv'}")
+    cat = build_category_breakdown(standardize_types({"bill_items": bi})["bill_items"])
+
+    cat.to_csv(out / "category_breakdown.csv", index=False, encoding="utf-8")
+    print(f"✓ category_breakdown.csv yazıldı → {out}")
+    print("satır sayısı:", len(cat))
+    print("örnek kategoriler:", cat['category'].unique()[:10])
+
+
+if __name__ == "__main__":
+    main()
@@ -22,13 +22,36 @@ $ python mock_data_generator.py
 
 Ya da parametreli:
 $ python mock_data_generator.py --n_users 50 --n_months 4 --seed 42 --anom_rate 0.2
+
+Büyük ölçek (ör. 1M kullanıcı): kullanım simülasyonu kullanıcı blokları halinde
+(--chunk_users) vektörel üretilir ve usage_daily.csv'ye parça parça yazılır;
+bellekte yalnızca kullanıcı-ay toplamları tutulur. Faturalama da bu toplamlar
+üzerinden kullanıcı x ay ızgarasında vektörel kurulur (kullanıcı başına filtreleme yok).
+Tek süreçte 1M kullanıcı x 4 ay (123M satır, ~7,5 GB usage_daily.csv): simülasyon ~40 sn,
+CSV yazımı ~14 dk (baskın maliyet; tek çekirdek). Tepe bellek --chunk_users ile orantılıdır
+(varsayılan 100k ≈ 3,9 GB, 25k ≈ 1 GB); büyük ölçekte --shards/--workers kullanın.
+
+Not: kullanım ve kullanıcılar blok halinde vektörel çekildiğinden aynı --seed eski
+(kullanıcı başına döngülü) sürümlerden farklı bir veri seti üretir.
+
+Shard'lı üretim (çok GB'lık kapasite testleri için):
+$ python mock_data_generator.py --n_users 2000000 --shards 32 --workers 8 --out data_big
+
+Kullanıcılar N shard'a bölünür, her shard ayrı bir süreçte kendi türetilmiş
+tohumuyla (SeedSequence(seed, spawn_key=(shard,))) üretilir; aynı --seed/--shards
+için çıktı --workers'tan bağımsız olarak birebir aynıdır. users, bill_headers,
+bill_items ve usage_daily <out>/<tablo>/part-XXXXX.csv olarak yazılır;
+data_prep.py bu klasörleri doğrudan okur.
 """
 from __future__ import annotations
 import argparse
+import json
+import os
 import random
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
 
 import numpy as np
 import pandas as pd
@@ -44,6 +67,10 @@ def parse_args():
     ap.add_argument("--n_users", type=int, default=75, help="Kullanıcı sayısı")
     ap.add_argument("--n_months", type=int, default=4, help="Kaç ay üretilecek (son ay anomali/what-if testleri için)")
     ap.add_argument("--anom_rate", type=float, default=0.25, help="Son ayda kaç kullanıcının anomalisı olacak (0-1)")
+    ap.add_argument("--chunk_users", type=int, default=CHUNK_USERS, help="Kullanım simülasyonu blok boyutu (kullanıcı)")
+    ap.add_argument("--shards", type=int, default=0,
+                    help="Kullanıcıları N shard'a böl; her tablo <out>/<tablo>/part-XXXXX.csv olarak yazılır (0 = tek dosya)")
+    ap.add_argument("--workers", type=int, default=None, help="Paralel süreç sayısı (varsayılan: CPU sayısı); çıktıyı etkilemez")
     return ap.parse_args()
 
 # Yardımcılar
@@ -52,6 +79,9 @@ rng = np.random.default_rng(123)
 def choice(a):
     return a[rng.integers(0, len(a))]
 
+def _rng_or_default(r: Optional[np.random.Generator]) -> np.random.Generator:
+    return r if r is not None else rng
+
 # ============================
 # Kataloglar
 # ============================
@@ -94,14 +124,22 @@ def build_catalogs(seed: int):
 # Kullanıcılar
 # ============================
 
-def build_users(n_users: int, plans: pd.DataFrame) -> pd.DataFrame:
-    users = []
-    for i in range(n_users):
-        uid = 1000 + i
-        plan = plans.sample(1, random_state=uid).iloc[0]
-        msisdn = f"5{rng.integers(0,9)}{rng.integers(100000000, 999999999)}"[:10]
-        users.append([uid, f"Kullanıcı {i+1}", int(plan.plan_id), "retail", msisdn])
-    return pd.DataFrame(users, columns=["user_id","name","current_plan_id","type","msisdn"])
+def build_users(n_users: int, plans: pd.DataFrame, rng: Optional[np.random.Generator] = None,
+                start: int = 0) -> pd.DataFrame:
+    """start: ilk kullanıcının sıra no'su (shard'lar için). Plan ve msisdn rng'den tek
+    seferde (vektörel) çekilir; aynı tohum/shard için sonuç sabittir."""
+    rng = _rng_or_default(rng)
+    idx = np.arange(start, start + n_users)
+    plan_ids = plans["plan_id"].to_numpy()[rng.integers(0, len(plans), n_users)]
+    # "5" + tek hane + 9 haneli sayının ilk 8 hanesi (10 hane)
+    msisdn = 5_000_000_000 + rng.integers(0, 9, n_users) * 100_000_000 + rng.integers(100000000, 999999999, n_users) // 10
+    return pd.DataFrame({
+        "user_id": 1000 + idx,
+        "name": "Kullanıcı " + pd.Series(idx + 1).astype(str),
+        "current_plan_id": plan_ids.astype(int),
+        "type": "retail",
+        "msisdn": msisdn.astype(str),
+    })
 
 # ============================
 # Kullanım ve Fatura simülasyonu
@@ -113,68 +151,151 @@ def month_range(n_months: int) -> List[pd.Timestamp]:
     return [base - pd.DateOffset(months=i) for i in range(n_months)][::-1]
 
 
-def simulate_usage(users: pd.DataFrame, months: List[pd.Timestamp]) -> pd.DataFrame:
-    """Gerçekçiliği artırılmış kullanım simülasyonu.
+USAGE_COLUMNS = ["user_id","date","mb_used","minutes_used","sms_used","roaming_mb"]
+CHUNK_USERS = 100_000   # bir blokta simüle edilen kullanıcı sayısı (bellek ~ CHUNK_USERS x 31 gün)
+ROAM_MAX_DAYS = 7
+
+
+def _usage_month(user_ids: np.ndarray, base_gb: np.ndarray, base_min: np.ndarray, base_sms_m: np.ndarray,
+                 m: pd.Timestamp, rng: np.random.Generator) -> dict:
+    """Tek ay için kullanıcılar x günler matrisleri (tüm kullanıcılar tek seferde)."""
+    days = pd.date_range(m, m + pd.offsets.MonthEnd(0), freq="D")
+    n, n_users = len(days), len(user_ids)
+    weekday = days.weekday.to_numpy()
+
+    # Ay içi yumuşak sezonluk dalga (sinüs) [0.85, 1.15]; faz kullanıcıya özgü
+    phase = rng.uniform(0, 2*np.pi, size=n_users)[:, None]
+    seasonal = 1.0 + 0.15*np.sin(np.linspace(0, 2*np.pi, n, endpoint=False)[None, :] + phase)
+
+    # Hafta içi/sonu çarpanları (ay başına bir kez)
+    weekday_mult = np.where(weekday < 5, 1.10, 0.95)         # dk için
+    weekend_data_boost = np.where(weekday >= 5, 1.05, 0.98)
+
+    # Günlük ortalamalar
+    mean_gb_day = (base_gb[:, None] / n) * seasonal * weekend_data_boost
+    mean_min_day = (base_min[:, None] / n) * seasonal * weekday_mult
+    mean_sms_day = (base_sms_m[:, None] / n) * seasonal
+
+    # Gerçekleşen değerler
+    day_gb = rng.lognormal(mean=np.log(np.clip(mean_gb_day, 1e-3, None)), sigma=0.35)
+    day_min = rng.gamma(shape=3.0, scale=np.clip(mean_min_day/3.0, 1e-3, None))
+
+    # Zero-inflated Poisson (çoğu gün 0 SMS)
+    p_zero = 0.4
+    sms_draw = rng.poisson(lam=np.clip(mean_sms_day, 0.01, None))
+    sms_draw[rng.random((n_users, n)) < p_zero] = 0
+
+    # Roaming: %18 ayda bir seyahat; geometrik uzunlukta burst (3–7 gün), günlük MB log-normal (~180MB)
+    roaming_mb = np.zeros((n_users, n))
+    travel = np.flatnonzero(rng.random(n_users) < 0.18)
+    if travel.size:
+        burst_len = np.clip(rng.geometric(p=0.35, size=travel.size), 3, ROAM_MAX_DAYS)
+        start_idx = rng.integers(0, np.maximum(1, n - burst_len))
+        roam = rng.lognormal(mean=np.log(180.0), sigma=0.7, size=(travel.size, ROAM_MAX_DAYS))
+        offsets = np.arange(ROAM_MAX_DAYS)
+        in_burst = offsets[None, :] < burst_len[:, None]
+        rows = np.broadcast_to(travel[:, None], in_burst.shape)[in_burst]
+        cols = (start_idx[:, None] + offsets[None, :])[in_burst]
+        roaming_mb[rows, cols] = roam[in_burst]
+
+    return {
+        "user_id": np.repeat(user_ids, n),
+        "date": np.tile(days.to_numpy(), n_users),
+        "mb_used": (day_gb*1024.0).ravel(),
+        "minutes_used": day_min.ravel(),
+        "sms_used": sms_draw.ravel(),
+        "roaming_mb": roaming_mb.ravel(),
+        "_pos": np.repeat(np.arange(n_users), n),
+    }
+
+
+def iter_usage(users: pd.DataFrame, months: List[pd.Timestamp], rng: Optional[np.random.Generator] = None,
+               chunk_users: int = CHUNK_USERS) -> Iterator[pd.DataFrame]:
+    """Kullanım simülasyonunu kullanıcı blokları halinde üret (her blok: kullanıcı → tarih sıralı).
+
+    Aynı (tohum, chunk_users) için çıktı deterministiktir.
+    """
+    rng = _rng_or_default(rng)
+    user_ids = users["user_id"].to_numpy()
+    for lo in range(0, len(user_ids), chunk_users):
+        ids = user_ids[lo:lo + chunk_users]
+        # Kişiye özgü tabanlar
+        base_gb = rng.lognormal(mean=2.4, sigma=0.5, size=len(ids))     # median ~11 GB civarı
+        base_min = rng.gamma(shape=3.0, scale=200.0, size=len(ids))     # mean ~600 dk
+        base_sms_m = np.maximum(10.0, rng.lognormal(mean=2.2, sigma=0.7, size=len(ids)))  # aylık SMS ortalaması
+
+        blocks = [_usage_month(ids, base_gb, base_min, base_sms_m, m, rng) for m in months]
+        cols = {c: np.concatenate([b[c] for b in blocks]) for c in blocks[0]}
+        order = np.argsort(cols.pop("_pos"), kind="stable")          # ay blokları → kullanıcı sırası
+        yield pd.DataFrame({c: cols[c][order] for c in USAGE_COLUMNS})
+
+
+def simulate_usage(users: pd.DataFrame, months: List[pd.Timestamp], rng: Optional[np.random.Generator] = None,
+                   chunk_users: int = CHUNK_USERS) -> pd.DataFrame:
+    """Gerçekçiliği artırılmış kullanım simülasyonu (vektörel; kullanıcı x gün matrisleri).
     - Data: log-normal (GB), hafta sonu hafif artış, ay içi sezonluk dalgalanma
     - Dakika: gamma (pozitif skew), hafta içi daha yüksek
     - SMS: sıfır-şişkin Poisson (çoğu gün 0 SMS)
     - Roaming: nadir seyahatler → geometrik uzunlukta kümeler + log-normal günlük MB
     """
-    rows = []
-    for _, u in users.iterrows():
-        # Kişiye özgü tabanlar
-        base_gb = rng.lognormal(mean=2.4, sigma=0.5)   # median ~11 GB civarı
-        base_min = rng.gamma(shape=3.0, scale=200.0)   # mean ~600 dk
-        base_sms_m = max(10.0, rng.lognormal(mean=2.2, sigma=0.7))  # aylık SMS ortalaması
-
-        for m in months:
-            days = pd.period_range(m, m + pd.offsets.MonthEnd(0), freq="D").to_timestamp()
-            n = len(days)
-
-            # Ay içi yumuşak sezonluk dalga (sinüs) [0.85, 1.15]
-            phase = rng.uniform(0, 2*np.pi)
-            seasonal = 1.0 + 0.15*np.sin(np.linspace(0, 2*np.pi, n, endpoint=False) + phase)
-
-            # Hafta içi/sonu çarpanları
-            weekday_mult = np.array([1.10 if d.weekday() < 5 else 0.95 for d in days])  # dk için
-            weekend_data_boost = np.array([1.05 if d.weekday() >= 5 else 0.98 for d in days])
-
-            # Günlük ortalamalar
-            mean_gb_day = (base_gb / n) * seasonal * weekend_data_boost
-            mean_min_day = (base_min / n) * seasonal * weekday_mult
-            mean_sms_day = (base_sms_m / n) * seasonal
-
-            # Gerçekleşen değerler
-            day_gb = rng.lognormal(mean=np.log(np.clip(mean_gb_day, 1e-3, None)), sigma=0.35)
-            day_min = rng.gamma(shape=3.0, scale=np.clip(mean_min_day/3.0, 1e-3, None))
-
-            # Zero-inflated Poisson (çoğu gün 0 SMS)
-            p_zero = 0.4
-            lam_sms = np.clip(mean_sms_day, 0.01, None)
-            sms_draw = rng.poisson(lam=lam_sms)
-            zeros = rng.random(n) < p_zero
-            sms_draw[zeros] = 0
-
-            # Roaming: bu ay seyahat var mı? küçük olasılık
-            roaming_mb = np.zeros(n)
-            if rng.random() < 0.18:  # %18 ayda bir seyahat
-                # Geometrik uzunlukta burst (3–7 gün)
-                burst_len = int(np.clip(rng.geometric(p=0.35), 3, 7))
-                start_idx = int(rng.integers(0, max(1, n - burst_len)))
-                # Günlük roaming MB log-normal (ortalama ~180MB)
-                roam_slice = rng.lognormal(mean=np.log(180.0), sigma=0.7, size=burst_len)
-                roaming_mb[start_idx:start_idx+burst_len] = roam_slice
-
-            for i, d in enumerate(days):
-                rows.append([
-                    u.user_id,
-                    d,
-                    float(day_gb[i]*1024.0),
-                    float(day_min[i]),
-                    int(sms_draw[i]),
-                    float(roaming_mb[i]),
-                ])
-    return pd.DataFrame(rows, columns=["user_id","date","mb_used","minutes_used","sms_used","roaming_mb"])
+    chunks = list(iter_usage(users, months, rng, chunk_users))
+    if not chunks:
+        return pd.DataFrame(columns=USAGE_COLUMNS)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def monthly_usage(usage: pd.DataFrame) -> pd.DataFrame:
+    """Kullanıcı-ay toplamları (date = ay başı); build_billing yalnızca ay toplamlarını kullanır."""
+    month = usage["date"].to_numpy().astype("datetime64[M]").astype("datetime64[ns]")
+    cols = ["mb_used", "minutes_used", "sms_used", "roaming_mb"]
+    return (usage[cols].groupby([usage["user_id"].to_numpy(), month]).sum()
+            .rename_axis(["user_id", "date"]).reset_index())
+
+
+def write_usage_csv(chunks: Iterable[pd.DataFrame], path: Path) -> pd.DataFrame:
+    """Kullanım bloklarını CSV'ye parça parça yaz; bellekte yalnızca ay toplamları kalır."""
+    monthly = []
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, index=False, header=(i == 0))
+            monthly.append(monthly_usage(chunk))
+    if not monthly:
+        pd.DataFrame(columns=USAGE_COLUMNS).to_csv(path, index=False)
+        return monthly_usage(pd.DataFrame(columns=USAGE_COLUMNS))
+    return pd.concat(monthly, ignore_index=True)
+
+
+def pick_anomaly_users(users: pd.DataFrame, anom_rate: float = 0.25,
+                       rng: Optional[np.random.Generator] = None) -> Set[int]:
+    """Son ayda premium SMS patlaması enjekte edilecek kullanıcılar (benchmark etiketi)."""
+    rng = _rng_or_default(rng)
+    return set(int(u) for u in rng.choice(users.user_id.values, size=max(1, int(len(users)*anom_rate)), replace=False))
+
+
+ITEM_COLUMNS = ["bill_id","item_id","category","subtype","description","amount","unit_price","quantity","tax_rate","created_at"]
+HEADER_COLUMNS = ["bill_id","user_id","period_start","period_end","issue_date","total_amount","currency"]
+BILL_ID_START = 700001
+TAX_RATE = 0.18
+ROAMING_TL_PER_MB = 0.05   # 0.05 TL/MB ~ 50 TL/GB (basit katsayı)
+
+
+def _items(mask: np.ndarray, bill_id: np.ndarray, item_id: int, category: str, subtype: str,
+           description, amount: np.ndarray, unit_price, quantity, tax_rate: float, created_at: np.ndarray) -> dict:
+    """Maskelenen satırlar için kalem kolonları (dizi); description bir dizi ya da f(idx) olabilir."""
+    idx = np.flatnonzero(mask)
+    pick = lambda v: v[idx] if isinstance(v, np.ndarray) else np.full(len(idx), v)
+    return {
+        "bill_id": bill_id[idx],
+        "item_id": np.full(len(idx), item_id),
+        "category": np.full(len(idx), category, dtype=object),
+        "subtype": np.full(len(idx), subtype, dtype=object),
+        "description": np.asarray(description(idx) if callable(description) else pick(description), dtype=object),
+        "amount": pick(amount).astype(float),
+        "unit_price": pick(unit_price).astype(float),
+        "quantity": pick(quantity).astype(float),
+        "tax_rate": np.full(len(idx), tax_rate),
+        "created_at": created_at[idx],
+    }
 
 
 def build_billing(
@@ -185,111 +306,203 @@ def build_billing(
     vas_catalog: pd.DataFrame,
     premium_sms_catalog: pd.DataFrame,
     anom_rate: float = 0.25,
+    anom_users: Optional[Set[int]] = None,
+    rng: Optional[np.random.Generator] = None,
+    bill_id_start: int = BILL_ID_START,
 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
-    """Gerçekçi faturalandırma:
+    """Gerçekçi faturalandırma (vektörel; kullanıcı x ay ızgarası):
     - VAS aboneliği kullanıcı-bazında kalıcı; her ay %5 churn/iptal olasılığı
     - Premium SMS: sıfır-şişkin Poisson; anomali aylarında λ yükseltilir
     - Roaming kalemi: usage_daily'den alınır
+    usage_daily günlük ya da ay toplamı (monthly_usage) olabilir; yalnızca kullanıcı-ay toplamları kullanılır.
+    anom_users verilmezse anom_rate oranında rastgele seçilir (pick_anomaly_users).
+    bill_id'ler kullanıcı → ay sırasıyla bill_id_start'tan başlar.
     """
-    bill_headers = []
-    bill_items = []
-
-    bill_id_seq = 700000
-    plan_map = plans.set_index("plan_id").to_dict(orient="index")
-
-    last_month = months[-1]
-    anom_users = set(rng.choice(users.user_id.values, size=max(1, int(len(users)*anom_rate)), replace=False))
-
-    # VAS abonelik durumu (kullanıcı -> vas_id or None)
-    vas_state: dict[int, Optional[int]] = {}
-    for _, u in users.iterrows():
-        # Başlangıçta %35 ihtimalle bir VAS
-        if rng.random() < 0.35:
-            vas_state[int(u.user_id)] = int(vas_catalog.sample(1).iloc[0].vas_id)
-        else:
-            vas_state[int(u.user_id)] = None
-
-    for _, u in users.iterrows():
-        for m in months:
-            bill_id_seq += 1
-            period_start = pd.Timestamp(m).normalize()
-            period_end = (period_start + pd.offsets.MonthEnd(0))
-            issue_date = period_end + pd.Timedelta(days=3)
-
-            plan = plan_map[int(u.current_plan_id)]
-
-            # Kullanım agregasyonu
-            ud = usage_daily[(usage_daily.user_id == u.user_id) & (usage_daily.date >= period_start) & (usage_daily.date <= period_end)]
-            used_gb = ud.mb_used.sum()/1024.0
-            used_min = ud.minutes_used.sum()
-            used_sms = ud.sms_used.sum()
-            roam_mb = ud.roaming_mb.sum()
-
-            over_gb = max(0.0, used_gb - float(plan.get("quota_gb", 0.0)))
-            over_min = max(0.0, used_min - float(plan.get("quota_min", 0.0)))
-            over_sms = max(0, int(used_sms - int(plan.get("quota_sms", 0))))
-
-            data_over_cost = over_gb * float(plan.get("overage_gb", 0.0))
-            voice_over_cost = over_min * float(plan.get("overage_min", 0.0))
-            sms_over_cost = over_sms * float(plan.get("overage_sms", 0.0))
-
-            items = []
-            # Sabit ücret
-            items.append([bill_id_seq, 1, "one_off", "base_fee", f"Aylık sabit ücret ({plan['plan_name']})", float(plan["monthly_price"]), float(plan["monthly_price"]), 1, 0.18, period_start])
-
-            # Aşımlar
-            if data_over_cost > 0:
-                items.append([bill_id_seq, 2, "data", "data_overage", f"Data aşımı {over_gb:.2f}GB", float(data_over_cost), float(plan["overage_gb"]), round(over_gb,2), 0.18, period_end])
-            if voice_over_cost > 0:
-                items.append([bill_id_seq, 3, "voice", "voice_overage", f"Konuşma aşımı {over_min:.0f} dk", float(voice_over_cost), float(plan["overage_min"]), round(over_min,0), 0.18, period_end])
-            if sms_over_cost > 0:
-                items.append([bill_id_seq, 4, "sms", "sms_overage", f"SMS aşımı {over_sms} adet", float(sms_over_cost), float(plan["overage_sms"]), int(over_sms), 0.18, period_end])
-
-            # VAS aboneliği (persist + churn %5)
-            cur_vas = vas_state[int(u.user_id)]
-            if cur_vas is not None:
-                vas = vas_catalog[vas_catalog.vas_id == cur_vas].iloc[0]
-                items.append([bill_id_seq, 5, "vas", "vas_monthly", f"{vas['name']} aylık ücret", float(vas['monthly_fee']), float(vas['monthly_fee']), 1, 0.18, period_end])
-                # churn
-                if rng.random() < 0.05:
-                    vas_state[int(u.user_id)] = None
-            else:
-                # nadiren kullanıcı yeni VAS açar
-                if rng.random() < 0.05:
-                    new_vas = vas_catalog.sample(1).iloc[0]
-                    vas_state[int(u.user_id)] = int(new_vas.vas_id)
-                    items.append([bill_id_seq, 5, "vas", "vas_monthly", f"{new_vas['name']} aylık ücret (yeni)", float(new_vas['monthly_fee']), float(new_vas['monthly_fee']), 1, 0.18, period_end])
-
-            # Premium SMS: ZIP (zero-inflated Poisson)
-            lam = 0.9
-            if (m == last_month) and (u.user_id in anom_users):
-                lam = 8.0  # anomali patlaması
-            # Zero-inflation
-            if rng.random() > 0.75:  # %25 olasılıkla premium davranışı
-                prem_n = int(rng.poisson(lam))
-                if prem_n > 0:
-                    prem = premium_sms_catalog.sample(1).iloc[0]
-                    amount = float(prem_n * prem['unit_price'])
-                    items.append([bill_id_seq, 6, "premium_sms", "premium_3rdparty", f"{prem['shortcode']} numarasına {prem_n} SMS", amount, float(prem['unit_price']), int(prem_n), 0.18, period_end])
-
-            # Roaming kalemi (kullanıma bağlı)
-            if roam_mb > 0:
-                roam_amount = 0.05 * float(roam_mb)  # 0.05 TL/MB ~ 50 TL/GB (basit katsayı)
-                items.append([bill_id_seq, 7, "roaming", "roaming_data", f"Roaming data {float(roam_mb)/1024.0:.2f}GB", float(roam_amount), 0.05, int(roam_mb), 0.18, period_end])
-
-            # Vergi
-            subtotal = float(sum(x[5] for x in items))
-            tax = subtotal * 0.18
-            items.append([bill_id_seq, 99, "tax", "vat", "KDV", float(tax), float(tax), 1, 0.0, period_end])
-
-            total_amount = subtotal + tax
-            bill_headers.append([bill_id_seq, int(u.user_id), period_start, period_end, issue_date, round(total_amount,2), "TRY"])
-            bill_items.extend(items)
-
-    bill_headers_df = pd.DataFrame(bill_headers, columns=["bill_id","user_id","period_start","period_end","issue_date","total_amount","currency"])
-    bill_items_df = pd.DataFrame(bill_items, columns=["bill_id","item_id","category","subtype","description","amount","unit_price","quantity","tax_rate","created_at"])
+    rng = _rng_or_default(rng)
+    if anom_users is None:
+        anom_users = pick_anomaly_users(users, anom_rate, rng=rng)
+
+    user_ids = users["user_id"].to_numpy().astype(np.int64)
+    n_users, n_months = len(user_ids), len(months)
+
+    # Izgara: satır = (kullanıcı, ay), kullanıcı-major
+    starts = np.array([pd.Timestamp(m).normalize() for m in months], dtype="datetime64[ns]")
+    ends = np.array([pd.Timestamp(m).normalize() + pd.offsets.MonthEnd(0) for m in months], dtype="datetime64[ns]")
+    g_user = np.repeat(user_ids, n_months)
+    g_month = np.tile(np.arange(n_months), n_users)
+    g_start, g_end = starts[g_month], ends[g_month]
+    bill_id = bill_id_start + np.arange(n_users * n_months, dtype=np.int64)
+
+    # Kullanım agregasyonu (tek groupby; kullanıcı-ay başına filtre yok)
+    mu = monthly_usage(usage_daily)
+    grid = pd.DataFrame({"user_id": g_user, "date": g_start})
+    agg = grid.merge(mu, on=["user_id", "date"], how="left").fillna(0.0)
+    used_gb = agg["mb_used"].to_numpy() / 1024.0
+    used_min = agg["minutes_used"].to_numpy()
+    used_sms = agg["sms_used"].to_numpy()
+    roam_mb = agg["roaming_mb"].to_numpy()
+
+    # Plan parametreleri (kullanıcı başına bir kez eşlenir)
+    plan = plans.set_index("plan_id").reindex(users["current_plan_id"].to_numpy())
+    per_bill = lambda col, default=0.0: np.repeat(plan[col].fillna(default).to_numpy(), n_months)
+    plan_name = np.repeat(plan["plan_name"].to_numpy(dtype=object), n_months)
+    price = per_bill("monthly_price").astype(float)
+    ov_gb_price, ov_min_price, ov_sms_price = per_bill("overage_gb"), per_bill("overage_min"), per_bill("overage_sms")
+
+    over_gb = np.maximum(0.0, used_gb - per_bill("quota_gb"))
+    over_min = np.maximum(0.0, used_min - per_bill("quota_min"))
+    over_sms = np.maximum(0, np.trunc(used_sms - per_bill("quota_sms").astype(int)).astype(np.int64))
+    data_cost, voice_cost, sms_cost = over_gb * ov_gb_price, over_min * ov_min_price, over_sms * ov_sms_price
+
+    parts = [
+        # Sabit ücret
+        _items(np.ones(len(bill_id), bool), bill_id, 1, "one_off", "base_fee",
+               lambda i: [f"Aylık sabit ücret ({n})" for n in plan_name[i]], price, price, 1, TAX_RATE, g_start),
+        # Aşımlar
+        _items(data_cost > 0, bill_id, 2, "data", "data_overage",
+               lambda i: [f"Data aşımı {x:.2f}GB" for x in over_gb[i]], data_cost, ov_gb_price,
+               np.round(over_gb, 2), TAX_RATE, g_end),
+        _items(voice_cost > 0, bill_id, 3, "voice", "voice_overage",
+               lambda i: [f"Konuşma aşımı {x:.0f} dk" for x in over_min[i]], voice_cost, ov_min_price,
+               np.round(over_min, 0), TAX_RATE, g_end),
+        _items(sms_cost > 0, bill_id, 4, "sms", "sms_overage",
+               lambda i: [f"SMS aşımı {x} adet" for x in over_sms[i]], sms_cost, ov_sms_price,
+               over_sms, TAX_RATE, g_end),
+    ]
+
+    # VAS aboneliği (persist + churn %5): ay ay ilerleyen kullanıcı durumu vektörü
+    vas_names = vas_catalog["name"].to_numpy(dtype=object)
+    vas_fees = vas_catalog["monthly_fee"].to_numpy(dtype=float)
+    # Başlangıçta %35 ihtimalle bir VAS (-1 = yok)
+    vas_state = np.where(rng.random(n_users) < 0.35, rng.integers(0, len(vas_catalog), n_users), -1)
+    for mi in range(n_months):
+        rows = np.arange(n_users) * n_months + mi
+        active = vas_state >= 0
+        draw = rng.random(n_users)
+        opened = ~active & (draw < 0.05)          # nadiren kullanıcı yeni VAS açar
+        new_vas = rng.integers(0, len(vas_catalog), n_users)
+        cur = np.where(opened, new_vas, vas_state)
+        fee = np.where(cur >= 0, vas_fees[np.maximum(cur, 0)], 0.0)
+        suffix = np.where(opened, " (yeni)", "")
+        names = vas_names[np.maximum(cur, 0)]
+        mask = np.zeros(len(bill_id), bool)
+        mask[rows] = active | opened
+        fee_g = np.zeros(len(bill_id)); fee_g[rows] = fee
+        desc_g = np.empty(len(bill_id), dtype=object); desc_g[rows] = [f"{n} aylık ücret{s}" for n, s in zip(names, suffix)]
+        parts.append(_items(mask, bill_id, 5, "vas", "vas_monthly", desc_g, fee_g, fee_g, 1, TAX_RATE, g_end))
+        # churn yalnızca önceden aktif olanlar için; yeni açanlar sonraki aya taşınır
+        vas_state = np.where(active & (draw < 0.05), -1, cur)
+
+    # Premium SMS: ZIP (zero-inflated Poisson); %25 olasılıkla premium davranışı
+    is_anom = np.isin(g_user, np.fromiter(anom_users, dtype=np.int64, count=len(anom_users)))
+    lam = np.where((g_month == n_months - 1) & is_anom, 8.0, 0.9)   # son ayda anomali patlaması
+    prem_on = rng.random(len(bill_id)) > 0.75
+    prem_n = np.where(prem_on, rng.poisson(lam), 0)
+    prem_idx = rng.integers(0, len(premium_sms_catalog), len(bill_id))
+    prem_price = premium_sms_catalog["unit_price"].to_numpy(dtype=float)[prem_idx]
+    prem_code = premium_sms_catalog["shortcode"].astype(str).to_numpy(dtype=object)[prem_idx]
+    parts.append(_items(prem_n > 0, bill_id, 6, "premium_sms", "premium_3rdparty",
+                        lambda i: [f"{c} numarasına {n} SMS" for c, n in zip(prem_code[i], prem_n[i])],
+                        prem_n * prem_price, prem_price, prem_n, TAX_RATE, g_end))
+
+    # Roaming kalemi (kullanıma bağlı)
+    parts.append(_items(roam_mb > 0, bill_id, 7, "roaming", "roaming_data",
+                        lambda i: [f"Roaming data {x/1024.0:.2f}GB" for x in roam_mb[i]],
+                        ROAMING_TL_PER_MB * roam_mb, ROAMING_TL_PER_MB, np.trunc(roam_mb), TAX_RATE, g_end))
+
+    # Vergi: fatura başına kalem toplamı üzerinden
+    pos = lambda p: p["bill_id"] - bill_id_start
+    subtotal = np.zeros(len(bill_id))
+    for p in parts:
+        np.add.at(subtotal, pos(p), p["amount"])
+    tax = subtotal * TAX_RATE
+    parts.append(_items(np.ones(len(bill_id), bool), bill_id, 99, "tax", "vat", "KDV", tax, tax, 1, 0.0, g_end))
+
+    items = {c: np.concatenate([p[c] for p in parts]) for c in ITEM_COLUMNS}
+    order = np.lexsort((items["item_id"], items["bill_id"]))
+    bill_items_df = pd.DataFrame({c: items[c][order] for c in ITEM_COLUMNS})
+
+    bill_headers_df = pd.DataFrame({
+        "bill_id": bill_id,
+        "user_id": g_user,
+        "period_start": g_start,
+        "period_end": g_end,
+        "issue_date": g_end + np.timedelta64(3, "D"),
+        "total_amount": np.round(subtotal + tax, 2),
+        "currency": "TRY",
+    }, columns=HEADER_COLUMNS)
     return bill_headers_df, bill_items_df
 
+# ============================
+# Shard'lı üretim
+# ============================
+
+SHARD_TABLES = ["users", "bill_headers", "bill_items", "usage_daily"]
+
+
+def shard_path(out: Path, table: str, shard: int) -> Path:
+    return Path(out) / table / f"part-{shard:05d}.csv"
+
+
+def shard_bounds(n_users: int, n_shards: int, shard: int) -> Tuple[int, int]:
+    """Shard'ın kullanıcı aralığı [lo, hi) — sıra no'su olarak."""
+    return shard * n_users // n_shards, (shard + 1) * n_users // n_shards
+
+
+def generate_shard(out: Path, shard: int, n_shards: int, seed: int, n_users: int,
+                   months: List[pd.Timestamp], anom_rate: float = 0.25,
+                   chunk_users: int = CHUNK_USERS) -> dict:
+    """Tek shard'ı üretip part dosyalarına yazar (ayrı süreçte çalışır).
+
+    Tohum SeedSequence(seed, spawn_key=(shard,)) ile türetilir; user_id ve bill_id
+    aralıkları shard no'sundan hesaplanır. Böylece çıktı worker sayısından bağımsızdır.
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(shard,)))
+    plans, _, vas_catalog, premium_sms_catalog = build_catalogs(seed)
+    lo, hi = shard_bounds(n_users, n_shards, shard)
+    users = build_users(hi - lo, plans, rng=rng, start=lo)
+
+    paths = {t: shard_path(out, t, shard) for t in SHARD_TABLES}
+    usage_monthly = write_usage_csv(iter_usage(users, months, rng, chunk_users), paths["usage_daily"])
+    bill_headers, bill_items = build_billing(
+        users, plans, usage_monthly, months, vas_catalog, premium_sms_catalog,
+        anom_rate=anom_rate, rng=rng, bill_id_start=BILL_ID_START + lo * len(months),
+    )
+    users.to_csv(paths["users"], index=False)
+    bill_headers.to_csv(paths["bill_headers"], index=False)
+    bill_items.to_csv(paths["bill_items"], index=False)
+    return {"shard": shard, "users": int(len(users)), "bills": int(len(bill_headers)), "items": int(len(bill_items))}
+
+
+def generate_sharded(out: Path, n_shards: int, seed: int, n_users: int, n_months: int,
+                     anom_rate: float = 0.25, chunk_users: int = CHUNK_USERS,
+                     workers: Optional[int] = None) -> List[dict]:
+    """Shard'ları süreç havuzunda üretir; kataloglar ve _shards.json kök klasöre yazılır."""
+    out = Path(out)
+    for t in SHARD_TABLES:
+        (out / t).mkdir(parents=True, exist_ok=True)
+        for stale in (out / t).glob("part-*.csv"):   # önceki (farklı shard sayılı) koşudan kalanlar
+            stale.unlink()
+    plans, add_on_packs, vas_catalog, premium_sms_catalog = build_catalogs(seed)
+    plans.to_csv(out/"plans.csv", index=False)
+    vas_catalog.to_csv(out/"vas_catalog.csv", index=False)
+    premium_sms_catalog.to_csv(out/"premium_sms_catalog.csv", index=False)
+    add_on_packs.to_csv(out/"add_on_packs.csv", index=False)
+
+    months = month_range(n_months)   # tüm shard'lar aynı ayları kullanır
+    workers = max(1, min(workers or os.cpu_count() or 1, n_shards))
+    jobs = [(out, k, n_shards, seed, n_users, months, anom_rate, chunk_users) for k in range(n_shards)]
+    if workers == 1:
+        stats = [generate_shard(*j) for j in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            stats = list(ex.map(generate_shard, *zip(*jobs)))
+
+    manifest = {"seed": seed, "n_shards": n_shards, "n_users": n_users, "n_months": n_months,
+                "anom_rate": anom_rate, "chunk_users": chunk_users, "shards": stats}
+    (out/"_shards.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return stats
+
 # ============================
 # Main
 # ============================
@@ -299,14 +512,24 @@ def main():
     out = Path(args.out)
     out.mkdir(parents=True, exist_ok=True)
 
+    if args.shards > 0:
+        stats = generate_sharded(out, args.shards, args.seed, args.n_users, args.n_months,
+                                 anom_rate=args.anom_rate, chunk_users=args.chunk_users, workers=args.workers)
+        print(f"✓ {len(stats)} shard üretildi → {out.resolve()}")
+        print(f"  kullanıcı={sum(s['users'] for s in stats)} fatura={sum(s['bills'] for s in stats)} "
+              f"kalem={sum(s['items'] for s in stats)}")
+        print("Tablolar: " + ", ".join(f"{t}/part-*.csv" for t in SHARD_TABLES))
+        return
+
     plans, add_on_packs, vas_catalog, premium_sms_catalog = build_catalogs(args.seed)
     users = build_users(args.n_users, plans)
 
     months = month_range(args.n_months)
-    usage_daily = simulate_usage(users, months)
+    # Günlük kullanım doğrudan diske parça parça yazılır; faturalama için ay toplamları yeterli
+    usage_monthly = write_usage_csv(iter_usage(users, months, chunk_users=args.chunk_users), out/"usage_daily.csv")
 
     bill_headers, bill_items = build_billing(
-        users, plans, usage_daily, months, vas_catalog, premium_sms_catalog, anom_rate=args.anom_rate
+        users, plans, usage_monthly, months, vas_catalog, premium_sms_catalog, anom_rate=args.anom_rate
     )
 
     # Kaydet
@@ -314,7 +537,6 @@ def main():
     plans.to_csv(out/"plans.csv", index=False)
     bill_headers.to_csv(out/"bill_headers.csv", index=False)
     bill_items.to_csv(out/"bill_items.csv", index=False)
-    usage_daily.to_csv(out/"usage_daily.csv", index=False)
     vas_catalog.to_csv(out/"vas_catalog.csv", index=False)
     premium_sms_catalog.to_csv(out/"premium_sms_catalog.csv", index=False)
     add_on_packs.to_csv(out/"add_on_packs.csv", index=False)
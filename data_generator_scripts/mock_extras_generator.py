@@ -13,9 +13,14 @@ Kullanım:
       --tourist_rate 0.05
 
 Çıktı: Aynı klasördeki CSV'ler güncellenir (overwrite). İsterseniz --out ile farklı klasöre yazabilirsiniz.
+
+Büyük usage_daily.csv için --stream [--chunk_rows 1000000]: dosya parça parça okunup
+yazılır, bellekte yalnızca bir parça tutulur.
 """
 from __future__ import annotations
 import argparse
+import os
+import shutil
 from pathlib import Path
 from typing import List, Optional
 
@@ -40,6 +45,10 @@ def parse_args():
     ap.add_argument("--youth_rate", type=float, default=0.30)
     ap.add_argument("--corporate_rate", type=float, default=0.20)
     ap.add_argument("--tourist_rate", type=float, default=0.05)
+    # Büyük veri
+    ap.add_argument("--stream", action="store_true",
+                    help="usage_daily.csv'yi belleğe almadan parça parça işle")
+    ap.add_argument("--chunk_rows", type=int, default=CHUNK_ROWS, help="--stream parça boyutu (satır)")
     return ap.parse_args()
 
 
@@ -72,35 +81,46 @@ def assign_segments(users: pd.DataFrame, youth_rate: float, corporate_rate: floa
     return users
 
 
+def _last_period_bills(bill_headers: pd.DataFrame) -> pd.DataFrame:
+    """Son dönemin (global en son period_start) faturaları."""
+    period_start = pd.to_datetime(bill_headers["period_start"])
+    return bill_headers[period_start == period_start.max()]
+
+
+def _append_items(bill_items: pd.DataFrame, chosen: pd.DataFrame, item_id: int, category: str, subtype: str,
+                  description, amount: np.ndarray, tax_rate: float) -> pd.DataFrame:
+    """Seçili faturalara toplu kalem ekle (fatura başına bir satır)."""
+    n = len(chosen)
+    add_df = pd.DataFrame({
+        "bill_id": chosen["bill_id"].to_numpy().astype(int),
+        "item_id": np.full(n, item_id),
+        "category": category,
+        "subtype": subtype,
+        "description": description,
+        "amount": amount,
+        "unit_price": amount,
+        "quantity": np.ones(n, dtype=int),
+        "tax_rate": np.full(n, tax_rate),
+        "created_at": chosen["period_end"].to_numpy(),
+    }, columns=bill_items.columns)
+    return pd.concat([bill_items, add_df], ignore_index=True)
+
+
 def add_discounts(bill_headers: pd.DataFrame, bill_items: pd.DataFrame, users: pd.DataFrame, rate: float, pmin: float, pmax: float, seed: int) -> pd.DataFrame:
     """Her kullanıcı için SON AY faturasında belirli oranda indirim (negatif kalem) ekle.
     İndirim oranı: uniform[pmin, pmax]%
     """
     rng = np.random.default_rng(seed + 10)
-    # Son ayı bul (global)
-    last_period = pd.to_datetime(bill_headers["period_start"]).max()
-    # Bu dönemin faturaları
-    bh_last = bill_headers[pd.to_datetime(bill_headers["period_start"]) == last_period]
-    chosen = bh_last.sample(frac=rate, random_state=seed).copy()
+    chosen = _last_period_bills(bill_headers).sample(frac=rate, random_state=seed)
     if chosen.empty:
         return bill_items
 
-    # Her seçili fatura için indirim kalemi ekle
-    extra_rows = []
-    for _, h in chosen.iterrows():
-        bill_id = int(h["bill_id"])
-        # O faturanın ara toplamını tahmin etmek için mevcut kalemleri topla (vergiler dahil)
-        cur_items = bill_items[bill_items["bill_id"] == bill_id]
-        gross = float(cur_items["amount"].sum())
-        disc_pct = rng.uniform(pmin, pmax) / 100.0
-        disc_amt = round(gross * disc_pct * -1.0, 2)
-        extra_rows.append([
-            bill_id, 90, "discount", "loyalty", f"Sadakat indirimi (-{disc_pct*100:.1f}%)", disc_amt, disc_amt, 1, 0.0, h["period_end"],
-        ])
-    if extra_rows:
-        add_df = pd.DataFrame(extra_rows, columns=bill_items.columns)
-        bill_items = pd.concat([bill_items, add_df], ignore_index=True)
-    return bill_items
+    # Faturanın ara toplamı: mevcut kalemlerin toplamı (vergiler dahil), tek groupby ile
+    gross = bill_items.groupby("bill_id")["amount"].sum().reindex(chosen["bill_id"].to_numpy()).fillna(0.0).to_numpy()
+    disc_pct = rng.uniform(pmin, pmax, size=len(chosen)) / 100.0
+    disc_amt = np.round(gross * disc_pct * -1.0, 2)
+    desc = [f"Sadakat indirimi (-{p*100:.1f}%)" for p in disc_pct]
+    return _append_items(bill_items, chosen, 90, "discount", "loyalty", desc, disc_amt, 0.0)
 
 
 def add_oneoffs(bill_headers: pd.DataFrame, bill_items: pd.DataFrame, users: pd.DataFrame, rate: float, med: float, sigma: float, seed: int) -> pd.DataFrame:
@@ -108,61 +128,73 @@ def add_oneoffs(bill_headers: pd.DataFrame, bill_items: pd.DataFrame, users: pd.
     Tutar: lognormal(median=med, sigma)
     """
     rng = np.random.default_rng(seed + 20)
-    last_period = pd.to_datetime(bill_headers["period_start"]).max()
-    bh_last = bill_headers[pd.to_datetime(bill_headers["period_start"]) == last_period]
-    chosen = bh_last.sample(frac=rate, random_state=seed+1).copy()
+    chosen = _last_period_bills(bill_headers).sample(frac=rate, random_state=seed+1)
     if chosen.empty:
         return bill_items
 
     mu = np.log(max(1e-6, med))  # yaklaşık median ≈ exp(mu)
-    extra_rows = []
-    for _, h in chosen.iterrows():
-        bill_id = int(h["bill_id"])
-        amt = float(np.random.lognormal(mean=mu, sigma=sigma))
-        amt = round(amt, 2)
-        extra_rows.append([
-            bill_id, 85, "one_off", "device_or_activation", "Tek seferlik ücret", amt, amt, 1, 0.18, h["period_end"],
-        ])
-    if extra_rows:
-        add_df = pd.DataFrame(extra_rows, columns=bill_items.columns)
-        bill_items = pd.concat([bill_items, add_df], ignore_index=True)
-    return bill_items
-
-
-def adjust_usage_for_segments(usage_daily: pd.DataFrame, users: pd.DataFrame) -> pd.DataFrame:
+    amt = np.round(rng.lognormal(mean=mu, sigma=sigma, size=len(chosen)), 2)
+    return _append_items(bill_items, chosen, 85, "one_off", "device_or_activation", "Tek seferlik ücret", amt, 0.18)
+
+
+# Segment çarpanları: (data, dakika, sms); tourist'te roaming olan günlerde data x1.5
+SEGMENT_CODES = ["retail", "youth", "corporate", "tourist"]      # 0 = retail (bilinmeyen segment de)
+SEGMENT_MULTS = np.array([
+    [1.0, 1.0, 1.0],
+    [1.25, 0.9, 0.9],
+    [0.9, 1.2, 1.1],
+    [1.3, 0.8, 0.8],
+])
+TOURIST_ROAMING_GB_MULT = 1.5
+CATALOG_TABLES = ["vas_catalog", "premium_sms_catalog", "add_on_packs"]   # --out ile aynen kopyalanır
+CHUNK_ROWS = 1_000_000   # --stream modunda bir seferde okunan usage_daily satırı
+
+
+def segment_codes(users: pd.DataFrame) -> pd.Series:
+    """user_id → segment kodu (SEGMENT_CODES indeksi)."""
+    codes = pd.Categorical(users["type"], categories=SEGMENT_CODES).codes
+    return pd.Series(np.where(codes < 0, 0, codes), index=users["user_id"].to_numpy())
+
+
+def adjust_usage_for_segments(usage_daily: pd.DataFrame, users: pd.DataFrame,
+                              codes: Optional[pd.Series] = None) -> pd.DataFrame:
     """Segment bazlı çarpanlar uygulayarak kullanım desenini hafifçe yeniden ölçeklendir.
     - youth: data x1.25, minutes x0.9, sms x0.9
     - corporate: data x0.9, minutes x1.2, sms x1.1
     - tourist: data x1.3 (roaming varsa x1.5), minutes x0.8, sms x0.8
     - retail: no-op
+    Çarpanlar satır satır değil, kullanıcının segment koduna göre tablodan toplu okunur.
+    codes: segment_codes(users) (parça parça işlemede bir kez hesaplanıp verilir).
     """
-    users_idx = users.set_index("user_id")["type"].to_dict()
+    if codes is None:
+        codes = segment_codes(users)
     ud = usage_daily.copy()
-
-    def mults(kind: str, roam_mb: float):
-        if kind == "youth":
-            return 1.25, 0.9, 0.9
-        if kind == "corporate":
-            return 0.9, 1.2, 1.1
-        if kind == "tourist":
-            return (1.5 if roam_mb > 0 else 1.3), 0.8, 0.8
-        return 1.0, 1.0, 1.0
-
-    # Uygula
-    data = []
-    for idx, row in ud.iterrows():
-        kind = users_idx.get(row.user_id, "retail")
-        m_gb, m_min, m_sms = mults(kind, row.roaming_mb)
-        data.append([
-            row.user_id,
-            row.date,
-            float(row.mb_used * m_gb),
-            float(row.minutes_used * m_min),
-            int(round(row.sms_used * m_sms)),
-            float(row.roaming_mb),
-        ])
-    new_ud = pd.DataFrame(data, columns=ud.columns)
-    return new_ud
+    code = codes.reindex(ud["user_id"].to_numpy()).fillna(0).to_numpy().astype(int)
+    m = SEGMENT_MULTS[code]
+    roaming = ud["roaming_mb"].to_numpy(dtype=float)
+    m_gb = np.where((code == SEGMENT_CODES.index("tourist")) & (roaming > 0), TOURIST_ROAMING_GB_MULT, m[:, 0])
+
+    ud["mb_used"] = ud["mb_used"].to_numpy(dtype=float) * m_gb
+    ud["minutes_used"] = ud["minutes_used"].to_numpy(dtype=float) * m[:, 1]
+    ud["sms_used"] = np.round(ud["sms_used"].to_numpy(dtype=float) * m[:, 2]).astype(int)
+    ud["roaming_mb"] = roaming
+    return ud
+
+
+def adjust_usage_csv(in_path: Path, out_path: Path, users: pd.DataFrame, chunk_rows: int = CHUNK_ROWS) -> int:
+    """usage_daily.csv'yi chunk_rows'luk parçalar halinde oku → çarpanları uygula → yaz.
+    Bellekte tek parça tutulur; girdi ve çıktı aynı dosya olabilir (geçici dosya + replace).
+    Dönen değer: işlenen satır sayısı.
+    """
+    codes = segment_codes(users)
+    tmp = Path(out_path).with_name(Path(out_path).name + ".tmp")
+    n = 0
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        for i, chunk in enumerate(pd.read_csv(in_path, chunksize=chunk_rows)):
+            adjust_usage_for_segments(chunk, users, codes).to_csv(f, index=False, header=(i == 0))
+            n += len(chunk)
+    os.replace(tmp, out_path)
+    return n
 
 
 def main():
@@ -177,13 +209,17 @@ def main():
     plans = _read_df(in_root, "plans")
     bill_headers = _read_df(in_root, "bill_headers")
     bill_items = _read_df(in_root, "bill_items")
-    usage_daily = _read_df(in_root, "usage_daily")
 
     # 1) Segment ataması
     users2 = assign_segments(users, args.youth_rate, args.corporate_rate, args.tourist_rate, args.seed)
 
     # 2) Segment etkilerini usage üzerine uygula
-    usage2 = adjust_usage_for_segments(usage_daily, users2)
+    if args.stream:
+        if not (in_root / "usage_daily.csv").exists():
+            raise FileNotFoundError(f"Bulunamadı: {in_root / 'usage_daily.csv'}")
+        adjust_usage_csv(in_root / "usage_daily.csv", out_root / "usage_daily.csv", users2, args.chunk_rows)
+    else:
+        usage2 = adjust_usage_for_segments(_read_df(in_root, "usage_daily"), users2)
 
     # 3) Discount ve One-off kalemleri ekle (son aya)
     bill_items2 = add_discounts(bill_headers, bill_items, users2, args.discount_rate, args.discount_min, args.discount_max, args.seed)
@@ -194,7 +230,13 @@ def main():
     _write_df(out_root, "plans", plans)
     _write_df(out_root, "bill_headers", bill_headers)
     _write_df(out_root, "bill_items", bill_items2)
-    _write_df(out_root, "usage_daily", usage2)
+    if not args.stream:
+        _write_df(out_root, "usage_daily", usage2)
+    # Farklı klasöre yazılıyorsa kataloglar da taşınır (çıktı klasörü tek başına eksiksiz olsun)
+    if out_root.resolve() != in_root.resolve():
+        for name in CATALOG_TABLES:
+            if (in_root / f"{name}.csv").exists():
+                shutil.copyfile(in_root / f"{name}.csv", out_root / f"{name}.csv")
 
     print("✓ Güncelleme tamamlandı →", out_root.resolve())
     print("Güncellenen dosyalar: users.csv, bill_items.csv, usage_daily.csv")
@@ -1,18 +1,50 @@
 # anomaly_engine.py
 import argparse
 import json
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
 import pandas as pd
 import numpy as np
 
+try:
+    from general_scripts.threshold_config import SegmentTuned, get_profile
+except ImportError:  # betik olarak general_scripts/ içinden çalıştırıldığında
+    from threshold_config import SegmentTuned, get_profile
+
 # ==============================
 # Config
 # ==============================
+# Varsayılanlar (salt okunur). İstek başına eşikler için AnomalyConfig kullanın;
+# bu sabitleri çalışma anında değiştirmeyin.
 Z_THRESH = 2.0          # z-score >= 2 -> anomali
 PCT_THRESH = 0.80       # % artış >= %80 -> anomali
 MIN_TL = 5.0            # gürültüyü azaltmak için min tutar eşiği
 BASELINE_MONTHS = 3     # geçmiş pencere
 EXCLUDE_CATEGORIES = {"tax"}  # genelde vergi değişimleri sinyal değil
+SENSITIVE_CATEGORIES = {"roaming", "premium_sms", "vas"}  # önceki aylarda yoksa tek başına işaretlenir
+
+
+@dataclass(frozen=True)
+class AnomalyConfig(SegmentTuned):
+    """Değişmez anomali eşikleri; segment/plan override'ları için bkz. threshold_config."""
+    z_thresh: float = Z_THRESH
+    pct_thresh: float = PCT_THRESH
+    min_tl: float = MIN_TL
+
+
+DEFAULT_CONFIG = AnomalyConfig()
+
+# Kanal/kullanım senaryosuna göre hazır profiller (API: "profile")
+PROFILES = {
+    "default": DEFAULT_CONFIG,
+    "sensitive": AnomalyConfig(z_thresh=1.5, pct_thresh=0.50),
+    "conservative": AnomalyConfig(z_thresh=3.0, pct_thresh=1.50, min_tl=10.0),
+}
+
+
+def get_config(profile: Optional[str] = None) -> AnomalyConfig:
+    return get_profile(PROFILES, profile)
 
 # Kategoriye göre aksiyon önerileri
 SUGGEST_ACTION = {
@@ -35,13 +67,27 @@ def _safe_div(a, b):
 # ==============================
 # Load artifacts (+ optional raw)
 # ==============================
-def load_artifacts(artifacts_dir: Path):
-    bill_summary = pd.read_csv(artifacts_dir / "bill_summary.csv")
-    cat_breakdown = pd.read_csv(artifacts_dir / "category_breakdown.csv")
+ARTIFACT_TABLES = ["bill_summary", "category_breakdown"]
+OPTIONAL_ARTIFACT_TABLES = ["anomalies"]   # gece işi: python -m general_scripts.anomaly_table
+
+def read_artifact(artifacts_dir: Path, name: str) -> pd.DataFrame:
+    return pd.read_csv(artifacts_dir / f"{name}.csv")
+
+def prepare_artifact(name: str, df: pd.DataFrame) -> pd.DataFrame:
     # types
-    for c in ["items_total", "total_amount"]:
-        if c in bill_summary.columns:
-            bill_summary[c] = bill_summary[c].astype(float)
+    if name == "bill_summary":
+        for c in ["items_total", "total_amount"]:
+            if c in df.columns:
+                df[c] = df[c].astype(float)
+    if name == "anomalies":
+        for c in ["period", "category", "segment", "severity"]:
+            if c in df.columns:
+                df[c] = df[c].astype(str)
+    return df
+
+def load_artifacts(artifacts_dir: Path):
+    bill_summary = prepare_artifact("bill_summary", read_artifact(artifacts_dir, "bill_summary"))
+    cat_breakdown = prepare_artifact("category_breakdown", read_artifact(artifacts_dir, "category_breakdown"))
     return bill_summary, cat_breakdown
 
 def load_raw_if_available(data_dir: Path):
@@ -60,11 +106,77 @@ def load_raw_if_available(data_dir: Path):
         bi = None
     return bi
 
+# ==============================
+# Category rule (batch + streaming)
+# ==============================
+def score_category(cat: str, cur_amt: float, mean: float, std: float, count: int, prev_sum: float,
+                   config: AnomalyConfig = DEFAULT_CONFIG):
+    """Tek kategori için anomali kuralları; anomali yoksa None.
+
+    mean/std/count: önceki BASELINE_MONTHS faturada kategorinin toplamları (std ddof=1),
+    prev_sum: aynı penceredeki toplam. stream_scorer de aynı kuralı kullanır.
+    config: segment/plan için çözülmüş (for_segment) eşikler.
+    """
+    min_tl, z_thresh, pct_thresh = config.min_tl, config.z_thresh, config.pct_thresh
+    # First-seen?
+    first_seen = (count == 0 and cur_amt >= min_tl)
+
+    # z-score ve %Δ
+    z = (cur_amt - mean) / std if std > 0 else None
+    pct_delta = _safe_div(cur_amt - mean, mean) if mean >= min_tl else (np.inf if (cur_amt >= min_tl and mean == 0) else 0.0)
+
+    is_spike = False
+    reasons = []
+
+    if first_seen:
+        is_spike = True
+        reasons.append("İlk kez görüldü")
+
+    if cur_amt >= min_tl and not first_seen:
+        if (z is not None and z >= z_thresh):
+            is_spike = True
+            reasons.append(f"z-skoru {z:.2f} (≥ {z_thresh})")
+        if pct_delta >= pct_thresh:
+            is_spike = True
+            reasons.append(f"% değişim {pct_delta*100:.0f}% (≥ {int(pct_thresh*100)}%)")
+
+    # Kategoriye özel heuristik (roaming/premium/vas hassas)
+    if cat in SENSITIVE_CATEGORIES and (cur_amt >= min_tl):
+        # önceki ay toplam 0 ve şimdi > 0 ise 'yeni artış'
+        if prev_sum < min_tl and cur_amt >= min_tl:
+            is_spike = True
+            reasons.append("Önceki aylarda yoktu/çok düşüktü, bu ay var")
+
+    if not is_spike:
+        return None
+    return {
+        "category": cat,
+        "amount": round(cur_amt, 2),
+        "baseline_mean": round(mean, 2),
+        "baseline_std": round(std, 2) if std else None,
+        "z": round(z, 2) if z is not None else None,
+        "pct_delta": round(pct_delta, 3) if np.isfinite(pct_delta) else None,
+        "reason": "; ".join(reasons),
+        "suggested_action": SUGGEST_ACTION.get(cat, "Gözden geçir"),
+    }
+
 # ==============================
 # Core anomaly detection
 # ==============================
-def detect_anomalies_for(bill_summary, cat_breakdown, user_id: int, period: str, bill_items=None):
+def _detector_history(cb, user_bills, prev_all, cat):
+    """Dedektöre sırayla beslenecek önceki dönem toplamları (kategori yoksa None)."""
+    bills = user_bills[user_bills["period"].isin(prev_all)].sort_values("period")["bill_id"].tolist()
+    totals = cb[(cb["category"] == cat) & cb["bill_id"].isin(bills)].groupby("bill_id")["category_total"].sum()
+    return [float(totals[b]) if b in totals.index else None for b in bills]
+
+
+def detect_anomalies_for(bill_summary, cat_breakdown, user_id: int, period: str, bill_items=None,
+                         detector: str = "zscore", config: Optional[AnomalyConfig] = None):
+    """detector: "zscore" (varsayılan kural) | "ewma" | "mad" — bkz. detectors.py.
+    config: eşik profili (varsayılan DEFAULT_CONFIG); faturanın segment/planına göre çözülür.
+    """
     period = str(period)
+    config = config or DEFAULT_CONFIG
     # 1) Hedef faturayı bul
     user_bills = bill_summary[bill_summary["user_id"] == user_id].copy()
     if user_bills.empty:
@@ -77,6 +189,14 @@ def detect_anomalies_for(bill_summary, cat_breakdown, user_id: int, period: str,
 
     target_row = target.iloc[0]
     bill_id = int(target_row["bill_id"])
+    cfg = config.for_segment(target_row.get("type"), target_row.get("current_plan_id"))
+    det = None
+    if detector != "zscore":
+        try:
+            from general_scripts.detectors import get_detector
+        except ImportError:  # betik olarak general_scripts/ içinden çalıştırıldığında
+            from detectors import get_detector
+        det = get_detector(detector, config=cfg)
 
     # 2) Geçmiş (baseline) penceresi
     # Kullanıcının tüm dönemleri
@@ -126,47 +246,16 @@ def detect_anomalies_for(bill_summary, cat_breakdown, user_id: int, period: str,
         std = float(row["std"].iloc[0]) if (not row.empty and not np.isnan(row["std"].iloc[0])) else 0.0
         count = int(row["count"].iloc[0]) if not row.empty else 0
 
-        # First-seen?
-        first_seen = (count == 0 and cur_amt >= MIN_TL)
-
-        # z-score ve %Δ
-        z = (cur_amt - mean) / std if std > 0 else None
-        pct_delta = _safe_div(cur_amt - mean, mean) if mean >= MIN_TL else (np.inf if (cur_amt >= MIN_TL and mean == 0) else 0.0)
-
-        is_spike = False
-        reasons = []
-
-        if first_seen:
-            is_spike = True
-            reasons.append("İlk kez görüldü")
-
-        if cur_amt >= MIN_TL and not first_seen:
-            if (z is not None and z >= Z_THRESH):
-                is_spike = True
-                reasons.append(f"z-skoru {z:.2f} (≥ {Z_THRESH})")
-            if pct_delta >= PCT_THRESH:
-                is_spike = True
-                reasons.append(f"% değişim {pct_delta*100:.0f}% (≥ {int(PCT_THRESH*100)}%)")
-
-        # Kategoriye özel heuristik (roaming/premium/vas hassas)
-        if cat in {"roaming", "premium_sms", "vas"} and (cur_amt >= MIN_TL):
-            # önceki ay toplam 0 ve şimdi > 0 ise 'yeni artış'
+        if det is not None:
+            state = det.new_state()
+            for v in _detector_history(cb, user_bills, periods[:idx], cat):
+                state = det.update(state, v)
+            anomaly = det.score(cat, cur_amt, state)
+        else:
             prev_sum = float(hist_cat[hist_cat["category"] == cat]["category_total"].sum()) if count > 0 else 0.0
-            if prev_sum < MIN_TL and cur_amt >= MIN_TL:
-                is_spike = True
-                reasons.append("Önceki aylarda yoktu/çok düşüktü, bu ay var")
-
-        if is_spike:
-            anomalies.append({
-                "category": cat,
-                "amount": round(cur_amt, 2),
-                "baseline_mean": round(mean, 2),
-                "baseline_std": round(std, 2) if std else None,
-                "z": round(z, 2) if z is not None else None,
-                "pct_delta": round(pct_delta, 3) if np.isfinite(pct_delta) else None,
-                "reason": "; ".join(reasons),
-                "suggested_action": SUGGEST_ACTION.get(cat, "Gözden geçir"),
-            })
+            anomaly = score_category(cat, cur_amt, mean, std, count, prev_sum, config=cfg)
+        if anomaly is not None:
+            anomalies.append(anomaly)
 
         # katkı (opsiyonel görsel/özet için)
         contribs.append({
@@ -199,7 +288,7 @@ def detect_anomalies_for(bill_summary, cat_breakdown, user_id: int, period: str,
         known = set(zip(base_sub["category"], base_sub["subtype"]))
         for _, r in cur_sub.iterrows():
             key = (r["category"], r["subtype"])
-            if r["amount"] >= MIN_TL and key not in known and r["category"] not in EXCLUDE_CATEGORIES:
+            if r["amount"] >= cfg.min_tl and key not in known and r["category"] not in EXCLUDE_CATEGORIES:
                 subtype_alerts.append({
                     "category": r["category"],
                     "subtype": r["subtype"],
@@ -214,7 +303,7 @@ def detect_anomalies_for(bill_summary, cat_breakdown, user_id: int, period: str,
     for a in anomalies:
         if a["category"] == "discount":
             # eğer bu ay indirim kaybı varsa (daha az negatif)
-            if a["baseline_mean"] < -MIN_TL and a["amount"] > a["baseline_mean"]:
+            if a["baseline_mean"] < -cfg.min_tl and a["amount"] > a["baseline_mean"]:
                 a["reason"] += "; İndirim azalmış/bitmiş olabilir"
 
     # Çıktı
@@ -238,19 +327,19 @@ def detect_anomalies_for(bill_summary, cat_breakdown, user_id: int, period: str,
 # CLI
 # ==============================
 def main():
-    global Z_THRESH, PCT_THRESH   # <<< en üste al
     ap = argparse.ArgumentParser()
     ap.add_argument("--artifacts", type=str, default="artifacts", help="data_prep çıktıları (bill_summary.csv, category_breakdown.csv)")
     ap.add_argument("--data", type=str, default=None, help="(Opsiyonel) raw csv klasörü (bill_items.csv için)")
     ap.add_argument("--user_id", type=int, required=True)
     ap.add_argument("--period", type=str, required=True, help="YYYY-MM")
-    ap.add_argument("--z", type=float, default=Z_THRESH)
-    ap.add_argument("--pct", type=float, default=PCT_THRESH)
+    ap.add_argument("--profile", choices=sorted(PROFILES), default="default", help="Eşik profili")
+    ap.add_argument("--z", type=float, default=None, help=f"z eşiği (profili ezer; varsayılan {Z_THRESH})")
+    ap.add_argument("--pct", type=float, default=None, help=f"%% artış eşiği (profili ezer; varsayılan {PCT_THRESH})")
+    ap.add_argument("--detector", choices=["zscore", "ewma", "mad"], default="zscore",
+                    help="Anomali dedektörü (ewma/mad: robust, bkz. detectors.py)")
     args = ap.parse_args()
 
-    Z_THRESH = args.z
-    PCT_THRESH = args.pct
-
+    config = get_config(args.profile).with_values(z_thresh=args.z, pct_thresh=args.pct)
 
     artifacts_dir = Path(args.artifacts)
     bill_summary, cat_breakdown = load_artifacts(artifacts_dir)
@@ -259,7 +348,8 @@ def main():
     if args.data:
         bill_items = load_raw_if_available(Path(args.data))
 
-    out = detect_anomalies_for(bill_summary, cat_breakdown, args.user_id, args.period, bill_items=bill_items)
+    out = detect_anomalies_for(bill_summary, cat_breakdown, args.user_id, args.period, bill_items=bill_items,
+                               detector=args.detector, config=config)
     print(json.dumps(out, ensure_ascii=False, indent=2))
 
 if __name__ == "__main__":
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+anomaly_table.py — Tüm faturalar için anomali tablosu (gece işi, materialize)
+
+/api/anomalies her çağrıda tek fatura için bill_summary + category_breakdown'dan
+yeniden hesaplar. Bu iş tüm faturaları tek geçişte, vektörel olarak puanlar ve
+sonucu artifacts/anomalies.csv'ye yazar; API (GET /api/anomalies/table) bu
+tablodan filtre + sayfalama ile servis eder ("bu ayki tüm premium_sms artışları").
+
+Kurallar anomaly_engine.score_category ile birebir aynıdır (kategori düzeyi; alt
+kalem first-seen bu tabloda yoktur):
+- Kullanıcının önceki BASELINE_MONTHS faturasında kategori toplamlarının mean/std'si
+- İlk kez görülme, z-skoru, % artış, hassas kategoriler (roaming/premium_sms/vas)
+- Eşikler AnomalyConfig profilinden, faturanın (segment, plan) anahtarına göre
+
+Önem (severity): z ≥ 1.5·z eşiği, % artış ≥ 1.5·% eşiği veya hassas kategorinin
+önceki aylarda hiç olmaması → "high"; diğerleri "medium".
+
+Çalıştırma (cron, data_prep'ten sonra):
+    python -m general_scripts.anomaly_table --artifacts artifacts [--profile default]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from general_scripts import anomaly_engine as ae
+except ImportError:  # betik olarak general_scripts/ içinden çalıştırıldığında
+    import anomaly_engine as ae
+
+TABLE_NAME = "anomalies"
+COLUMNS = ["bill_id", "user_id", "period", "segment", "plan_id", "category", "amount",
+           "baseline_mean", "baseline_std", "z", "pct_delta", "severity", "reason", "suggested_action"]
+SEVERITY_FACTOR = 1.5
+
+
+def _history(values: np.ndarray, users: np.ndarray, months: int) -> np.ndarray:
+    """(months, n_bills, n_cats): aynı kullanıcının k önceki faturasındaki değerler (yoksa NaN)."""
+    hist = np.full((months,) + values.shape, np.nan)
+    for k in range(1, months + 1):
+        if k >= len(values):
+            break
+        h = hist[k - 1]
+        h[k:] = values[:-k]
+        h[k:][users[k:] != users[:-k]] = np.nan
+    return hist
+
+
+def _thresholds(bills: pd.DataFrame, config: ae.AnomalyConfig):
+    """Fatura başına (z, pct, min_tl) eşikleri; her (segment, plan) için bir kez çözülür."""
+    keys = list(zip(bills["segment"], bills["plan_id"]))
+    codes, uniques = pd.factorize(pd.Series(keys, dtype=object))
+    resolved = [config.for_segment(seg, plan) for seg, plan in uniques]
+    pick = lambda attr: np.array([getattr(c, attr) for c in resolved], dtype=float)[codes][:, None]
+    return pick("z_thresh"), pick("pct_thresh"), pick("min_tl")
+
+
+def build_anomaly_table(bill_summary: pd.DataFrame, cat_breakdown: pd.DataFrame,
+                        config: Optional[ae.AnomalyConfig] = None,
+                        baseline_months: int = ae.BASELINE_MONTHS) -> pd.DataFrame:
+    config = config or ae.DEFAULT_CONFIG
+    bills = pd.DataFrame({
+        "bill_id": bill_summary["bill_id"].astype(int),
+        "user_id": bill_summary["user_id"].astype(int),
+        "period": bill_summary["period"].astype(str),
+        "segment": bill_summary["type"] if "type" in bill_summary else None,
+        "plan_id": bill_summary["current_plan_id"] if "current_plan_id" in bill_summary else None,
+    }).sort_values(["user_id", "period", "bill_id"], kind="mergesort").reset_index(drop=True)
+
+    cb = cat_breakdown[["bill_id", "category", "category_total"]].copy()
+    cb["category"] = cb["category"].str.lower().str.strip()
+    cb = cb[~cb["category"].isin(ae.EXCLUDE_CATEGORIES)]
+    wide = cb.pivot_table(index="bill_id", columns="category", values="category_total", aggfunc="sum")
+    wide = wide.reindex(bills["bill_id"].to_numpy())
+    cats = np.array(wide.columns, dtype=object)
+    values = wide.to_numpy(dtype=float)                       # NaN = kategori faturada yok
+
+    # Baseline: önceki baseline_months faturada kategori varsa toplamları
+    hist = _history(values, bills["user_id"].to_numpy(), baseline_months)
+    count = np.sum(~np.isnan(hist), axis=0)
+    prev_sum = np.nansum(hist, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, prev_sum / np.maximum(count, 1), 0.0)
+        sq = np.nansum((hist - mean) ** 2, axis=0)
+        std = np.where(count > 1, np.sqrt(sq / np.maximum(count - 1, 1)), 0.0)
+        cur = np.nan_to_num(values, nan=0.0)
+
+        # score_category ile aynı kurallar
+        z_t, p_t, min_tl = _thresholds(bills, config)
+        min_ok = cur >= min_tl
+        first = (count == 0) & min_ok
+        z = np.where(std > 0, (cur - mean) / np.where(std > 0, std, 1.0), np.nan)
+        pct = np.where(mean >= min_tl, (cur - mean) / np.where(mean != 0, mean, 1.0),
+                       np.where(min_ok & (mean == 0), np.inf, 0.0))
+        z_hit = min_ok & ~first & (z >= z_t)
+        pct_hit = min_ok & ~first & (pct >= p_t)
+        sensitive = np.isin(cats, list(ae.SENSITIVE_CATEGORIES))[None, :]
+        new_sensitive = sensitive & min_ok & (prev_sum < min_tl)
+        high = (z_hit & (z >= SEVERITY_FACTOR * z_t)) | (pct_hit & (pct >= SEVERITY_FACTOR * p_t)) | new_sensitive
+
+    r, c = np.nonzero(first | z_hit | pct_hit | new_sensitive)
+    if not len(r):
+        return pd.DataFrame(columns=COLUMNS)
+
+    zr, pr, zt, pt, mt = z[r, c], pct[r, c], z_t[r, 0], p_t[r, 0], min_tl[r, 0]
+    base_mean = np.round(mean[r, c], 2)
+    amount = np.round(cur[r, c], 2)
+    reasons = []
+    for i in range(len(r)):
+        parts = []
+        if first[r[i], c[i]]:
+            parts.append("İlk kez görüldü")
+        if z_hit[r[i], c[i]]:
+            parts.append(f"z-skoru {zr[i]:.2f} (≥ {zt[i]})")
+        if pct_hit[r[i], c[i]]:
+            parts.append(f"% değişim {pr[i]*100:.0f}% (≥ {int(pt[i]*100)}%)")
+        if new_sensitive[r[i], c[i]]:
+            parts.append("Önceki aylarda yoktu/çok düşüktü, bu ay var")
+        if cats[c[i]] == "discount" and base_mean[i] < -mt[i] and amount[i] > base_mean[i]:
+            parts.append("İndirim azalmış/bitmiş olabilir")
+        reasons.append("; ".join(parts))
+
+    std_f = std[r, c]
+    out = pd.DataFrame({
+        "bill_id": bills["bill_id"].to_numpy()[r],
+        "user_id": bills["user_id"].to_numpy()[r],
+        "period": bills["period"].to_numpy()[r],
+        "segment": bills["segment"].to_numpy()[r],
+        "plan_id": bills["plan_id"].to_numpy()[r],
+        "category": cats[c],
+        "amount": amount,
+        "baseline_mean": base_mean,
+        "baseline_std": np.where(std_f != 0, np.round(std_f, 2), np.nan),
+        "z": np.round(zr, 2),
+        "pct_delta": np.where(np.isfinite(pr), np.round(pr, 3), np.nan),
+        "severity": np.where(high[r, c], "high", "medium"),
+        "reason": reasons,
+        "suggested_action": [ae.SUGGEST_ACTION.get(cat, "Gözden geçir") for cat in cats[c]],
+    })
+    return out.sort_values(["period", "bill_id", "category"], kind="mergesort").reset_index(drop=True)
+
+
+def write_table(df: pd.DataFrame, path: Path) -> None:
+    """Atomik yazım: API snapshot'ı yarım yazılmış dosyayı görmez."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--artifacts", type=str, default="artifacts", help="bill_summary.csv / category_breakdown.csv klasörü")
+    ap.add_argument("--out", type=str, default=None, help="Çıktı CSV (varsayılan: <artifacts>/anomalies.csv)")
+    ap.add_argument("--profile", choices=sorted(ae.PROFILES), default="default", help="Eşik profili")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    artifacts = Path(args.artifacts)
+    t0 = time.perf_counter()
+    bill_summary, cat_breakdown = ae.load_artifacts(artifacts)
+    t1 = time.perf_counter()
+    table = build_anomaly_table(bill_summary, cat_breakdown, config=ae.get_config(args.profile))
+    t2 = time.perf_counter()
+    out = Path(args.out) if args.out else artifacts / f"{TABLE_NAME}.csv"
+    write_table(table, out)
+    print(json.dumps({
+        "out": str(out),
+        "bills": int(len(bill_summary)),
+        "anomalies": int(len(table)),
+        "by_severity": table["severity"].value_counts().to_dict(),
+        "load_s": round(t1 - t0, 3),
+        "compute_s": round(t2 - t1, 3),
+    }, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
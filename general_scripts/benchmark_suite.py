@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark_suite.py — Engine ve API performans ölçümü (sentetik veri, ayarlanabilir ölçek)
+
+Her ölçek (kullanıcı sayısı) için mock_data_generator ile veri üretilir (çalışma
+klasöründe saklanır, tekrar kullanılır), data_prep + kategori dağılımı + anomali
+tablosu artifact'leri kurulur ve şu ölçümler yapılır:
+
+- data_prep:             read_csvs → standardize_types → category_breakdown → bill_summary → segment_stats
+- detect_anomalies_for:  rastgele (kullanıcı, son dönem) çağrıları
+- scenario_cost:         rastgele kullanıcı + farklı plan
+- enumerate_top3:        rastgele kullanıcı
+- alloc_taxes:           PayloadBuilder payload'ları üzerinde
+- api:<endpoint>:        uygulama içi TestClient ile ana endpoint'ler
+
+Her ölçüm için: çağrı sayısı, throughput (çağrı/sn), p50/p99/ortalama gecikme (ms)
+ve tracemalloc ile ayrı bir geçişte tepe bellek (peak_mb, Python/NumPy ayırmaları).
+
+Kullanım:
+    python -m general_scripts.benchmark_suite --scales 1000 100000 --out bench/after.json
+    python -m general_scripts.benchmark_suite --scales 1000 --out bench/after.json --compare bench/before.json
+    python -m general_scripts.benchmark_suite --compare bench/before.json --report bench/after.json   # yalnızca karşılaştır
+
+Karşılaştırma: p50/p99 veya peak_mb (1 + tolerans) katından fazla artarsa ya da
+throughput 1/(1 + tolerans) katının altına düşerse regresyon sayılır; çıkış kodu 1.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from general_scripts import anomaly_engine as ae
+from general_scripts import data_prep
+from general_scripts.anomaly_table import build_anomaly_table, write_table
+from general_scripts.payload_builder import PayloadBuilder
+from general_scripts.rules_engine import alloc_taxes
+from general_scripts.startup_profile import rss_mb
+from general_scripts.whatif_engine import enumerate_top3, load_all, scenario_cost
+
+DEFAULT_SCALES = [1000]
+DEFAULT_MONTHS = 4
+DEFAULT_SAMPLES = 200
+DEFAULT_TOLERANCE = 0.10
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "peak_mb")
+HIGHER_IS_BETTER = ("throughput_per_s",)
+
+
+# ==============================
+# Veri seti
+# ==============================
+def prepare_dataset(n_users: int, n_months: int, seed: int, workdir: Path) -> Path:
+    """<workdir>/<n_users>u_<n_months>m_s<seed>/data altına CSV'leri üret (varsa dokunma)."""
+    from data_generator_scripts import mock_data_generator as mdg
+
+    root = workdir / f"{n_users}u_{n_months}m_s{seed}"
+    data_dir = root / "data"
+    if (data_dir / "bill_items.csv").exists():
+        return root
+    data_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    plans, add_on_packs, vas_catalog, premium_sms_catalog = mdg.build_catalogs(seed)
+    users = mdg.build_users(n_users, plans, rng=rng)
+    months = mdg.month_range(n_months)
+    usage = mdg.simulate_usage(users, months, rng=rng)
+    headers, items = mdg.build_billing(users, plans, usage, months, vas_catalog, premium_sms_catalog, rng=rng)
+    for name, df in (("users", users), ("plans", plans), ("bill_headers", headers), ("bill_items", items),
+                     ("usage_daily", usage), ("vas_catalog", vas_catalog),
+                     ("premium_sms_catalog", premium_sms_catalog), ("add_on_packs", add_on_packs)):
+        df.to_csv(data_dir / f"{name}.csv", index=False)
+    return root
+
+
+def run_data_prep(data_dir: Path):
+    dfs = data_prep.standardize_types(data_prep.read_csvs(data_dir))
+    cat = data_prep.build_category_breakdown(dfs["bill_items"])
+    bill_summary = data_prep.build_bill_summary(dfs, cat)
+    seg_stats = data_prep.build_segment_stats(dfs, bill_summary)
+    return bill_summary, seg_stats, cat
+
+
+def build_artifacts(root: Path) -> Path:
+    art = root / "artifacts"
+    if (art / "anomalies.csv").exists():
+        return art
+    art.mkdir(parents=True, exist_ok=True)
+    bill_summary, seg_stats, cat = run_data_prep(root / "data")
+    bill_summary.to_csv(art / "bill_summary.csv", index=False)
+    seg_stats.to_csv(art / "segment_stats.csv", index=False)
+    cat.to_csv(art / "category_breakdown.csv", index=False)
+    bs, cb = ae.load_artifacts(art)
+    write_table(build_anomaly_table(bs, cb), art / "anomalies.csv")
+    return art
+
+
+# ==============================
+# Ölçüm
+# ==============================
+def summarize(latencies: Sequence[float], wall: float) -> Dict[str, Any]:
+    lat = np.asarray(latencies, dtype=float) * 1000.0
+    return {
+        "n": int(len(lat)),
+        "total_s": round(wall, 4),
+        "throughput_per_s": round(len(lat) / wall, 2) if wall > 0 else None,
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p99_ms": round(float(np.percentile(lat, 99)), 3),
+        "mean_ms": round(float(lat.mean()), 3),
+    }
+
+
+def peak_memory_mb(fn: Callable[[], Any]) -> float:
+    """fn() süresince tracemalloc tepe değeri (MB); zamanlamadan ayrı geçişte ölçülür."""
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / (1024.0 * 1024.0), 2)
+
+
+def measure(calls: Sequence[Callable[[], Any]], warmup: int = 1, memory: bool = True) -> Dict[str, Any]:
+    for fn in calls[:warmup]:
+        fn()
+    latencies = []
+    t0 = time.perf_counter()
+    for fn in calls:
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+    out = summarize(latencies, time.perf_counter() - t0)
+    if memory:
+        out["peak_mb"] = peak_memory_mb(calls[0])
+    out["rss_mb"] = rss_mb()
+    return out
+
+
+# ==============================
+# Senaryolar
+# ==============================
+def engine_benchmarks(root: Path, art: Path, samples: int, seed: int, memory: bool) -> Dict[str, Any]:
+    rnd = random.Random(seed)
+    results: Dict[str, Any] = {}
+
+    results["data_prep"] = measure([lambda: run_data_prep(root / "data")] * 3, warmup=0, memory=memory)
+
+    bill_summary, cat_breakdown = ae.load_artifacts(art)
+    last = bill_summary["period"].max()
+    last_users = bill_summary.loc[bill_summary["period"] == last, "user_id"].astype(int).tolist()
+    pick = lambda k: [rnd.choice(last_users) for _ in range(k)]
+
+    results["detect_anomalies_for"] = measure(
+        [lambda u=u: ae.detect_anomalies_for(bill_summary, cat_breakdown, u, last) for u in pick(samples)],
+        memory=memory)
+
+    db = load_all(root / "data")
+    plan_ids = db["plans"]["plan_id"].astype(int).tolist()
+    results["scenario_cost"] = measure(
+        [lambda u=u, p=rnd.choice(plan_ids): scenario_cost(u, last, db, plan_id=p) for u in pick(samples)],
+        memory=memory)
+    results["enumerate_top3"] = measure(
+        [lambda u=u: enumerate_top3(u, last, db) for u in pick(max(10, samples // 10))], memory=memory)
+
+    builder = PayloadBuilder(db)
+    payloads = [builder.payload(builder.bill_id_for(u, last)) for u in pick(samples)]
+    results["alloc_taxes"] = measure([lambda p=p: alloc_taxes(p) for p in payloads], memory=memory)
+    return results
+
+
+def api_benchmarks(root: Path, art: Path, samples: int, seed: int, memory: bool) -> Dict[str, Any]:
+    from fastapi.testclient import TestClient
+    import api_server
+    from general_scripts.dataset_store import DatasetStore
+
+    rnd = random.Random(seed)
+    headers = pd.read_csv(root / "data" / "bill_headers.csv", usecols=["bill_id", "user_id", "period_start"])
+    headers["period"] = headers["period_start"].str[:7]
+    last = headers["period"].max()
+    cur = headers[headers["period"] == last]
+    picks = [cur.iloc[rnd.randrange(len(cur))] for _ in range(samples)]
+
+    requests = {
+        "GET /api/users/{id}": lambda c, r: c.get(f"/api/users/{int(r.user_id)}"),
+        "GET /api/bills/{id}": lambda c, r: c.get(f"/api/bills/{int(r.user_id)}?period={last}"),
+        "POST /api/explain": lambda c, r: c.post("/api/explain", json={"bill_id": int(r.bill_id)}),
+        "POST /api/anomalies": lambda c, r: c.post("/api/anomalies", json={"user_id": int(r.user_id), "period": last}),
+        "POST /api/whatif": lambda c, r: c.post("/api/whatif", json={"user_id": int(r.user_id), "period": last,
+                                                                     "scenario": {"plan_id": 2}}),
+        "POST /api/tax-analysis": lambda c, r: c.post("/api/tax-analysis", json={"user_id": int(r.user_id), "period": last}),
+        "GET /api/anomalies/table": lambda c, r: c.get(f"/api/anomalies/table?period={last}&category=premium_sms&limit=100"),
+    }
+
+    previous = api_server.STORE
+    api_server.STORE = DatasetStore(root / "data", art)
+    results: Dict[str, Any] = {}
+    try:
+        with TestClient(api_server.app) as client:
+            api_server.STORE.prewarm()
+            for name, call in requests.items():
+                status = call(client, picks[0]).status_code
+                if status >= 400:
+                    results[name] = {"error": f"HTTP {status}"}
+                    continue
+                results[name] = measure([lambda r=r, call=call: call(client, r) for r in picks], memory=memory)
+    finally:
+        api_server.STORE = previous
+    return results
+
+
+# ==============================
+# Rapor / karşılaştırma
+# ==============================
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_suite(scales: Sequence[int], n_months: int, seed: int, samples: int, workdir: Path,
+              include_api: bool = True, memory: bool = True) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": {"scales": list(scales), "n_months": n_months, "seed": seed, "samples": samples},
+        "results": {},
+    }
+    for n_users in scales:
+        key = f"{n_users}u"
+        t0 = time.perf_counter()
+        root = prepare_dataset(n_users, n_months, seed, workdir)
+        art = build_artifacts(root)
+        setup_s = round(time.perf_counter() - t0, 2)
+        print(f"[{key}] veri hazır ({setup_s} sn) → {root}", file=sys.stderr)
+        res = engine_benchmarks(root, art, samples, seed, memory)
+        if include_api:
+            res.update({f"api:{k}": v for k, v in api_benchmarks(root, art, samples, seed, memory).items()})
+        res["_setup"] = {"seconds": setup_s}
+        report["results"][key] = res
+    report["max_rss_mb"] = rss_mb()
+    return report
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> Dict[str, Any]:
+    """Ortak (ölçek, ölçüm, metrik) üçlüleri için oran ve regresyon listesi."""
+    rows, regressions = [], []
+    for scale, benches in new.get("results", {}).items():
+        for bench, metrics in benches.items():
+            old = base.get("results", {}).get(scale, {}).get(bench)
+            if not old or bench.startswith("_"):
+                continue
+            for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+                a, b = old.get(metric), metrics.get(metric)
+                if not a or b is None:
+                    continue
+                ratio = b / a
+                worse = ratio > 1 + tolerance if metric in LOWER_IS_BETTER else ratio < 1 / (1 + tolerance)
+                row = {"scale": scale, "bench": bench, "metric": metric,
+                       "before": a, "after": b, "ratio": round(ratio, 3), "regression": worse}
+                rows.append(row)
+                if worse:
+                    regressions.append(row)
+    return {"tolerance": tolerance, "rows": rows, "regressions": regressions}
+
+
+def print_comparison(cmp: Dict[str, Any]) -> None:
+    print(f"{'ölçek':>8}  {'ölçüm':<28} {'metrik':<17} {'önce':>11} {'sonra':>11} {'oran':>7}")
+    for r in cmp["rows"]:
+        flag = "  ← REGRESYON" if r["regression"] else ""
+        print(f"{r['scale']:>8}  {r['bench']:<28} {r['metric']:<17} {r['before']:>11} {r['after']:>11} {r['ratio']:>7}{flag}")
+    print(f"\n{len(cmp['regressions'])} regresyon (tolerans %{cmp['tolerance']*100:.0f})")
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="Kullanıcı sayıları (ör. 1000 100000 1000000)")
+    ap.add_argument("--n_months", type=int, default=DEFAULT_MONTHS)
+    ap.add_argument("--seed", type=int, default=123)
+    ap.add_argument("--samples", type=int, default=DEFAULT_SAMPLES, help="Ölçüm başına çağrı sayısı")
+    ap.add_argument("--workdir", type=str, default=".bench", help="Üretilen veri setlerinin klasörü")
+    ap.add_argument("--out", type=str, default=None, help="Sonuç JSON (varsayılan: stdout)")
+    ap.add_argument("--no-api", action="store_true", help="API ölçümlerini atla")
+    ap.add_argument("--no-memory", action="store_true", help="tracemalloc tepe bellek geçişini atla")
+    ap.add_argument("--compare", type=str, default=None, help="Karşılaştırılacak önceki sonuç JSON")
+    ap.add_argument("--report", type=str, default=None, help="Ölçüm yapmadan bu sonucu --compare ile karşılaştır")
+    ap.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.report:
+        report = json.loads(Path(args.report).read_text(encoding="utf-8"))
+    else:
+        report = run_suite(args.scales, args.n_months, args.seed, args.samples, Path(args.workdir),
+                           include_api=not args.no_api, memory=not args.no_memory)
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.out:
+            Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+            Path(args.out).write_text(text, encoding="utf-8")
+            print(f"✓ Sonuçlar → {args.out}", file=sys.stderr)
+        elif not args.compare:
+            print(text)
+
+    if args.compare:
+        base = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        cmp = compare(base, report, args.tolerance)
+        print_comparison(cmp)
+        if cmp["regressions"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
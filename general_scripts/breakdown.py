@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+breakdown.py — Fatura kalemlerinden kategori dökümü (breakdown) üretici
+
+Çıktı şeması (explain payload'ındaki "breakdown" alanı):
+    [{"category": str, "total": float, "lines": [{"text": str, "amount": float}, ...]}, ...]
+
+Kategori başına yeniden filtreleme + iterrows yerine tek bir kararlı sıralama ve
+grup sınırları üzerinden çalışır; satır metinleri vektörel olarak üretilir.
+Birden çok faturayı tek geçişte işleyebilir (build_breakdowns).
+
+Kullanım:
+    build_breakdown(items_of_one_bill)          -> list
+    build_breakdowns(bill_items)[bill_id]       -> list
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def line_texts(items: pd.DataFrame) -> pd.Series:
+    """"{description} - {quantity}x{unit_price} TL" metinlerini vektörel üret.
+
+    description yoksa (ör. yalnızca kategori toplamı olan tablolar) kategori adı kullanılır.
+    """
+    if {"description", "quantity", "unit_price"}.issubset(items.columns):
+        return (
+            items["description"].astype(str) + " - "
+            + items["quantity"].astype(str) + "x"
+            + items["unit_price"].astype(str) + " TL"
+        )
+    return items["category"].astype(str)
+
+
+def build_breakdowns(items: pd.DataFrame, bill_ids: Optional[Iterable[Any]] = None) -> Dict[Any, List[Dict[str, Any]]]:
+    """bill_id -> breakdown listesi. Kategoriler fatura içinde ilk görülme sırasını korur."""
+    if bill_ids is not None:
+        items = items[items["bill_id"].isin(list(bill_ids))]
+    if items.empty:
+        return {}
+
+    # (bill_id, category) grupları ilk görülme sırasına göre numaralanır
+    codes = items.groupby(["bill_id", "category"], sort=False).ngroup().to_numpy()
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+
+    bills = items["bill_id"].to_numpy()[order].tolist()
+    cats = items["category"].to_numpy()[order].tolist()
+    amounts = items["amount"].to_numpy(dtype=float)[order]
+    texts = line_texts(items).to_numpy()[order].tolist()
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+    totals = np.add.reduceat(amounts, starts).tolist()
+    amounts = amounts.tolist()
+
+    out: Dict[Any, List[Dict[str, Any]]] = {}
+    for s, e, total in zip(starts.tolist(), ends.tolist(), totals):
+        out.setdefault(bills[s], []).append({
+            "category": cats[s],
+            "total": float(total),
+            "lines": [{"text": t, "amount": a} for t, a in zip(texts[s:e], amounts[s:e])],
+        })
+    return out
+
+
+def build_breakdown(items: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Tek faturanın kalemleri için breakdown (bill_id kolonu olmasa da çalışır)."""
+    if items.empty:
+        return []
+    if "bill_id" not in items.columns:
+        items = items.assign(bill_id=0)
+    result = build_breakdowns(items)
+    # Tek fatura bekleniyor; birden fazlaysa ilk görülme sırasıyla birleştir
+    return [entry for bill in result.values() for entry in bill]
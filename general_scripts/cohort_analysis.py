@@ -1,17 +1,148 @@
 # -*- coding: utf-8 -*-
 """
 cohort_analysis.py — Kohort kıyası analizi
+
+Kohort = (segment tipi [users.type], plan [users.current_plan_id], dönem).
+CohortIndex her kohort için fatura toplamı, data GB, dakika ve SMS değerlerini
+sıralı diziler olarak bir kez hazırlar; ortalama/çeyreklikler önceden hesaplanır,
+bir kullanıcının yüzdelik sırası ikili arama ile (O(log n)) bulunur.
+
+Kullanım:
+    index = build_cohort_index(load_all(Path("data")))
+    stats = index.lookup("retail", 3, "2025-07")
+    analyze_cohort_comparison(payload, cohort=stats)
 """
 
-from typing import Dict, Any
+from dataclasses import dataclass, field
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+COHORT_METRICS = ("total", "gb", "minutes", "sms")
+MIN_COHORT_SIZE = 5     # daha küçük kohortlarda plan, sonra segment kırılımı bırakılır
+ANY = "*"               # kırılım bırakılan seviye
+
+
+@dataclass
+class CohortStats:
+    key: Tuple[Any, Any, str]                 # (segment, plan_id, period); bırakılan seviye ANY
+    values: Dict[str, np.ndarray]             # metrik -> sıralı değerler
+    summary: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        for m, arr in self.values.items():
+            self.summary[m] = {
+                "mean": float(arr.mean()) if len(arr) else 0.0,
+                "p25": float(np.quantile(arr, 0.25)) if len(arr) else 0.0,
+                "p50": float(np.quantile(arr, 0.50)) if len(arr) else 0.0,
+                "p75": float(np.quantile(arr, 0.75)) if len(arr) else 0.0,
+            }
+
+    @property
+    def size(self) -> int:
+        return len(self.values["total"])
+
+    def percentile_rank(self, metric: str, value: float) -> float:
+        """Kohortta değerin yüzdelik sırası (0-100, eşitlerde orta sıra)."""
+        arr = self.values[metric]
+        if not len(arr):
+            return 0.0
+        lo = np.searchsorted(arr, value, side="left")
+        hi = np.searchsorted(arr, value, side="right")
+        return round(100.0 * float(lo + hi) / (2 * len(arr)), 1)
+
+    def as_cohort_data(self) -> Dict[str, Any]:
+        """analyze_cohort_comparison'ın eski cohort_data sözlüğü formatı."""
+        segment, plan_id, period = self.key
+        s = self.summary
+        return {
+            "cohort_type": segment if segment != ANY else "genel",
+            "avg_total": round(s["total"]["mean"], 2),
+            "avg_data_gb": round(s["gb"]["mean"], 2),
+            "avg_minutes": round(s["minutes"]["mean"], 1),
+            "avg_sms": round(s["sms"]["mean"], 1),
+            "percentile_25": round(s["total"]["p25"], 2),
+            "percentile_75": round(s["total"]["p75"], 2),
+        }
+
+
+class CohortIndex:
+    def __init__(self, cohorts: Dict[Tuple[Any, Any, str], CohortStats], users: pd.DataFrame,
+                 min_size: int = MIN_COHORT_SIZE):
+        self.cohorts = cohorts
+        self.min_size = min_size
+        self._user_keys = {
+            int(u): (t, int(p)) for u, t, p in
+            zip(users["user_id"], users["type"], users["current_plan_id"])
+        }
 
-def analyze_cohort_comparison(payload: Dict[str, Any], cohort_data: Dict[str, Any]) -> Dict[str, Any]:
+    def lookup(self, segment: Any, plan_id: Any, period: str) -> Optional[CohortStats]:
+        """En dar yeterli kohort: (segment, plan) -> (segment, *) -> (*, *)."""
+        period = str(period)[:7]
+        for key in ((segment, plan_id, period), (segment, ANY, period), (ANY, ANY, period)):
+            stats = self.cohorts.get(key)
+            if stats is not None and stats.size >= self.min_size:
+                return stats
+        return self.cohorts.get((ANY, ANY, period))
+
+    def for_user(self, user_id: int, period: str) -> Optional[CohortStats]:
+        segment, plan_id = self._user_keys.get(int(user_id), (ANY, ANY))
+        return self.lookup(segment, plan_id, period)
+
+
+def cohort_frame(data: Mapping[str, pd.DataFrame]) -> pd.DataFrame:
+    """Fatura başına kohort anahtarları + metrikler (total TL, gb, minutes, sms)."""
+    bills = data["bill_headers"][["bill_id", "user_id", "period", "total_amount"]]
+    usage = data["usage_daily"]
+    monthly = (
+        usage.assign(period=usage["date"].dt.strftime("%Y-%m"))
+        .groupby(["user_id", "period"], sort=False)[["mb_used", "minutes_used", "sms_used"]].sum()
+        .reset_index()
+    )
+    users = data["users"][["user_id", "type", "current_plan_id"]]
+    df = bills.merge(monthly, on=["user_id", "period"], how="left").merge(users, on="user_id", how="left")
+    return pd.DataFrame({
+        "segment": df["type"].fillna(ANY),
+        "plan_id": df["current_plan_id"].fillna(-1).astype(int),
+        "period": df["period"].astype(str),
+        "total": df["total_amount"].astype(float),
+        "gb": df["mb_used"].fillna(0.0).astype(float) / 1024.0,
+        "minutes": df["minutes_used"].fillna(0.0).astype(float),
+        "sms": df["sms_used"].fillna(0).astype(float),
+    })
+
+
+def build_cohort_index(data: Mapping[str, pd.DataFrame], min_size: int = MIN_COHORT_SIZE) -> CohortIndex:
+    """Tüm kırılım seviyeleri için kohort dağılımlarını tek geçişte hazırla."""
+    df = cohort_frame(data)
+    cohorts: Dict[Tuple[Any, Any, str], CohortStats] = {}
+    levels = (
+        ["segment", "plan_id", "period"],
+        ["segment", "period"],
+        ["period"],
+    )
+    for cols in levels:
+        for key, idx in df.groupby(cols, sort=False).indices.items():
+            key = key if isinstance(key, tuple) else (key,)
+            named = dict(zip(cols, key))
+            plan_id = named.get("plan_id", ANY)
+            full_key = (str(named.get("segment", ANY)), int(plan_id) if plan_id != ANY else ANY, str(named["period"]))
+            cohorts[full_key] = CohortStats(
+                key=full_key,
+                values={m: np.sort(df[m].to_numpy()[idx]) for m in COHORT_METRICS},
+            )
+    return CohortIndex(cohorts, data["users"], min_size=min_size)
+
+
+def analyze_cohort_comparison(payload: Dict[str, Any], cohort_data: Optional[Dict[str, Any]] = None,
+                              cohort: Optional[CohortStats] = None) -> Dict[str, Any]:
     """
     2. Kohort kıyası: benzer kullanıcıların ortalamasına göre fark
-    
+
     Args:
         payload: Fatura verisi
-        cohort_data: Benzer kullanıcıların verisi
+        cohort_data: Benzer kullanıcıların verisi (cohort verilmezse kullanılır)
             {
                 "cohort_type": "retail|youth|corporate",
                 "avg_total": 180.25,
@@ -21,15 +152,21 @@ def analyze_cohort_comparison(payload: Dict[str, Any], cohort_data: Dict[str, An
                 "percentile_25": 150.0,
                 "percentile_75": 220.0
             }
+        cohort: CohortIndex'ten gelen kohort; verilirse ortalamalar/çeyreklikler ondan
+            alınır ve yüzdelik sıralar eklenir
     """
+    if cohort is not None:
+        cohort_data = cohort.as_cohort_data()
+    cohort_data = cohort_data or {}
+
     summary = payload.get("summary", {})
     usage = summary.get("usage_summary", {})
-    
+
     user_total = summary.get("total", 0)
     cohort_avg = cohort_data.get("avg_total", 0)
     cohort_diff = user_total - cohort_avg
     cohort_percentile = cohort_data.get("percentile_75", 0)
-    
+
     # Kohort analizi
     analysis = {
         "cohort_type": cohort_data.get("cohort_type", "genel"),
@@ -56,6 +193,12 @@ def analyze_cohort_comparison(payload: Dict[str, Any], cohort_data: Dict[str, An
             }
         }
     }
-    
-    return analysis
 
+    if cohort is not None:
+        segment, plan_id, period = cohort.key
+        analysis["cohort"] = {"segment": segment, "plan_id": plan_id, "period": period, "size": cohort.size}
+        analysis["percentile_rank"] = cohort.percentile_rank("total", user_total)
+        for name, metric, key in (("data_gb", "gb", "gb"), ("minutes", "minutes", "minutes"), ("sms", "sms", "sms")):
+            analysis["usage_comparison"][name]["percentile_rank"] = cohort.percentile_rank(metric, usage.get(key, 0) or 0)
+
+    return analysis
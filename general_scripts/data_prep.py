@@ -8,19 +8,43 @@ Amaç:
 3) Segment bazlı istatistikler üretmek: segment_stats_df (youth/retail/corporate/tourist)
 4) CSV olarak çıktı vermek (./artifacts klasörüne):
    - bill_summary.csv
+   - category_breakdown.csv (fatura x kategori: toplam, kalem sayısı, ort. birim fiyat/vergi oranı;
+     bill_summary pivotu ile aynı gruplamadan)
    - segment_stats.csv
+   - segment_state.json (birleştirilebilir segment momentleri; --incremental için). Yalnızca
+     kapanmış aylar yazılır; en son ay (ya da --closed_through'dan yeniler) her çalıştırmada
+     yeniden hesaplanıp istatistiklere geçici olarak eklenir
+
+Girdi tabloları tek CSV (<data>/bill_items.csv) ya da shard'lı üretimin part
+dosyaları (<data>/bill_items/part-*.csv) olabilir.
+bill_items/usage_daily tutarları dosya bazında biçim tespitiyle ("1.234,56" / "1,234.56" /
+"1234.56", ";" ayraçlı dışa aktarımlar) okunur; ayrıştırılamayan değerler
+parse_report.json'a yazılır.
 
 Çalıştırma:
     python data_prep.py --data data --out artifacts
+    python data_prep.py --data data --out artifacts --incremental   # yalnızca yeni aylar
+    python data_prep.py --data data --out artifacts --incremental --closed_through 2025-05
+    python data_prep.py --data data --out artifacts --quantiles     # + p50/p90 kolonları
+    python data_prep.py --data data --out artifacts --engine duckdb # SQL arka ucu (bellek dışı; sql_engine.py)
 """
 from __future__ import annotations
 import argparse
+import json
+import re
 from pathlib import Path
-from typing import Dict
+from typing import Callable, Dict, List, Optional
 
 import numpy as np
 import pandas as pd
 
+try:
+    from general_scripts.numeric_parse import NUMERIC_COLUMNS, read_numeric_csv, rejected_total
+    from general_scripts.segment_moments import SegmentState, split_periods
+except ImportError:  # betik olarak general_scripts/ içinden çalıştırıldığında
+    from numeric_parse import NUMERIC_COLUMNS, read_numeric_csv, rejected_total
+    from segment_moments import SegmentState, split_periods
+
 
 CATS = [
     "data","voice","sms","roaming","premium_sms","vas","one_off","discount","tax","one_off","discount"
@@ -31,15 +55,60 @@ def parse_args():
     ap = argparse.ArgumentParser()
     ap.add_argument("--data", default="data", help="Girdi klasörü (CSV'ler)")
     ap.add_argument("--out", default="artifacts", help="Çıktı klasörü")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Segment istatistiklerini kayıtlı durumdan sürdür; yalnızca yeni aylar işlenir")
+    ap.add_argument("--closed_through", default=None, metavar="YYYY-MM",
+                    help="Bu aya kadar (dahil) dönemler kapanmış sayılır ve duruma yazılır "
+                         "(varsayılan: verideki en son ay hariç hepsi)")
+    ap.add_argument("--state", default=None, help="Segment durum dosyası (varsayılan: <out>/segment_state.json)")
+    ap.add_argument("--quantiles", action="store_true",
+                    help="Kullanım metrikleri için p50/p90 kolonları ekle (sketch tabanlı)")
+    ap.add_argument("--engine", choices=["pandas", "duckdb"], default="pandas",
+                    help="Hesaplama arka ucu: pandas (bellekte) ya da duckdb (SQL, bellek dışı; opsiyonel bağımlılık)")
+    ap.add_argument("--exact_floats", action="store_true",
+                    help="Sayıları doğru yuvarlanmış ayrıştır (round_trip; ~2x yavaş). --engine duckdb ile "
+                         "bit düzeyinde aynı çıktı için; duckdb arka ucu her zaman böyle ayrıştırır")
+    ap.add_argument("--memory_limit", default=None, help="--engine duckdb: bellek sınırı (ör. 2GB); aşan kısım diske taşar")
     return ap.parse_args()
 
 
-def read_csvs(root: Path) -> Dict[str, pd.DataFrame]:
+def table_parts(root: Path, name: str) -> List[Path]:
+    """<name>.csv ya da shard'lı üretimin <name>/part-*.csv dosyaları (sıralı)."""
+    p = root / f"{name}.csv"
+    if p.exists():
+        return [p]
+    return sorted((root / name).glob("part-*.csv")) if (root / name).is_dir() else []
+
+
+def read_table(root: Path, name: str, parse_report: Optional[List[dict]] = None,
+               float_precision: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """Tabloyu (tek CSV ya da part dosyaları) oku; yoksa None.
+    bill_items/usage_daily sayısal kolonları dosya bazında biçim tespitiyle ayrıştırılır
+    (numeric_parse); her dosyanın raporu parse_report'a eklenir.
+    float_precision: numeric_parse.read_numeric_csv'ye iletilir ("round_trip" = doğru yuvarlama).
+    """
+    parts = table_parts(root, name)
+    if not parts:
+        return None
+    frames = []
+    for p in parts:
+        if name in NUMERIC_COLUMNS:
+            df, rep = read_numeric_csv(p, NUMERIC_COLUMNS[name], float_precision=float_precision)
+            if parse_report is not None:
+                parse_report.append(rep)
+        else:
+            df = pd.read_csv(p)
+        frames.append(df)
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def read_csvs(root: Path, parse_report: Optional[List[dict]] = None,
+              float_precision: Optional[str] = None) -> Dict[str, pd.DataFrame]:
     def rd(name):
-        p = root / f"{name}.csv"
-        if not p.exists():
-            raise FileNotFoundError(f"Eksik: {p}")
-        return pd.read_csv(p)
+        df = read_table(root, name, parse_report, float_precision)
+        if df is None:
+            raise FileNotFoundError(f"Eksik: {root / f'{name}.csv'} (ya da {root / name}/part-*.csv)")
+        return df
     dfs = {
         "users": rd("users"),
         "plans": rd("plans"),
@@ -73,7 +142,7 @@ def standardize_types(dfs: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
             if c in dfs["bill_items"].columns:
                 dfs["bill_items"][c] = pd.to_numeric(dfs["bill_items"][c], errors="coerce")
         if "category" in dfs["bill_items"].columns:
-            dfs["bill_items"]["category"] = dfs["bill_items"]["category"].str.lower().fillna("unknown")
+            dfs["bill_items"]["category"] = dfs["bill_items"]["category"].str.lower().str.strip().fillna("unknown")
     if "usage_daily" in dfs:
         for c in ["mb_used","minutes_used","sms_used","roaming_mb"]:
             if c in dfs["usage_daily"].columns:
@@ -81,16 +150,30 @@ def standardize_types(dfs: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
     return dfs
 
 
-def build_bill_summary(dfs: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+def build_category_breakdown(bill_items: pd.DataFrame) -> pd.DataFrame:
+    """Fatura x kategori dağılımı (anomaly_engine'in category_breakdown artifact'i).
+    bill_summary pivotu da bu tablodan kurulur; bill_items tek kez gruplanır.
+    """
+    return (
+        bill_items.groupby(["bill_id","category"], dropna=False)
+          .agg(
+              category_total=("amount","sum"),
+              n_items=("item_id","count"),
+              unit_price_avg=("unit_price","mean"),
+              tax_rate_avg=("tax_rate","mean"),
+          ).reset_index()
+    )
+
+
+def build_bill_summary(dfs: Dict[str, pd.DataFrame],
+                       cat_breakdown: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     bh = dfs["bill_headers"].copy()
-    bi = dfs["bill_items"].copy()
     users = dfs["users"].copy()
+    if cat_breakdown is None:
+        cat_breakdown = build_category_breakdown(dfs["bill_items"])
 
     # Kategori pivotu (bill_id x category)
-    pivot = (
-        bi.groupby(["bill_id","category"], dropna=False)["amount"].sum()
-          .unstack(fill_value=0)
-    )
+    pivot = cat_breakdown.set_index(["bill_id","category"])["category_total"].unstack(fill_value=0)
     # Varsayılan kategorileri eksikse ekle
     for c in CATS:
         if c not in pivot.columns:
@@ -109,51 +192,120 @@ def build_bill_summary(dfs: Dict[str, pd.DataFrame]) -> pd.DataFrame:
     if "total_amount" in df.columns:
         df["diff_total_vs_items"] = (df["total_amount"] - df[[c for c in pivot.columns if c not in ("bill_id",)]].sum(axis=1)).round(2)
 
+    # Kalem toplamı (vergi dahil); anomaly_engine fatura toplamı baseline'ı için kullanır
+    df["items_total"] = df["bill_id"].map(cat_breakdown.groupby("bill_id")["category_total"].sum()).fillna(0.0)
+
     # Sıralama
     sort_cols = ["period_start","user_id","bill_id"]
     df = df.sort_values(sort_cols).reset_index(drop=True)
     return df
 
 
-def build_segment_stats(dfs: Dict[str, pd.DataFrame], bill_summary: pd.DataFrame) -> pd.DataFrame:
-    # Kullanım bazlı özet (aylık; user x month)
-    ud = dfs["usage_daily"].copy()
-    ud["period"] = ud["date"].dt.strftime("%Y-%m")
-    use_m = (
-        ud.groupby(["user_id","period"]).agg(
-            used_gb=("mb_used", lambda s: float(s.sum())/1024.0),
-            used_min=("minutes_used", "sum"),
-            used_sms=("sms_used", "sum"),
-            roaming_gb=("roaming_mb", lambda s: float(s.sum())/1024.0),
-        ).reset_index()
-    )
-
-    # User tiplerini bağla
-    users = dfs["users"][ ["user_id","type"] ].copy()
-    use_m = use_m.merge(users, on="user_id", how="left")
-
-    # Segment istatistikleri (aylık ortalamalar)
-    seg = (
-        use_m.groupby("type").agg(
-            mean_gb=("used_gb","mean"), std_gb=("used_gb","std"),
-            mean_min=("used_min","mean"), std_min=("used_min","std"),
-            mean_sms=("used_sms","mean"), std_sms=("used_sms","std"),
-            mean_roam_gb=("roaming_gb","mean"), std_roam_gb=("roaming_gb","std"),
-            n_users=("user_id","nunique"), n_user_months=("period","count")
-        ).reset_index()
-    )
-
-    # Harcama tarafı: kategori toplamları segment bazında
+# Kullanım metrikleri: çıktı adı -> (usage_daily kolonu, çarpan)
+USAGE_METRICS = {
+    "used_gb": ("mb_used", 1.0 / 1024.0),
+    "used_min": ("minutes_used", 1.0),
+    "used_sms": ("sms_used", 1.0),
+    "roaming_gb": ("roaming_mb", 1.0 / 1024.0),
+}
+USAGE_STATS = [("gb", "used_gb"), ("min", "used_min"), ("sms", "used_sms"), ("roam_gb", "roaming_gb")]
+QUANTILES = [0.5, 0.9]
+
+
+def user_month_usage(ud: pd.DataFrame) -> pd.DataFrame:
+    """usage_daily -> user x month toplamları (yerleşik sum; lambda yok).
+    period kolonu hazır gelirse (ör. sql_engine) yeniden hesaplanmaz.
+    """
+    if "period" not in ud.columns:
+        ud = ud.assign(period=ud["date"].dt.strftime("%Y-%m"))
+    src = [col for col, _ in USAGE_METRICS.values()]
+    use_m = ud.groupby(["user_id", "period"], sort=False)[src].sum().reset_index()
+    for name, (col, scale) in USAGE_METRICS.items():
+        use_m[name] = use_m[col].astype(float) * scale
+    return use_m[["user_id", "period"] + list(USAGE_METRICS)]
+
+
+def _fold_periods(state: SegmentState, dfs: Dict[str, pd.DataFrame], bill_summary: pd.DataFrame,
+                  periods: List[str]) -> None:
+    """Verilen dönemleri tek parça olarak duruma ekle (state.periods'a dokunmaz)."""
+    ud = dfs["usage_daily"]
+    months = ud["date"].dt.strftime("%Y-%m").isin(periods)
+    use_m = user_month_usage(ud[months]).merge(dfs["users"][["user_id", "type"]], on="user_id", how="left")
+    state.update(use_m, list(USAGE_METRICS), user_col="user_id", sketch_metrics=list(USAGE_METRICS))
+
+    # Harcama tarafı: kategori tutarları + fatura toplamı (fatura başına)
+    bills = bill_summary[bill_summary["period"].isin(periods)]
+    spend_cols = [c for c in bill_summary.columns if c in CATS] + ["total_amount"]
+    state.update(bills, spend_cols)
+
+
+def with_open_periods(state: SegmentState, open_periods: List[str],
+                      fold: Callable[[SegmentState, List[str]], None]) -> SegmentState:
+    """Açık dönemleri geçici bir parça olarak durumun üstüne ekle; state değişmez."""
+    if not open_periods:
+        return state
+    delta = SegmentState.empty(state.by, quantiles=state.sketch is not None)
+    fold(delta, open_periods)
+    return state.merge(delta)
+
+
+def update_segment_state(state: SegmentState, dfs: Dict[str, pd.DataFrame],
+                         bill_summary: pd.DataFrame, closed_through: Optional[str] = None) -> SegmentState:
+    """Durumda olmayan kapanmış dönemleri tek parça olarak işleyip state'e kalıcı olarak ekle.
+
+    Açık dönemler (en son dönem ya da closed_through'dan yeniler) state'e yazılmaz; her
+    çalıştırmada yeniden hesaplanıp dönen görünüme (segment_stats bunun üzerinden) eklenir.
+    Geçmiş dönemler yeniden taranmaz; kapanmış bir dönem bir kez işlendikten sonra atlanır.
+    """
+    ud = dfs["usage_daily"]
+    closed, open_periods = split_periods(
+        state, set(ud["date"].dt.strftime("%Y-%m").dropna()) | set(bill_summary["period"].dropna()), closed_through)
+
+    def fold(st: SegmentState, periods: List[str]) -> None:
+        _fold_periods(st, dfs, bill_summary, periods)
+
+    if closed:
+        fold(state, closed)
+        state.periods.update(closed)
+    return with_open_periods(state, open_periods, fold)
+
+
+def segment_stats_from_state(state: SegmentState, spend_cols: List[str],
+                             quantiles: Optional[List[float]] = None) -> pd.DataFrame:
+    """Durumdan segment_stats tablosu (kolonlar tam yeniden hesaplamayla aynı)."""
+    seg = pd.DataFrame(index=state.metric("used_gb").index)
+    for short, metric in USAGE_STATS:
+        m = state.metric(metric)
+        seg[f"mean_{short}"] = m["mean"]
+        seg[f"std_{short}"] = m["std"]
+    seg["n_users"] = state.n_users().reindex(seg.index).fillna(0).astype(int)
+    seg["n_user_months"] = state.metric("used_gb")["n"].astype(int)
+
+    for c in spend_cols:
+        seg[c] = state.metric(c)["mean"].reindex(seg.index)
+    seg["avg_bill_total"] = state.metric("total_amount")["mean"].reindex(seg.index)
+
+    if quantiles:
+        q = state.quantiles(quantiles)
+        for short, metric in USAGE_STATS:
+            part = q[q["metric"] == metric].set_index(state.by)
+            for qq in quantiles:
+                seg[f"p{int(round(qq * 100))}_{short}"] = part[qq].reindex(seg.index)
+
+    seg.index.name = state.by
+    return seg.sort_index().reset_index()
+
+
+def build_segment_stats(dfs: Dict[str, pd.DataFrame], bill_summary: pd.DataFrame,
+                        state: Optional[SegmentState] = None,
+                        quantiles: Optional[List[float]] = None,
+                        closed_through: Optional[str] = None) -> pd.DataFrame:
+    """Segment istatistikleri; state verilirse yalnızca yeni kapanmış dönemler eklenir."""
+    if state is None:
+        state = SegmentState.empty(quantiles=bool(quantiles))
+    view = update_segment_state(state, dfs, bill_summary, closed_through)
     spend_cols = [c for c in bill_summary.columns if c in CATS]
-    spend = (
-        bill_summary.groupby("type")[spend_cols + ["total_amount"]]
-            .mean(numeric_only=True)
-            .reset_index()
-            .rename(columns={"total_amount":"avg_bill_total"})
-    )
-
-    seg_stats = seg.merge(spend, on="type", how="left")
-    return seg_stats
+    return segment_stats_from_state(view, spend_cols, quantiles)
 
 
 def main():
@@ -162,16 +314,46 @@ def main():
     out = Path(args.out)
     out.mkdir(parents=True, exist_ok=True)
 
-    dfs = read_csvs(root)
-    dfs = standardize_types(dfs)
-
-    bill_summary = build_bill_summary(dfs)
-    seg_stats = build_segment_stats(dfs, bill_summary)
+    state_path = Path(args.state) if args.state else out/"segment_state.json"
+    quantiles = QUANTILES if args.quantiles else None
+    if args.closed_through and not re.fullmatch(r"\d{4}-\d{2}", args.closed_through):
+        raise SystemExit(f"--closed_through YYYY-MM biçiminde olmalı: {args.closed_through}")
+    if args.incremental and state_path.exists():
+        state = SegmentState.load(state_path)
+        if quantiles and state.sketch is None:
+            raise SystemExit("Kayıtlı durum çeyreklik sketch'i içermiyor; --incremental olmadan yeniden oluşturun.")
+    else:
+        state = SegmentState.empty(quantiles=bool(quantiles))
+
+    if args.engine == "duckdb":
+        try:
+            from general_scripts import sql_engine
+        except ImportError:  # betik olarak general_scripts/ içinden çalıştırıldığında
+            import sql_engine
+        if not sql_engine.available():
+            raise SystemExit("duckdb kurulu değil: pip install duckdb (ya da --engine pandas)")
+        cat_breakdown, bill_summary, seg_stats, parse_report = sql_engine.build_artifacts(
+            root, state, quantiles, memory_limit=args.memory_limit, closed_through=args.closed_through)
+    else:
+        parse_report: List[dict] = []
+        dfs = read_csvs(root, parse_report, "round_trip" if args.exact_floats else None)
+        dfs = standardize_types(dfs)
+
+        cat_breakdown = build_category_breakdown(dfs["bill_items"])
+        bill_summary = build_bill_summary(dfs, cat_breakdown)
+        seg_stats = build_segment_stats(dfs, bill_summary, state=state, quantiles=quantiles,
+                                        closed_through=args.closed_through)
 
     bill_summary.to_csv(out/"bill_summary.csv", index=False)
+    cat_breakdown.to_csv(out/"category_breakdown.csv", index=False)
     seg_stats.to_csv(out/"segment_stats.csv", index=False)
+    state.save(state_path)
+    (out/"parse_report.json").write_text(json.dumps(parse_report, ensure_ascii=False, indent=2), encoding="utf-8")
 
-    print("✓ Hazır: bill_summary.csv ve segment_stats.csv →", out.resolve())
+    print("✓ Hazır: bill_summary.csv, category_breakdown.csv ve segment_stats.csv →", out.resolve())
+    n_rejected = rejected_total(parse_report)
+    if n_rejected:
+        print(f"Uyarı: {n_rejected} sayısal değer ayrıştırılamadı (NaN) — ayrıntı: {out/'parse_report.json'}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""
+dataset_store.py — API için sürümlü veri anlık görüntüsü (snapshot) deposu
+
+Amaç:
+- data/ ve artifacts/ klasörlerinden tek bir "snapshot" nesnesi kurmak
+- Yeni faturalama ayı geldiğinde sunucuyu yeniden başlatmadan veriyi tazelemek
+
+Akış:
+  1) build_snapshot  -> tabloları tembel (lazy) tanımlayan yeni bir DatasetSnapshot üretir
+  2) validate_snapshot -> tabloları yükler, zorunlu tablo/kolon kontrolü yapar
+  3) DatasetStore.reload -> global referansı tek atamada (atomik) değiştirir
+
+Tablolar ilk erişimde okunur ve anahtar kolonlarına göre indekslenir (LazyTables);
+istenirse prewarm() ile arka planda önceden ısıtılır.
+
+Devam eden istekler başladıkları snapshot'ı tutmaya devam eder; snapshot'a bağlı
+önbellekler (snapshot.cache) yeni sürümle birlikte kendiliğinden geçersiz olur.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from general_scripts.anomaly_engine import ARTIFACT_TABLES, OPTIONAL_ARTIFACT_TABLES, read_artifact, prepare_artifact
+from general_scripts.whatif_engine import TABLES, OPTIONAL_TABLES, read_table, prepare_table
+
+# Snapshot'ın "hazır" sayılması için gerekli tablolar ve kolonlar
+REQUIRED_DATA = {
+    "users": ["user_id", "current_plan_id"],
+    "plans": ["plan_id"],
+    "bill_headers": ["bill_id", "user_id", "period", "period_start", "period_end", "total_amount"],
+    "bill_items": ["bill_id", "category", "amount"],
+    "usage_daily": ["user_id", "date"],
+    "add_on_packs": ["addon_id", "price"],
+}
+REQUIRED_ARTIFACTS = {
+    "bill_summary": ["bill_id", "user_id", "period", "total_amount"],
+    "category_breakdown": ["bill_id", "category", "category_total"],
+}
+
+# İlk erişimde kurulan satır indeksleri (tablo -> anahtar kolonlar)
+INDEX_KEYS = {
+    "users": ["user_id"],
+    "bill_headers": ["bill_id", "user_id"],
+    "bill_items": ["bill_id"],
+    "usage_daily": ["user_id"],
+    "bill_summary": ["user_id"],
+    "category_breakdown": ["bill_id"],
+    "anomalies": ["period"],
+}
+
+
+class LazyTables(Mapping):
+    """Tablo adı -> DataFrame eşlemesi; her tablo ilk erişimde yüklenir.
+
+    Yükleme iki aşamalıdır: read(name) (CSV ayrıştırma) ve prepare(name, df)
+    (tip dönüşümleri). Aynı tabloyu iki istek aynı anda isterse tek kez yüklenir.
+    """
+
+    def __init__(self, names: Iterable[str],
+                 read: Callable[[str], pd.DataFrame],
+                 prepare: Callable[[str, pd.DataFrame], pd.DataFrame],
+                 index_keys: Optional[Dict[str, List[str]]] = None):
+        self._names = list(names)
+        self._read = read
+        self._prepare = prepare
+        self._index_keys = index_keys or {}
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._indexes: Dict[tuple, Dict[Any, np.ndarray]] = {}
+        self._locks = {n: threading.Lock() for n in self._names}
+        self.stats: Dict[str, Dict[str, Any]] = {n: {} for n in self._names}
+
+    # --- Mapping arayüzü (üyelik/len yükleme tetiklemez) ---
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        df = self._frames.get(name)
+        if df is not None:
+            return df
+        if name not in self._locks:
+            raise KeyError(name)
+        with self._locks[name]:
+            if name not in self._frames:
+                self._load(name)
+        return self._frames[name]
+
+    def __contains__(self, name) -> bool:
+        return name in self._locks
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _load(self, name: str) -> None:
+        st = self.stats[name]
+        try:
+            t0 = time.perf_counter()
+            df = self._read(name)
+            t1 = time.perf_counter()
+            df = self._prepare(name, df)
+            t2 = time.perf_counter()
+        except Exception as e:
+            st["error"] = str(e)
+            raise
+        st.update({"rows": int(len(df)), "parse_s": round(t1 - t0, 4), "prepare_s": round(t2 - t1, 4)})
+        st.pop("error", None)
+        self._frames[name] = df
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._frames
+
+    # --- indeksler ---
+    def index(self, name: str, key: str) -> Dict[Any, np.ndarray]:
+        """key değeri -> satır pozisyonları (groupby.indices); ilk çağrıda kurulur."""
+        idx = self._indexes.get((name, key))
+        if idx is not None:
+            return idx
+        df = self[name]
+        with self._locks[name]:
+            idx = self._indexes.get((name, key))
+            if idx is None:
+                t0 = time.perf_counter()
+                idx = df.groupby(key, sort=False).indices
+                self._indexes[(name, key)] = idx
+                st = self.stats[name]
+                st["index_s"] = round(st.get("index_s", 0.0) + time.perf_counter() - t0, 4)
+        return idx
+
+    def rows(self, name: str, key: str, value: Any) -> pd.DataFrame:
+        """df[df[key] == value] eşdeğeri; tam tarama yerine indeks kullanır."""
+        df = self[name]
+        pos = self.index(name, key).get(value)
+        if pos is None:
+            return df.iloc[0:0]
+        return df.iloc[pos]
+
+    def prewarm(self, names: Optional[Iterable[str]] = None) -> None:
+        """Tabloları (ve tanımlı indekslerini) şimdi yükle."""
+        for name in (names or self._names):
+            self[name]
+            for key in self._index_keys.get(name, []):
+                if key in self[name].columns:
+                    self.index(name, key)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """Tablo bazında hazır olma durumu (/health için)."""
+        out = {}
+        for name in self._names:
+            st = dict(self.stats[name])
+            st["ready"] = name in self._frames
+            out[name] = st
+        return out
+
+    @property
+    def ready(self) -> bool:
+        return all(n in self._frames for n in self._names)
+
+
+@dataclass
+class DatasetSnapshot:
+    version: str
+    data: Mapping = field(default_factory=dict)
+    artifacts: Mapping = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.time)
+    warnings: list = field(default_factory=list)
+    # Sürüme bağlı önbellek: snapshot değişince eskisiyle birlikte atılır
+    cache: Dict[Hashable, Any] = field(default_factory=dict)
+    # İstekten gelen anahtarlar için sınırlı (LRU) önbellek
+    lru: "OrderedDict[Hashable, Any]" = field(default_factory=OrderedDict)
+
+    def memo(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Anahtar önbellekte yoksa fn() ile hesapla ve sakla."""
+        try:
+            return self.cache[key]
+        except KeyError:
+            value = fn()
+            self.cache[key] = value
+            return value
+
+    def memo_lru(self, key: Hashable, fn: Callable[[], Any], max_entries: int) -> Any:
+        """memo gibi; anahtar istekten geliyorsa en fazla max_entries sonuç tutulur (LRU)."""
+        try:
+            self.lru.move_to_end(key)
+            return self.lru[key]
+        except KeyError:
+            value = fn()
+            self.lru[key] = value
+            while len(self.lru) > max_entries:
+                self.lru.popitem(last=False)
+            return value
+
+    def prewarm(self) -> None:
+        for tables in (self.data, self.artifacts):
+            if isinstance(tables, LazyTables):
+                tables.prewarm()
+
+    def table_status(self) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        for tables in (self.data, self.artifacts):
+            if isinstance(tables, LazyTables):
+                out.update(tables.status())
+        return out
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "loaded_at": pd.Timestamp(self.loaded_at, unit="s").isoformat(),
+            "data_tables": sorted(self.data),
+            "artifact_tables": sorted(self.artifacts),
+            "cache_entries": len(self.cache),
+            "warnings": list(self.warnings),
+        }
+
+
+def fingerprint(*dirs: Path) -> str:
+    """Klasörlerdeki CSV'lerin ad/boyut/mtime bilgisinden kısa bir sürüm anahtarı üret."""
+    h = hashlib.sha1()
+    for d in dirs:
+        if not d.exists():
+            continue
+        for p in sorted(d.glob("*.csv")):
+            st = p.stat()
+            h.update(f"{p.name}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()[:12]
+
+
+def build_snapshot(data_dir: Path, artifacts_dir: Path) -> DatasetSnapshot:
+    """data/ ve artifacts/ için tembel tablo tanımlarıyla yeni bir snapshot kur.
+
+    Hiçbir CSV burada okunmaz; global durum değişmez.
+    """
+    version = fingerprint(data_dir, artifacts_dir)
+    snap = DatasetSnapshot(version=version)
+
+    if data_dir.exists():
+        missing = [n for n in TABLES if not (data_dir / f"{n}.csv").exists()]
+        if missing:
+            snap.warnings.append(f"Veri yüklenemedi, eksik dosyalar: {missing}")
+        else:
+            names = TABLES + [n for n in OPTIONAL_TABLES if (data_dir / f"{n}.csv").exists()]
+            snap.data = LazyTables(names, lambda n: read_table(data_dir, n), prepare_table, INDEX_KEYS)
+
+    if artifacts_dir.exists():
+        missing = [n for n in ARTIFACT_TABLES if not (artifacts_dir / f"{n}.csv").exists()]
+        if missing:
+            snap.warnings.append(f"Artifacts yüklenemedi, eksik dosyalar: {missing}")
+        else:
+            names = ARTIFACT_TABLES + [n for n in OPTIONAL_ARTIFACT_TABLES if (artifacts_dir / f"{n}.csv").exists()]
+            snap.artifacts = LazyTables(names, lambda n: read_artifact(artifacts_dir, n),
+                                        prepare_artifact, INDEX_KEYS)
+    return snap
+
+
+def _check_tables(tables: Mapping, required: Dict[str, list]) -> list:
+    errors = []
+    for name, cols in required.items():
+        if name not in tables:
+            errors.append(f"{name}: tablo yok")
+            continue
+        try:
+            df = tables[name]
+        except Exception as e:
+            errors.append(f"{name}: okunamadı ({e})")
+            continue
+        if df.empty:
+            errors.append(f"{name}: tablo boş")
+        missing = [c for c in cols if c not in df.columns]
+        if missing:
+            errors.append(f"{name}: eksik kolonlar {missing}")
+    return errors
+
+
+def validate_snapshot(snap: DatasetSnapshot, previous: Optional[DatasetSnapshot] = None) -> None:
+    """Snapshot yayına alınabilir mi? Değilse ValueError fırlatır.
+
+    Kontrol için tüm tablolar yüklenir (yani snapshot ısınmış olur). Yüklenen her tablo
+    grubu zorunlu kolonları içermeli; önceki snapshot'ta olan bir grup (data/artifacts)
+    yenisinde kaybolmamalı.
+    """
+    errors = []
+    if snap.data:
+        errors += _check_tables(snap.data, REQUIRED_DATA)
+    if snap.artifacts:
+        errors += _check_tables(snap.artifacts, REQUIRED_ARTIFACTS)
+    if previous is not None:
+        if previous.data and not snap.data:
+            errors.append("data: yeni snapshot'ta veri yok")
+        if previous.artifacts and not snap.artifacts:
+            errors.append("artifacts: yeni snapshot'ta artifact yok")
+    if errors:
+        raise ValueError("; ".join(errors))
+
+
+class DatasetStore:
+    """Geçerli snapshot'a tek referans tutar; reload() ile atomik değiştirir."""
+
+    def __init__(self, data_dir: Path, artifacts_dir: Path):
+        self.data_dir = Path(data_dir)
+        self.artifacts_dir = Path(artifacts_dir)
+        self._current = DatasetSnapshot(version="empty")
+        self._reload_lock = threading.Lock()
+        self.last_error: Optional[str] = None
+        self.last_reload_s: Optional[float] = None
+
+    @property
+    def current(self) -> DatasetSnapshot:
+        return self._current
+
+    @property
+    def reloading(self) -> bool:
+        return self._reload_lock.locked()
+
+    def changed(self) -> bool:
+        """Diskteki dosyalar geçerli snapshot'tan farklı mı?"""
+        return fingerprint(self.data_dir, self.artifacts_dir) != self._current.version
+
+    def open(self) -> DatasetSnapshot:
+        """Başlangıç için: tabloları yüklemeden tembel snapshot'ı hemen yayına al."""
+        with self._reload_lock:
+            self._current = build_snapshot(self.data_dir, self.artifacts_dir)
+            return self._current
+
+    def reload(self, force: bool = False) -> DatasetSnapshot:
+        """Yeni snapshot kur, yükleyip doğrula ve yayına al.
+
+        Bloklayan çağrıdır (thread'de çalıştırın). Aynı anda tek reload çalışır; doğrulama
+        başarısızsa eski snapshot yerinde kalır.
+        """
+        with self._reload_lock:
+            if not force and self._current.version == fingerprint(self.data_dir, self.artifacts_dir):
+                return self._current
+            t0 = time.perf_counter()
+            try:
+                snap = build_snapshot(self.data_dir, self.artifacts_dir)
+                validate_snapshot(snap, previous=self._current)
+                snap.prewarm()  # yayına girmeden önce tüm tablo/indeksler hazır
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            self._current = snap  # tek atama: okuyucular ya eskiyi ya yeniyi görür
+            self.last_error = None
+            self.last_reload_s = round(time.perf_counter() - t0, 3)
+            return snap
+
+    def prewarm(self) -> None:
+        """Geçerli snapshot'ın tüm tablo ve indekslerini yükle (arka plan görevi için)."""
+        self._current.prewarm()
+
+    def status(self) -> Dict[str, Any]:
+        out = self._current.info()
+        out.update({
+            "reloading": self.reloading,
+            "last_error": self.last_error,
+            "last_reload_s": self.last_reload_s,
+        })
+        return out
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+detectors.py — Takılabilir (plug-in) anomali dedektörleri
+
+Her dedektör (kullanıcı, kategori) başına sabit boyutlu bir durum tutar ve dönem
+kapandıkça `update` ile artımlı güncellenir; geçmişin yeniden taranması gerekmez.
+
+    det = get_detector("mad")
+    state = det.new_state()
+    for value in closed_period_totals:      # kategori o faturada yoksa None
+        state = det.update(state, value)
+    anomaly = det.score("premium_sms", current_total, state)   # dict veya None
+
+Dedektörler:
+- zscore: anomaly_engine'in mevcut kuralı (son BASELINE_MONTHS fatura, mean/std, PCT_THRESH)
+- ewma:   üstel ağırlıklı ortalama/varyans (3 sayı); z = (x - μ) / max(σ, taban)
+- mad:    son MAD_WINDOW değerin medyanı ve MAD'i; robust z = 0.6745·(x - medyan) / max(MAD, taban)
+
+Eşikler (min_tl, zscore için z/pct) dedektöre verilen AnomalyConfig'ten okunur.
+Taban (spread floor) = max(min_tl, %10·|merkez|): sabit tutarlı geçmişte (ör. aylık VAS)
+küçük oynamaların sonsuz z üretmesini engeller.
+
+Karşılaştırma (mock üreticinin son ayda enjekte ettiği premium SMS patlamaları):
+    python -m general_scripts.detectors --benchmark --seeds 1 2 3 4 5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+try:
+    from general_scripts import anomaly_engine as ae
+except ImportError:  # betik olarak general_scripts/ içinden çalıştırıldığında
+    import anomaly_engine as ae
+
+EWMA_ALPHA = 0.3
+EWMA_K = 3.0
+MAD_WINDOW = 6
+MAD_K = 3.5
+
+
+def _floor(center: float, min_tl: float) -> float:
+    return max(min_tl, 0.1 * abs(center))
+
+
+class Detector:
+    name = "base"
+
+    def __init__(self, config: Optional[ae.AnomalyConfig] = None):
+        self.config = config or ae.DEFAULT_CONFIG
+
+    def new_state(self):
+        raise NotImplementedError
+
+    def update(self, state, value: Optional[float]):
+        """Kapanan dönemin kategori toplamını duruma ekle (kategori yoksa None)."""
+        raise NotImplementedError
+
+    def score(self, cat: str, value: float, state) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _robust_score(self, cat: str, value: float, center: float, spread: float, count: int,
+                      prev_small: bool, k: float, label: str) -> Optional[Dict[str, Any]]:
+        """ewma/mad ortak kuralı: ilk kez görülme + robust z + hassas kategoriler."""
+        min_tl = self.config.min_tl
+        z = (value - center) / max(spread, _floor(center, min_tl)) if count else None
+        pct_delta = (value - center) / center if center >= min_tl else None
+        reasons = []
+        if count == 0 and value >= min_tl:
+            reasons.append("İlk kez görüldü")
+        elif value >= min_tl and z is not None and z >= k:
+            reasons.append(f"{label} {z:.2f} (≥ {k})")
+        if cat in ae.SENSITIVE_CATEGORIES and value >= min_tl and prev_small and count:
+            reasons.append("Önceki aylarda yoktu/çok düşüktü, bu ay var")
+        if not reasons:
+            return None
+        return {
+            "category": cat,
+            "amount": round(value, 2),
+            "baseline_mean": round(center, 2),
+            "baseline_std": round(spread, 2) if spread else None,
+            "z": round(z, 2) if z is not None else None,
+            "pct_delta": round(pct_delta, 3) if pct_delta is not None else None,
+            "reason": "; ".join(reasons),
+            "suggested_action": ae.SUGGEST_ACTION.get(cat, "Gözden geçir"),
+            "detector": self.name,
+        }
+
+
+class ZScoreDetector(Detector):
+    """Mevcut kural: son BASELINE_MONTHS faturadaki (kategori varsa) değerler."""
+    name = "zscore"
+
+    def __init__(self, window: Optional[int] = None, config: Optional[ae.AnomalyConfig] = None):
+        super().__init__(config)
+        self.window = window or ae.BASELINE_MONTHS
+
+    def new_state(self):
+        return deque(maxlen=self.window)
+
+    def update(self, state, value):
+        state.append(value)
+        return state
+
+    def score(self, cat, value, state):
+        vals = [v for v in state if v is not None]
+        count = len(vals)
+        mean = float(np.mean(vals)) if count else 0.0
+        std = float(np.std(vals, ddof=1)) if count > 1 else 0.0
+        out = ae.score_category(cat, value, mean, std, count, float(sum(vals)), config=self.config)
+        if out is not None:
+            out["detector"] = self.name
+        return out
+
+
+class EWMADetector(Detector):
+    """Durum: [n, μ, σ²] — üstel ağırlıklı (West/Finch artımlı formülü)."""
+    name = "ewma"
+
+    def __init__(self, alpha: float = EWMA_ALPHA, k: float = EWMA_K,
+                 config: Optional[ae.AnomalyConfig] = None):
+        super().__init__(config)
+        self.alpha = alpha
+        self.k = k
+
+    def new_state(self):
+        return [0, 0.0, 0.0]
+
+    def update(self, state, value):
+        if value is None:
+            return state
+        n, mean, var = state
+        if n == 0:
+            return [1, float(value), 0.0]
+        diff = value - mean
+        incr = self.alpha * diff
+        return [n + 1, mean + incr, (1.0 - self.alpha) * (var + diff * incr)]
+
+    def score(self, cat, value, state):
+        n, mean, var = state
+        return self._robust_score(cat, value, mean, math.sqrt(max(var, 0.0)), n,
+                                  prev_small=mean < self.config.min_tl, k=self.k, label="EWMA z")
+
+
+class MADDetector(Detector):
+    """Durum: son `window` değer (sabit boyutlu halka tampon)."""
+    name = "mad"
+
+    def __init__(self, window: int = MAD_WINDOW, k: float = MAD_K,
+                 config: Optional[ae.AnomalyConfig] = None):
+        super().__init__(config)
+        self.window = window
+        self.k = k
+
+    def new_state(self):
+        return deque(maxlen=self.window)
+
+    def update(self, state, value):
+        if value is not None:
+            state.append(float(value))
+        return state
+
+    def score(self, cat, value, state):
+        count = len(state)
+        if count:
+            vals = np.fromiter(state, dtype=float, count=count)
+            med = float(np.median(vals))
+            # 1.4826·MAD ≈ σ (normal dağılımda); robust z = (x - medyan) / (1.4826·MAD)
+            spread = 1.4826 * float(np.median(np.abs(vals - med)))
+            prev_small = float(vals.sum()) < self.config.min_tl
+        else:
+            med, spread, prev_small = 0.0, 0.0, True
+        return self._robust_score(cat, value, med, spread, count,
+                                  prev_small=prev_small, k=self.k, label="robust z")
+
+
+DETECTORS = {
+    "zscore": ZScoreDetector,
+    "ewma": EWMADetector,
+    "mad": MADDetector,
+}
+
+
+def get_detector(name: str, **kwargs) -> Detector:
+    try:
+        return DETECTORS[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"Bilinmeyen dedektör: {name} (seçenekler: {', '.join(DETECTORS)})")
+
+
+def score_history(det: Detector, cat: str, history: Iterable[Optional[float]], current: float):
+    """Geçmiş değerleri sırayla besleyip güncel değeri puanla (toplu yol)."""
+    state = det.new_state()
+    for v in history:
+        state = det.update(state, v)
+    return det.score(cat, current, state)
+
+
+# ==============================
+# Benchmark (mock üretici enjekte anomalileri)
+# ==============================
+def _generate(seed: int, n_users: int, n_months: int, anom_rate: float):
+    from data_generator_scripts import mock_data_generator as mdg
+
+    rng = np.random.default_rng(seed)
+    plans, _, vas_catalog, premium_sms_catalog = mdg.build_catalogs(seed)
+    users = mdg.build_users(n_users, plans, rng=rng)
+    months = mdg.month_range(n_months)
+    usage = mdg.simulate_usage(users, months, rng=rng)
+    anom_users = mdg.pick_anomaly_users(users, anom_rate, rng=rng)
+    headers, items = mdg.build_billing(users, plans, usage, months, vas_catalog, premium_sms_catalog,
+                                       anom_users=anom_users, rng=rng)
+    return headers, items, anom_users
+
+
+def benchmark(seeds: Sequence[int], n_users: int = 200, n_months: int = 6,
+              anom_rate: float = 0.25) -> Dict[str, Any]:
+    """Son ay premium_sms patlamaları üzerinde precision/recall + durum boyutu + süre."""
+    results = {name: {"tp": 0, "fp": 0, "fn": 0, "other_flags": 0, "updates": 0, "seconds": 0.0}
+               for name in DETECTORS}
+    labels = 0
+    for seed in seeds:
+        headers, items, anom_users = _generate(seed, n_users, n_months, anom_rate)
+        items = items[items["category"] != "tax"]
+        totals = items.groupby(["bill_id", "category"])["amount"].sum().to_dict()
+        last_period = headers["period_start"].max()
+        cats = sorted(items["category"].unique())
+        for user_id, bills in headers.sort_values("period_start").groupby("user_id"):
+            bill_ids = bills["bill_id"].tolist()
+            cur_bill, prior = bill_ids[-1], bill_ids[:-1]
+            if bills["period_start"].iloc[-1] != last_period:
+                continue
+            for cat in cats:
+                cur = totals.get((cur_bill, cat))
+                if cur is None:
+                    continue
+                is_label = cat == "premium_sms" and user_id in anom_users
+                labels += int(is_label)
+                history = [totals.get((b, cat)) for b in prior]
+                for name in DETECTORS:
+                    det = get_detector(name)
+                    t0 = time.perf_counter()
+                    flagged = score_history(det, cat, history, cur) is not None
+                    r = results[name]
+                    r["seconds"] += time.perf_counter() - t0
+                    r["updates"] += len(history) + 1
+                    if cat != "premium_sms":
+                        r["other_flags"] += int(flagged)
+                    elif flagged and is_label:
+                        r["tp"] += 1
+                    elif flagged:
+                        r["fp"] += 1
+                    elif is_label:
+                        r["fn"] += 1
+
+    for name, r in results.items():
+        p = r["tp"] / (r["tp"] + r["fp"]) if (r["tp"] + r["fp"]) else 0.0
+        rc = r["tp"] / (r["tp"] + r["fn"]) if (r["tp"] + r["fn"]) else 0.0
+        det = get_detector(name)
+        state = det.new_state()
+        for v in range(100):
+            state = det.update(state, float(v))
+        r.update({
+            "precision": round(p, 3),
+            "recall": round(rc, 3),
+            "f1": round(2 * p * rc / (p + rc), 3) if (p + rc) else 0.0,
+            "us_per_update": round(1e6 * r.pop("seconds") / max(r.pop("updates"), 1), 2),
+            "state_values": len(state),
+        })
+    return {"seeds": list(seeds), "n_users": n_users, "n_months": n_months,
+            "injected_premium_bursts": labels, "detectors": results}
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--benchmark", action="store_true", help="Dedektörleri mock üretici verisiyle karşılaştır")
+    ap.add_argument("--seeds", type=int, nargs="+", default=[1, 2, 3])
+    ap.add_argument("--n_users", type=int, default=200)
+    ap.add_argument("--n_months", type=int, default=6)
+    ap.add_argument("--anom_rate", type=float, default=0.25)
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.benchmark:
+        print("Dedektörler:", ", ".join(DETECTORS))
+        return
+    print(json.dumps(benchmark(args.seeds, args.n_users, args.n_months, args.anom_rate),
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+fast_json.py — Büyük API yanıtları için hızlı JSON serileştirme
+
+- frame_records: DataFrame'i kolon bazında (vektörel) düz Python listelerine çevirip
+  kayıtlara dönüştürür; to_dict("records") + jsonable_encoder yolundaki satır satır
+  tip dönüşümünü atlar. Timestamp -> ISO metin, NaN/NaT -> null, NumPy -> yerel tipler.
+- dumps: orjson varsa onunla, yoksa standart json ile bayt üretir.
+- FastJSONResponse: içeriği doğrudan bayta çeviren ham yanıt sınıfı.
+- iter_frame_json: liste endpoint'leri için parça parça (streaming) JSON dizi üretici.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+from fastapi.responses import Response
+
+try:  # opsiyonel hızlı JSON kütüphanesi
+    import orjson
+except ImportError:  # pragma: no cover - orjson yoksa standart json
+    orjson = None
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+STREAM_CHUNK_ROWS = 5000
+
+
+def _default(obj: Any):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat() if obj is not pd.NaT else None
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"JSON'a çevrilemeyen tip: {type(obj).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _column_values(s: pd.Series) -> List[Any]:
+    """Tek kolonu JSON'a hazır yerel Python değer listesine çevir (vektörel)."""
+    if isinstance(s.dtype, np.dtype) and s.dtype.kind == "M":  # tz'siz datetime64
+        # C düzeyinde ISO metin (YYYY-MM-DDTHH:MM:SS), strftime'dan çok daha hızlı
+        out = np.datetime_as_string(s.to_numpy(dtype="datetime64[s]"), unit="s").astype(object)
+        if s.isna().any():
+            out[s.isna().to_numpy()] = None
+        return out.tolist()
+    if pd.api.types.is_datetime64_any_dtype(s):  # tz'li kolonlar
+        out = s.dt.strftime(ISO_FORMAT)
+        return out.where(s.notna(), None).tolist()
+    if pd.api.types.is_float_dtype(s):
+        if s.isna().any():
+            return s.astype(object).where(s.notna(), None).tolist()
+        return s.tolist()
+    if pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s):
+        return s.tolist()
+    # object/string: NaN -> None
+    return s.astype(object).where(s.notna(), None).tolist()
+
+
+def frame_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """df.to_dict("records") eşdeğeri; kolon bazında dönüştürür, tipler JSON'a hazırdır."""
+    cols = [str(c) for c in df.columns]
+    values = [_column_values(df[c]) for c in df.columns]
+    return [dict(zip(cols, row)) for row in zip(*values)]
+
+
+def frame_to_json(df: pd.DataFrame) -> bytes:
+    return dumps(frame_records(df))
+
+
+def iter_frame_json(df: pd.DataFrame, chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    """DataFrame'i JSON dizisi olarak parça parça üret (StreamingResponse için)."""
+    yield b"["
+    for i, start in enumerate(range(0, len(df), chunk_rows)):
+        chunk = frame_to_json(df.iloc[start:start + chunk_rows])
+        if i:
+            yield b","
+        yield chunk[1:-1]  # parçanın kendi [ ] ayraçlarını at
+    yield b"]"
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray)):
+            return bytes(content)
+        return dumps(content)
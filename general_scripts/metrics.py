@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+metrics.py — API istek metrikleri (Prometheus metin formatı)
+
+- Endpoint bazında gecikme histogramı (api_request_duration_seconds)
+- Handler içi aşama süreleri: span("lookup"), span("llm") ... (api_stage_duration_seconds)
+- Taranan satır sayısı: rows_scanned(n) (api_rows_scanned_total)
+- İsteğe bağlı örnekleyici profil: SamplingProfiler, isteğin çalıştığı thread'in
+  yığınını belirli aralıklarla okuyup en sık görülen fonksiyonları sayar
+
+Kullanım (handler içinde):
+    with span("lookup"):
+        items = ...
+    rows_scanned(len(items))
+"""
+from __future__ import annotations
+
+import contextvars
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        out, acc = [], 0
+        for b, c in zip(self.buckets, self.counts):
+            acc += c
+            out.append((repr(b), acc))
+        out.append(("+Inf", self.count))
+        return out
+
+
+@dataclass
+class RequestMetrics:
+    """Tek bir isteğin handler içinde topladığı aşama süreleri ve satır sayısı."""
+    stages: Dict[str, float] = field(default_factory=dict)
+    rows: int = 0
+
+
+_current: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar("request_metrics", default=None)
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**kw) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in kw.items()) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str], Histogram] = {}
+        self.status: Counter = Counter()
+        self.stages: Dict[Tuple[str, str], Histogram] = {}
+        self.rows: Counter = Counter()
+
+    def observe_request(self, method: str, endpoint: str, status: int, seconds: float,
+                        req: Optional[RequestMetrics] = None) -> None:
+        with self._lock:
+            self.requests.setdefault((method, endpoint), Histogram()).observe(seconds)
+            self.status[(method, endpoint, str(status))] += 1
+            if req is not None:
+                for stage, sec in req.stages.items():
+                    self.stages.setdefault((endpoint, stage), Histogram()).observe(sec)
+                if req.rows:
+                    self.rows[endpoint] += req.rows
+
+    def render(self) -> str:
+        """Prometheus text exposition formatı (0.0.4)."""
+        lines = []
+        with self._lock:
+            lines += ["# HELP api_request_duration_seconds Request latency per endpoint.",
+                      "# TYPE api_request_duration_seconds histogram"]
+            for (method, endpoint), h in sorted(self.requests.items()):
+                for le, c in h.cumulative():
+                    lines.append(f"api_request_duration_seconds_bucket{_labels(method=method, endpoint=endpoint, le=le)} {c}")
+                lines.append(f"api_request_duration_seconds_sum{_labels(method=method, endpoint=endpoint)} {h.sum:.6f}")
+                lines.append(f"api_request_duration_seconds_count{_labels(method=method, endpoint=endpoint)} {h.count}")
+
+            lines += ["# HELP api_requests_total Requests by endpoint and status code.",
+                      "# TYPE api_requests_total counter"]
+            for (method, endpoint, status), c in sorted(self.status.items()):
+                lines.append(f"api_requests_total{_labels(method=method, endpoint=endpoint, status=status)} {c}")
+
+            lines += ["# HELP api_stage_duration_seconds Time spent in named stages inside handlers.",
+                      "# TYPE api_stage_duration_seconds histogram"]
+            for (endpoint, stage), h in sorted(self.stages.items()):
+                for le, c in h.cumulative():
+                    lines.append(f"api_stage_duration_seconds_bucket{_labels(endpoint=endpoint, stage=stage, le=le)} {c}")
+                lines.append(f"api_stage_duration_seconds_sum{_labels(endpoint=endpoint, stage=stage)} {h.sum:.6f}")
+                lines.append(f"api_stage_duration_seconds_count{_labels(endpoint=endpoint, stage=stage)} {h.count}")
+
+            lines += ["# HELP api_rows_scanned_total DataFrame rows scanned by handlers.",
+                      "# TYPE api_rows_scanned_total counter"]
+            for endpoint, c in sorted(self.rows.items()):
+                lines.append(f"api_rows_scanned_total{_labels(endpoint=endpoint)} {c}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def begin_request() -> Tuple[RequestMetrics, contextvars.Token]:
+    req = RequestMetrics()
+    return req, _current.set(req)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+@contextmanager
+def span(stage: str):
+    """Handler içindeki bir aşamanın süresini geçerli isteğe yaz (istek dışında no-op)."""
+    req = _current.get()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if req is not None:
+            req.stages[stage] = req.stages.get(stage, 0.0) + (time.perf_counter() - t0)
+
+
+def rows_scanned(n: int) -> None:
+    req = _current.get()
+    if req is not None:
+        req.rows += int(n)
+
+
+class SamplingProfiler:
+    """Hedef thread'in yığınını `interval` saniyede bir örnekler (sys._current_frames).
+
+    Deterministik profilleyicilerin aksine çalışan koda ek yük bindirmez; async
+    handler'larda event loop thread'i örneklendiği için aynı anda çalışan diğer
+    isteklerin kareleri de görülebilir.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.002, max_depth: int = 30):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            seen = set()
+            depth = 0
+            leaf = True
+            while frame is not None and depth < self.max_depth:
+                code = frame.f_code
+                key = f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+                if leaf:
+                    self.self_counts[key] += 1
+                    leaf = False
+                if key not in seen:
+                    self.total_counts[key] += 1
+                    seen.add(key)
+                frame = frame.f_back
+                depth += 1
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def report(self, top: int = 20) -> Dict[str, object]:
+        n = max(self.samples, 1)
+        return {
+            "samples": self.samples,
+            "interval_s": self.interval,
+            "top_self": [{"frame": k, "pct": round(100.0 * c / n, 1)} for k, c in self.self_counts.most_common(top)],
+            "top_total": [{"frame": k, "pct": round(100.0 * c / n, 1)} for k, c in self.total_counts.most_common(top)],
+        }
+
+
+# Son profiller (bellek sınırlı)
+RECENT_PROFILES: Deque[Dict[str, object]] = deque(maxlen=50)
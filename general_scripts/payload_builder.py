@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+payload_builder.py — Explain payload'ı için tek ve ortak üretici
+
+Payload şeması (rules_engine / llm_client girişi):
+{
+  "summary": {"period", "total", "taxes", "usage_summary", "baseline_total_mean", "total_delta"},
+  "breakdown": [{"category", "total", "lines": [{"text", "amount"}]}],
+  "contributors": [{"category", "current", "baseline_mean", "delta"}]
+}
+
+PayloadBuilder indeksli veri seti (dataset_store.LazyTables veya düz dict) üzerinde
+çalışır; her bölüm ilk istendiğinde hesaplanır ve fatura bazında saklanır. API,
+run_rules_demo_v2 ve cohort/tax endpoint'leri aynı sonucu birkaç anahtarlı erişimle alır.
+
+Kullanım:
+    builder = PayloadBuilder(load_all(Path("data")))
+    payload = builder.payload(builder.bill_id_for(1001, "2025-07"))
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Hashable, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from general_scripts.anomaly_engine import BASELINE_MONTHS, EXCLUDE_CATEGORIES
+from general_scripts.breakdown import build_breakdown
+
+# rules_engine'in beklediği kategori etiketleri (pay/birim maliyet/vergi kuralları)
+RULES_CATEGORY_LABELS = {
+    "data": "Data",
+    "voice": "Voice",
+    "sms": "SMS",
+    "roaming": "Roaming",
+    "premium_sms": "Premium",
+    "vas": "VAS",
+    "tax": "Vergiler",
+    "one_off": "Other",
+    "discount": "Other",
+}
+
+
+class PayloadBuilder:
+    def __init__(self, data: Mapping[str, pd.DataFrame], baseline_months: int = BASELINE_MONTHS,
+                 max_entries: int = 100_000):
+        self.data = data
+        self.baseline_months = baseline_months
+        self.max_entries = max_entries
+        self._memo: Dict[Hashable, Any] = {}
+
+    # --- yardımcılar ---
+    def _cached(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        try:
+            return self._memo[key]
+        except KeyError:
+            if len(self._memo) >= self.max_entries:
+                self._memo.clear()
+            value = self._memo[key] = fn()
+            return value
+
+    def _rows(self, table: str, key: str, value: Any) -> pd.DataFrame:
+        if hasattr(self.data, "rows"):
+            return self.data.rows(table, key, value)
+        df = self.data[table]
+        return df[df[key] == value]
+
+    # --- anahtarlı erişimler ---
+    def user_bills(self, user_id: int) -> pd.DataFrame:
+        """Kullanıcının faturaları, dönem sırasına göre."""
+        return self._cached(("user_bills", user_id),
+                            lambda: self._rows("bill_headers", "user_id", user_id).sort_values("period_start"))
+
+    def bill_id_for(self, user_id: int, period: Optional[str] = None) -> Optional[int]:
+        """(user_id, period) -> bill_id; period verilmezse son dönem."""
+        bills = self.user_bills(user_id)
+        if period is not None:
+            bills = bills[bills["period"] == str(period)[:7]]
+        if bills.empty:
+            return None
+        return int(bills["bill_id"].iloc[-1])
+
+    def header(self, bill_id: int) -> pd.Series:
+        def _get():
+            rows = self._rows("bill_headers", "bill_id", bill_id)
+            if rows.empty:
+                raise KeyError(f"bill_id={bill_id} bulunamadı")
+            return rows.iloc[0]
+        return self._cached(("header", bill_id), _get)
+
+    def items(self, bill_id: int) -> pd.DataFrame:
+        return self._cached(("items", bill_id), lambda: self._rows("bill_items", "bill_id", bill_id))
+
+    def history(self, bill_id: int) -> pd.DataFrame:
+        """Aynı kullanıcının bu faturadan önceki en fazla `baseline_months` faturası."""
+        def _get():
+            h = self.header(bill_id)
+            bills = self.user_bills(int(h["user_id"]))
+            prev = bills[bills["period_start"] < h["period_start"]]
+            return prev.tail(self.baseline_months)
+        return self._cached(("history", bill_id), _get)
+
+    def category_totals(self, bill_id: int) -> Dict[str, float]:
+        def _get():
+            items = self.items(bill_id)
+            if items.empty:
+                return {}
+            return {str(k): float(v) for k, v in items.groupby("category", sort=False)["amount"].sum().items()}
+        return self._cached(("category_totals", bill_id), _get)
+
+    # --- payload bölümleri ---
+    def usage_summary(self, bill_id: int) -> Dict[str, float]:
+        def _get():
+            h = self.header(bill_id)
+            usage = self._rows("usage_daily", "user_id", h["user_id"])
+            u = usage[(usage["date"] >= h["period_start"]) & (usage["date"] <= h["period_end"])]
+            return {
+                "gb": float(u["mb_used"].sum()) / 1024.0,
+                "minutes": float(u["minutes_used"].sum()),
+                "sms": int(u["sms_used"].sum()),
+                "roaming_gb": float(u["roaming_mb"].sum()) / 1024.0,
+            }
+        return self._cached(("usage_summary", bill_id), _get)
+
+    def breakdown(self, bill_id: int, labels: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        def _get():
+            items = self.items(bill_id)
+            if labels:
+                items = items.assign(category=items["category"].map(lambda c: labels.get(c, c)))
+            return build_breakdown(items)
+        return self._cached(("breakdown", bill_id, _labels_key(labels)), _get)
+
+    def baseline(self, bill_id: int) -> Dict[str, Any]:
+        def _get():
+            h = self.header(bill_id)
+            hist = self.history(bill_id)
+            total = float(h["total_amount"])
+            mean = float(hist["total_amount"].mean()) if not hist.empty else None
+            return {
+                "baseline_total_mean": round(mean, 2) if mean is not None else None,
+                "total_delta": round(total - mean, 2) if mean is not None else None,
+                "baseline_periods": hist["period"].tolist(),
+            }
+        return self._cached(("baseline", bill_id), _get)
+
+    def contributors(self, bill_id: int, labels: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """Kategori bazında bu ay - önceki aylar ortalaması (anomaly_engine ile aynı pencere)."""
+        def _get():
+            current = self.category_totals(bill_id)
+            hist = [self.category_totals(int(b)) for b in self.history(bill_id)["bill_id"]]
+            cats = list(dict.fromkeys(list(current) + [c for h in hist for c in h]))
+            merged: Dict[str, Dict[str, float]] = {}
+            for cat in cats:
+                if cat in EXCLUDE_CATEGORIES:
+                    continue
+                vals = [h[cat] for h in hist if cat in h]
+                label = labels.get(cat, cat) if labels else cat
+                m = merged.setdefault(label, {"current": 0.0, "baseline_mean": 0.0})
+                m["current"] += current.get(cat, 0.0)
+                m["baseline_mean"] += float(np.mean(vals)) if vals else 0.0
+            out = [{
+                "category": cat,
+                "current": round(v["current"], 2),
+                "baseline_mean": round(v["baseline_mean"], 2),
+                "delta": round(v["current"] - v["baseline_mean"], 2),
+            } for cat, v in merged.items()]
+            return sorted(out, key=lambda x: x["delta"], reverse=True)
+        return self._cached(("contributors", bill_id, _labels_key(labels)), _get)
+
+    def summary(self, bill_id: int) -> Dict[str, Any]:
+        def _get():
+            h = self.header(bill_id)
+            base = self.baseline(bill_id)
+            return {
+                "period": str(h["period"]),
+                "total": float(h["total_amount"]),
+                "taxes": float(self.category_totals(bill_id).get("tax", 0.0)),
+                "usage_summary": self.usage_summary(bill_id),
+                "baseline_total_mean": base["baseline_total_mean"],
+                "total_delta": base["total_delta"],
+            }
+        return self._cached(("summary", bill_id), _get)
+
+    def payload(self, bill_id: int, labels: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Tam payload; bölümler ayrı ayrı saklandığı için tekrar çağrı ucuzdur."""
+        return {
+            "summary": self.summary(bill_id),
+            "breakdown": self.breakdown(bill_id, labels),
+            "contributors": self.contributors(bill_id, labels),
+        }
+
+
+def _labels_key(labels: Optional[Dict[str, str]]) -> Optional[tuple]:
+    return tuple(sorted(labels.items())) if labels else None
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+pipeline.py — Artifact üretimi için DAG tabanlı, önbellekli aşama çalıştırıcı
+
+Elle sırayla çalıştırılan betikler aşama (stage) olarak tanımlanır; her aşamanın
+komutu, girdileri (dosya/klasör), çıktıları ve kaynak kodu bellidir:
+
+    generate       mock_data_generator.py      → <work>/raw/*.csv            (--generate ile)
+    extras         mock_extras_generator.py    <work>/raw → <data>/*.csv     (--generate ile)
+    data_prep      data_prep.py                <data> → bill_summary, category_breakdown, segment_stats
+    anomaly_table  anomaly_table.py            bill_summary + category_breakdown → anomalies.csv
+
+- Bağımlılıklar girdi/çıktı yollarından çıkarılır (bir aşamanın girdisi başka bir
+  aşamanın çıktısıysa ona bağlıdır).
+- Aşama anahtarı = komut + girdi dosyalarının içerik özeti + kaynak kod özeti. Anahtar
+  son başarılı koşuyla aynıysa ve çıktılar yerinde (boyut/mtime değişmemiş) ise aşama
+  atlanır. Dosya özetleri (boyut, mtime) ile önbelleklenir; değişmeyen büyük CSV'ler
+  yeniden okunmaz.
+- Bağımlılıkları tamamlanan aşamalar --jobs kadar paralel çalışır.
+- Aşama süreleri ve durumları <work>/state.json'a ve --report dosyasına yazılır.
+
+(data_generator_scripts/breakdown_generator.py ayrı bir aşama değildir; category_breakdown
+data_prep içinde üretilir. extras.py sabit yollu keşif betiği olduğundan dahil değildir.)
+
+Göreli --data/--artifacts/--work yolları çalışılan klasöre değil depo köküne göredir.
+
+Kullanım:
+    python -m general_scripts.pipeline                              # data/ → artifacts/
+    python -m general_scripts.pipeline --generate --n_users 5000    # sentetik veriden baştan
+    python -m general_scripts.pipeline --dry-run                    # neyin çalışacağını göster
+    python -m general_scripts.pipeline --force anomaly_table        # aşamayı zorla yeniden çalıştır
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_WORK = ".pipeline"
+HASH_CHUNK = 1 << 20
+
+
+@dataclass
+class Stage:
+    name: str
+    cmd: List[str]                         # sys.executable'a verilen argümanlar (ROOT'ta çalışır)
+    inputs: List[Path] = field(default_factory=list)
+    outputs: List[Path] = field(default_factory=list)
+    code: List[Path] = field(default_factory=list)
+    salt: str = ""                         # komutta görünmeyen ama çıktıyı etkileyen değer
+    deps: List[str] = field(default_factory=list)
+
+
+# ==============================
+# Özetler
+# ==============================
+def _files(path: Path) -> List[Path]:
+    if path.is_dir():
+        return sorted(p for p in path.rglob("*") if p.is_file() and not p.name.startswith("."))
+    return [path] if path.exists() else []
+
+
+class FileHashes:
+    """İçerik özetleri; (boyut, mtime_ns) değişmemişse kayıtlı özet kullanılır."""
+
+    def __init__(self, known: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.known = dict(known or {})
+
+    def digest(self, path: Path) -> str:
+        st = path.stat()
+        key = str(path)
+        hit = self.known.get(key)
+        if hit and hit["size"] == st.st_size and hit["mtime_ns"] == st.st_mtime_ns:
+            return hit["sha1"]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                h.update(chunk)
+        self.known[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": h.hexdigest()}
+        return h.hexdigest()
+
+    def tree(self, paths: Iterable[Path]) -> Dict[str, Optional[str]]:
+        out: Dict[str, Optional[str]] = {}
+        for p in paths:
+            files = _files(p)
+            if not files:
+                out[str(p)] = None          # eksik girdi de anahtarı etkiler
+            for f in files:
+                out[str(f)] = self.digest(f)
+        return out
+
+
+def stage_key(stage: Stage, hashes: FileHashes) -> str:
+    payload = {"cmd": stage.cmd, "salt": stage.salt,
+               "inputs": hashes.tree(stage.inputs), "code": hashes.tree(stage.code)}
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def output_stamp(stage: Stage) -> Dict[str, List[int]]:
+    return {str(f): [f.stat().st_size, f.stat().st_mtime_ns] for p in stage.outputs for f in _files(p)}
+
+
+def _under(a: Path, b: Path) -> bool:
+    """a, b'nin kendisi ya da altında mı?"""
+    a, b = a.resolve(), b.resolve()
+    return a == b or b in a.parents
+
+
+def resolve_deps(stages: Sequence[Stage]) -> None:
+    for s in stages:
+        s.deps = [o.name for o in stages if o is not s
+                  and any(_under(i, out) or _under(out, i) for i in s.inputs for out in o.outputs)]
+    # Döngü kontrolü (topolojik sıra kurulabilmeli)
+    done: set = set()
+    pending = {s.name: set(s.deps) for s in stages}
+    while pending:
+        ready = [n for n, d in pending.items() if d <= done]
+        if not ready:
+            raise ValueError(f"Aşama bağımlılıklarında döngü: {sorted(pending)}")
+        for n in ready:
+            done.add(n)
+            del pending[n]
+
+
+# ==============================
+# Aşamalar
+# ==============================
+def _under_root(path: str) -> Path:
+    """Göreli yolları ROOT'a göre çöz: aşamalar cwd=ROOT ile çalışır, özetler de aynı dosyalardan alınmalı."""
+    p = Path(path).expanduser()
+    return p if p.is_absolute() else ROOT / p
+
+
+def build_stages(args) -> List[Stage]:
+    data, art, work = _under_root(args.data), _under_root(args.artifacts), _under_root(args.work)
+    gs, dg = ROOT / "general_scripts", ROOT / "data_generator_scripts"
+    stages: List[Stage] = []
+
+    if args.generate:
+        raw = work / "raw"
+        stages.append(Stage(
+            "generate",
+            [str(dg / "mock_data_generator.py"), "--out", str(raw), "--seed", str(args.seed),
+             "--n_users", str(args.n_users), "--n_months", str(args.n_months), "--anom_rate", str(args.anom_rate)],
+            outputs=[raw / f"{n}.csv" for n in ("users", "plans", "bill_headers", "bill_items", "usage_daily",
+                                                "vas_catalog", "premium_sms_catalog", "add_on_packs")],
+            code=[dg / "mock_data_generator.py"],
+            salt=time.strftime("%Y-%m"),    # aylar bugünden geriye üretilir
+        ))
+        stages.append(Stage(
+            "extras",
+            [str(dg / "mock_extras_generator.py"), "--data", str(raw), "--out", str(data), "--seed", str(args.seed)],
+            inputs=[raw],
+            outputs=[data / f"{n}.csv" for n in ("users", "plans", "bill_headers", "bill_items", "usage_daily",
+                                                 "vas_catalog", "premium_sms_catalog", "add_on_packs")],
+            code=[dg / "mock_extras_generator.py"],
+        ))
+
+    stages.append(Stage(
+        "data_prep",
+        [str(gs / "data_prep.py"), "--data", str(data), "--out", str(art), "--engine", args.engine],
+        inputs=[data],
+        outputs=[art / n for n in ("bill_summary.csv", "category_breakdown.csv", "segment_stats.csv",
+                                   "segment_state.json", "parse_report.json")],
+        code=[gs / "data_prep.py", gs / "numeric_parse.py", gs / "segment_moments.py", gs / "sql_engine.py"],
+    ))
+    stages.append(Stage(
+        "anomaly_table",
+        ["-m", "general_scripts.anomaly_table", "--artifacts", str(art), "--profile", args.profile],
+        inputs=[art / "bill_summary.csv", art / "category_breakdown.csv"],
+        outputs=[art / "anomalies.csv"],
+        code=[gs / "anomaly_table.py", gs / "anomaly_engine.py", gs / "threshold_config.py"],
+    ))
+    resolve_deps(stages)
+    return stages
+
+
+# ==============================
+# Çalıştırıcı
+# ==============================
+def load_state(path: Path) -> Dict[str, Any]:
+    if path.exists():
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            pass
+    return {"stages": {}, "files": {}}
+
+
+def save_state(path: Path, state: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def up_to_date(stage: Stage, key: str, state: Dict[str, Any]) -> bool:
+    prev = state["stages"].get(stage.name)
+    if not prev or prev.get("key") != key or prev.get("status") != "ok":
+        return False
+    if not all(_files(p) for p in stage.outputs):
+        return False
+    return prev.get("outputs") == output_stamp(stage)
+
+
+def run_stage(stage: Stage) -> Dict[str, Any]:
+    for p in stage.outputs:
+        p.parent.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, *stage.cmd], cwd=ROOT, capture_output=True, text=True)
+    return {"returncode": proc.returncode, "seconds": round(time.perf_counter() - t0, 3),
+            "stdout": proc.stdout[-2000:], "stderr": proc.stderr[-4000:]}
+
+
+def run_pipeline(stages: Sequence[Stage], state_path: Path, jobs: int = 2,
+                 force: Sequence[str] = (), dry_run: bool = False) -> List[Dict[str, Any]]:
+    """Hazır aşamaları paralel çalıştır; güncel olanları atla. Aşama bazında sonuç listesi döner."""
+    state = load_state(state_path)
+    hashes = FileHashes(state.get("files"))
+    force_all = "all" in force
+    status: Dict[str, str] = {}
+    results: Dict[str, Dict[str, Any]] = {}
+    running: Dict[Any, Stage] = {}
+    keys: Dict[str, str] = {}
+    t_start = time.perf_counter()
+
+    def ready() -> List[Stage]:
+        return [s for s in stages if s.name not in status
+                and all(status.get(d) in ("ok", "skipped", "would_run") for d in s.deps)]
+
+    def blocked() -> List[Stage]:
+        return [s for s in stages if s.name not in status
+                and any(status.get(d) in ("failed", "blocked") for d in s.deps)]
+
+    def schedule(pool) -> bool:
+        """Bloklananları işaretle, hazır aşamaları atla/başlat; durum değiştiyse True."""
+        changed = False
+        for s in blocked():
+            status[s.name] = "blocked"
+            results[s.name] = {"stage": s.name, "status": "blocked", "seconds": 0.0}
+            changed = True
+        for s in ready():
+            changed = True
+            key = stage_key(s, hashes)
+            keys[s.name] = key
+            upstream_ran = any(status.get(d) == "would_run" for d in s.deps)
+            if not (force_all or s.name in force or upstream_ran) and up_to_date(s, key, state):
+                status[s.name] = "skipped"
+                results[s.name] = {"stage": s.name, "status": "skipped", "seconds": 0.0}
+                print(f"  ⏭  {s.name}: güncel")
+            elif dry_run:
+                status[s.name] = "would_run"
+                results[s.name] = {"stage": s.name, "status": "would_run", "seconds": 0.0}
+                print(f"  ▶️  {s.name}: çalışacak → python {' '.join(s.cmd)}")
+            else:
+                status[s.name] = "running"
+                print(f"  ▶️  {s.name}: başladı")
+                running[pool.submit(run_stage, s)] = s
+        return changed
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while True:
+            while schedule(pool):
+                pass
+            if not running:
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                s = running.pop(fut)
+                res = fut.result()
+                ok = res["returncode"] == 0
+                status[s.name] = "ok" if ok else "failed"
+                results[s.name] = {"stage": s.name, "status": status[s.name], "seconds": res["seconds"]}
+                if ok:
+                    # Çıktılar yeni; aşağı akış anahtarları yeni özetleri kullanır
+                    state["stages"][s.name] = {"key": keys[s.name], "status": "ok", "seconds": res["seconds"],
+                                               "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                               "outputs": output_stamp(s)}
+                    print(f"  ✓  {s.name}: {res['seconds']:.2f} sn")
+                else:
+                    state["stages"].pop(s.name, None)
+                    results[s.name]["stderr"] = res["stderr"]
+                    print(f"  ❌ {s.name}: çıkış kodu {res['returncode']}\n{res['stderr']}")
+                state["files"] = hashes.known
+                if not dry_run:
+                    save_state(state_path, state)
+
+    if not dry_run:
+        state["files"] = hashes.known
+        state["last_run"] = {"seconds": round(time.perf_counter() - t_start, 3),
+                             "stages": [results[s.name] for s in stages]}
+        save_state(state_path, state)
+    return [results[s.name] for s in stages]
+
+
+def parse_args(argv: Optional[Sequence[str]] = None):
+    ap = argparse.ArgumentParser(description="Artifact pipeline (DAG, önbellekli aşamalar)")
+    ap.add_argument("--data", default="data", help="Veri klasörü (--generate ile çıktı, aksi halde girdi)")
+    ap.add_argument("--artifacts", default="artifacts", help="Artifact klasörü")
+    ap.add_argument("--work", default=DEFAULT_WORK, help="Durum dosyası ve ara çıktılar")
+    ap.add_argument("--profile", default="default", help="anomaly_table eşik profili")
+    ap.add_argument("--engine", choices=["pandas", "duckdb"], default="pandas", help="data_prep arka ucu")
+    ap.add_argument("--generate", action="store_true", help="Veriyi mock üreticilerle baştan üret")
+    ap.add_argument("--n_users", type=int, default=75)
+    ap.add_argument("--n_months", type=int, default=4)
+    ap.add_argument("--seed", type=int, default=123)
+    ap.add_argument("--anom_rate", type=float, default=0.25)
+    ap.add_argument("--jobs", type=int, default=2, help="Paralel aşama sayısı")
+    ap.add_argument("--force", nargs="*", default=[], help="Zorla çalıştırılacak aşamalar ('all' = hepsi)")
+    ap.add_argument("--dry-run", action="store_true", help="Yalnızca hangi aşamaların çalışacağını göster")
+    ap.add_argument("--report", default=None, help="Aşama süreleri/durumları JSON çıktısı")
+    return ap.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    args = parse_args(argv)
+    stages = build_stages(args)
+    unknown = [f for f in args.force if f != "all" and f not in {s.name for s in stages}]
+    if unknown:
+        raise SystemExit(f"Bilinmeyen aşama: {unknown} (aşamalar: {', '.join(s.name for s in stages)})")
+
+    print(f"Pipeline: {' → '.join(s.name for s in stages)}")
+    t0 = time.perf_counter()
+    results = run_pipeline(stages, _under_root(args.work) / "state.json", args.jobs, args.force, args.dry_run)
+    total = time.perf_counter() - t0
+
+    print(f"\n{'aşama':<16}{'durum':<11}{'sn':>8}")
+    for r in results:
+        print(f"{r['stage']:<16}{r['status']:<11}{r['seconds']:>8.2f}")
+    print(f"{'toplam':<27}{total:>8.2f}")
+    if args.report:
+        Path(args.report).write_text(json.dumps({"seconds": round(total, 3), "stages": results},
+                                                ensure_ascii=False, indent=2), encoding="utf-8")
+    if any(r["status"] in ("failed", "blocked") for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
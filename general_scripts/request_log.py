@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+request_log.py — API istek kaydı (JSONL) ve tekrar oynatma yardımcıları
+
+REQUEST_LOG=<yol> ile başlatılan sunucu her /api/* isteğini bir satır olarak yazar:
+
+    {"ts": 1760000000.123, "method": "POST", "path": "/api/anomalies",
+     "endpoint": "/api/anomalies", "body": {"user_id": 1001, "period": "2025-07"},
+     "status": 200, "elapsed_ms": 12.4}
+
+- ts: isteğin geliş zamanı (epoch sn); replay orijinal aralıkları buradan kurar
+- path: sorgu dizesi dahil; endpoint: route şablonu (/api/users/{user_id})
+- body: JSON gövde (ayrıştırılamazsa metin, yoksa null)
+
+Kayıt replay_requests.py ile yerel ya da süreç içi API'ye tekrar oynatılır.
+Yönetim (/admin) ve metrik endpoint'leri kaydedilmez.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Union
+
+LOGGED_PREFIX = "/api/"
+
+
+class RequestLogger:
+    """Satır tamponlu, iş parçacığı güvenli JSONL yazıcı (dosya sürekli açık tutulur)."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._f = open(self.path, "a", encoding="utf-8", buffering=1)
+
+    @staticmethod
+    def wants(path: str) -> bool:
+        return path.startswith(LOGGED_PREFIX)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._f.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._f.close()
+
+
+def parse_body(raw: bytes) -> Any:
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw.decode("utf-8", errors="replace")
+
+
+def read_log(path: Union[str, Path]) -> List[Dict[str, Any]]:
+    """Kayıtları geliş zamanına göre sıralı döndür; bozuk/boş satırlar atlanır."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(rec, dict) and "method" in rec and "path" in rec:
+                records.append(rec)
+    records.sort(key=lambda r: r.get("ts", 0.0))
+    return records
+
+
+def _strip(value: Any, ignore: frozenset) -> Any:
+    if isinstance(value, dict):
+        return {k: _strip(v, ignore) for k, v in value.items() if k not in ignore}
+    if isinstance(value, list):
+        return [_strip(v, ignore) for v in value]
+    return value
+
+
+def response_digest(content: bytes, ignore_keys: Iterable[str] = ()) -> str:
+    """Yanıt gövdesinin özeti; JSON ise anahtar sırasından bağımsız ve ignore_keys
+    (ör. LLM metni gibi deterministik olmayan alanlar) çıkarılarak hesaplanır."""
+    try:
+        canon = json.dumps(_strip(json.loads(content), frozenset(ignore_keys)),
+                           sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    except ValueError:
+        canon = content
+    return hashlib.sha1(canon).hexdigest()[:16]
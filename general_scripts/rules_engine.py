@@ -26,9 +26,16 @@ Giriş şeması: (paylaştığın payload)
 """
 
 from __future__ import annotations
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional
 
-# --- Eşikler (ayarlar) ---
+try:
+    from general_scripts.threshold_config import SegmentTuned, get_profile
+except ImportError:  # betik olarak general_scripts/ içinden çalıştırıldığında
+    from threshold_config import SegmentTuned, get_profile
+
+# --- Eşikler (varsayılanlar; çalışma anında değiştirmeyin, RulesConfig kullanın) ---
 TOTAL_DELTA_HIGH_PCT = 0.15     # toplam, ortalamaya göre %15'ten fazla arttıysa "yüksek"
 CONTRIB_DELTA_HIGH_TL = 30.0    # bir kategori delta > 30 TL ise işaretle
 CATEGORY_SHARE_LIMITS = {       # kategori payı toplamın üstünde ise (oran)
@@ -44,6 +51,39 @@ UNIT_COST_LIMITS = {            # birim maliyetler için "yüksek" sınırlar (
     "roaming_tl_per_gb": 100.0, # TL/GB Roaming
 }
 
+
+@dataclass(frozen=True)
+class RulesConfig(SegmentTuned):
+    """Değişmez kural eşikleri; segment/plan override'ları için bkz. threshold_config."""
+    total_delta_high_pct: float = TOTAL_DELTA_HIGH_PCT
+    contrib_delta_high_tl: float = CONTRIB_DELTA_HIGH_TL
+    category_share_limits: Mapping[str, float] = field(
+        default_factory=lambda: MappingProxyType(dict(CATEGORY_SHARE_LIMITS)), hash=False)
+    min_total_for_share: float = MIN_TOTAL_FOR_SHARE
+    unit_cost_limits: Mapping[str, float] = field(
+        default_factory=lambda: MappingProxyType(dict(UNIT_COST_LIMITS)), hash=False)
+
+    def __post_init__(self):
+        # dışarıdan verilen sözlükler de salt okunur olsun
+        for name in ("category_share_limits", "unit_cost_limits"):
+            object.__setattr__(self, name, MappingProxyType(dict(getattr(self, name))))
+        super().__post_init__()
+
+
+DEFAULT_CONFIG = RulesConfig()
+
+PROFILES = {
+    "default": DEFAULT_CONFIG,
+    "sensitive": RulesConfig(total_delta_high_pct=0.10, contrib_delta_high_tl=20.0),
+    "conservative": RulesConfig(total_delta_high_pct=0.25, contrib_delta_high_tl=50.0,
+                                min_total_for_share=200.0),
+}
+
+
+def get_config(profile: Optional[str] = None) -> RulesConfig:
+    return get_profile(PROFILES, profile)
+
+
 def _get(d: Dict[str, Any], *keys, default=None):
     cur = d
     for k in keys:
@@ -109,7 +149,9 @@ def unit_costs(vergi_alloc: Dict[str, Any], usage: Dict[str, Any]) -> Dict[str,
 # ---------------------------
 # Anomali kuralları (LLM yok)
 # ---------------------------
-def detect_anomalies(payload: Dict[str, Any]) -> Dict[str, Any]:
+def detect_anomalies(payload: Dict[str, Any], config: Optional[RulesConfig] = None) -> Dict[str, Any]:
+    """config: eşik profili (varsayılan DEFAULT_CONFIG), segment/plan için çözülmüş olmalı."""
+    cfg = config or DEFAULT_CONFIG
     summary = payload.get("summary", {}) or {}
     contributors = payload.get("contributors", []) or []
     breakdown = payload.get("breakdown", []) or []
@@ -122,10 +164,10 @@ def detect_anomalies(payload: Dict[str, Any]) -> Dict[str, Any]:
 
     # 1) Toplam spike (baseline'a göre)
     pct = (delta / baseline) if baseline else None
-    if pct is not None and abs(pct) >= TOTAL_DELTA_HIGH_PCT:
+    if pct is not None and abs(pct) >= cfg.total_delta_high_pct:
         flags.append({
             "type": "total_spike",
-            "severity": "high" if abs(pct) >= (TOTAL_DELTA_HIGH_PCT * 1.5) else "medium",
+            "severity": "high" if abs(pct) >= (cfg.total_delta_high_pct * 1.5) else "medium",
             "message": f"Toplam faturada {'artış' if delta>0 else 'azalış'}: {delta:+.0f} TL (%{pct*100:.1f}).",
             "metrics": {"total": total, "baseline_mean": baseline, "delta": delta, "pct": round(pct*100,1)},
         })
@@ -133,19 +175,19 @@ def detect_anomalies(payload: Dict[str, Any]) -> Dict[str, Any]:
     # 2) Katkı yapan kategoriler (delta eşiği)
     for c in sorted(contributors, key=lambda x: float(x.get("delta") or 0.0), reverse=True):
         dlt = float(c.get("delta") or 0.0)
-        if abs(dlt) >= CONTRIB_DELTA_HIGH_TL:
+        if abs(dlt) >= cfg.contrib_delta_high_tl:
             flags.append({
                 "type": "category_delta",
-                "severity": "high" if abs(dlt) >= CONTRIB_DELTA_HIGH_TL*1.5 else "medium",
+                "severity": "high" if abs(dlt) >= cfg.contrib_delta_high_tl*1.5 else "medium",
                 "category": c.get("category"),
                 "message": f"{c.get('category')} kaleminde {dlt:+.0f} TL değişim.",
                 "metrics": {"current": c.get("current"), "baseline_mean": c.get("baseline_mean"), "delta": dlt},
             })
 
     # 3) Kategori payları (toplam içindeki oran)
-    if total >= MIN_TOTAL_FOR_SHARE:
+    if total >= cfg.min_total_for_share:
         cat_map = {c["category"]: float(c.get("total") or 0.0) for c in breakdown}
-        for cat, limit in CATEGORY_SHARE_LIMITS.items():
+        for cat, limit in cfg.category_share_limits.items():
             if cat in cat_map:
                 share = cat_map[cat] / total
                 if share >= limit:
@@ -164,7 +206,7 @@ def detect_anomalies(payload: Dict[str, Any]) -> Dict[str, Any]:
     for key, val in uc.items():
         if val is None: 
             continue
-        lim = UNIT_COST_LIMITS.get(key)
+        lim = cfg.unit_cost_limits.get(key)
         if lim and val >= lim:
             flags.append({
                 "type": "unit_cost",
@@ -183,8 +225,8 @@ def detect_anomalies(payload: Dict[str, Any]) -> Dict[str, Any]:
 # ---------------------------
 # Dışa açık tek API
 # ---------------------------
-def analyze_bill(payload: Dict[str, Any]) -> Dict[str, Any]:
+def analyze_bill(payload: Dict[str, Any], config: Optional[RulesConfig] = None) -> Dict[str, Any]:
     """Toplam rapor: anomali bayrakları + vergi ayrıştırma + birim maliyet."""
-    out = detect_anomalies(payload)
+    out = detect_anomalies(payload, config=config)
     # İstersen burada 'autofix' veya 'what-if' senaryolarını deterministik ekleyebilirsin.
     return out
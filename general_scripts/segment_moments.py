@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+segment_moments.py — Birleştirilebilir (mergeable) segment istatistikleri
+
+Her (segment, metrik) için yalnızca n / mean / M2 tutulur (Welford). İki parça
+Chan vd. formülüyle birleştirilir; böylece yeni bir ay (veya bir partition)
+geldiğinde geçmişi yeniden taramadan ortalama/std güncellenir:
+
+    n   = n_a + n_b
+    δ   = mean_b - mean_a
+    mean = mean_a + δ·n_b/n
+    M2  = M2_a + M2_b + δ²·n_a·n_b/n        std = sqrt(M2/(n-1))
+
+Opsiyonel çeyreklikler için göreli hatası sınırlı log-bucket sketch (DDSketch
+benzeri) tutulur; kova sayıları toplanarak birleşir.
+
+Durum (SegmentState) JSON olarak saklanır: işlenmiş dönemler, moment tablosu,
+segment bazında tekil kullanıcılar ve (varsa) sketch kovaları.
+"""
+from __future__ import annotations
+
+import json
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+MOMENT_COLS = ["n", "mean", "m2"]
+SKETCH_ALPHA = 0.01          # sketch göreli doğruluğu (%1)
+_GAMMA = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+_LOG_GAMMA = math.log(_GAMMA)
+_ZERO_BIN = -(10 ** 6)       # <= 0 değerlerin kovası
+
+
+def _empty_moments(by: str) -> pd.DataFrame:
+    idx = pd.MultiIndex.from_arrays([[], []], names=[by, "metric"])
+    return pd.DataFrame({c: pd.Series(dtype=float) for c in MOMENT_COLS}, index=idx)
+
+
+def _empty_sketch(by: str) -> pd.Series:
+    idx = pd.MultiIndex.from_arrays([[], [], []], names=[by, "metric", "bin"])
+    return pd.Series(dtype=float, index=idx, name="count")
+
+
+def _long(df: pd.DataFrame, by: str, metrics: Sequence[str]) -> pd.DataFrame:
+    return df.melt(id_vars=[by], value_vars=list(metrics), var_name="metric").dropna(subset=["value"])
+
+
+def chunk_moments(df: pd.DataFrame, by: str, metrics: Sequence[str]) -> pd.DataFrame:
+    """Tek parçanın (by, metric) başına n / mean / M2 tablosu."""
+    if df.empty:
+        return _empty_moments(by)
+    agg = _long(df, by, metrics).groupby([by, "metric"], sort=False)["value"].agg(["count", "mean", "var"])
+    n = agg["count"].astype(float)
+    return pd.DataFrame({"n": n, "mean": agg["mean"], "m2": agg["var"].fillna(0.0) * (n - 1)})
+
+
+def merge_moments(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """Chan birleştirmesi; iki taraftan birinde olmayan satırlar diğerinden aynen gelir."""
+    a, b = a.align(b, join="outer", fill_value=0.0)
+    n = a["n"] + b["n"]
+    safe_n = n.where(n > 0, 1.0)
+    delta = b["mean"] - a["mean"]
+    return pd.DataFrame({
+        "n": n,
+        "mean": a["mean"] + delta * b["n"] / safe_n,
+        "m2": a["m2"] + b["m2"] + delta * delta * a["n"] * b["n"] / safe_n,
+    })
+
+
+def chunk_sketch(df: pd.DataFrame, by: str, metrics: Sequence[str]) -> pd.Series:
+    """(by, metric, bin) -> adet; bin = ceil(log_γ(x)), x <= 0 için sabit kova."""
+    if df.empty or not metrics:
+        return _empty_sketch(by)
+    long = _long(df, by, metrics)
+    v = long["value"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bins = np.where(v > 0, np.ceil(np.log(np.where(v > 0, v, 1.0)) / _LOG_GAMMA), _ZERO_BIN).astype(np.int64)
+    long = long.assign(bin=bins)
+    return long.groupby([by, "metric", "bin"], sort=False)["value"].count().astype(float).rename("count")
+
+
+def sketch_quantiles(sketch: pd.Series, qs: Sequence[float]) -> pd.DataFrame:
+    """Sketch'ten (segment, metric) başına yaklaşık çeyreklikler."""
+    rows = []
+    names = sketch.index.names
+    for (seg, metric), part in sketch.groupby(level=[0, 1], sort=True):
+        part = part.droplevel([0, 1]).sort_index()
+        bins = part.index.to_numpy()
+        cum = part.to_numpy().cumsum()
+        total = cum[-1]
+        row = {names[0]: seg, "metric": metric}
+        for q in qs:
+            i = int(np.searchsorted(cum, q * (total - 1), side="right"))
+            b = bins[min(i, len(bins) - 1)]
+            row[q] = 0.0 if b == _ZERO_BIN else 2.0 * _GAMMA ** b / (_GAMMA + 1.0)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+@dataclass
+class SegmentState:
+    by: str = "type"
+    moments: pd.DataFrame = None
+    users: Dict[str, Set[int]] = field(default_factory=dict)
+    periods: Set[str] = field(default_factory=set)
+    sketch: Optional[pd.Series] = None           # None = çeyreklik tutulmuyor
+
+    def __post_init__(self):
+        if self.moments is None:
+            self.moments = _empty_moments(self.by)
+
+    @classmethod
+    def empty(cls, by: str = "type", quantiles: bool = False) -> "SegmentState":
+        return cls(by=by, sketch=_empty_sketch(by) if quantiles else None)
+
+    # --- güncelleme / birleştirme ---
+    def update(self, df: pd.DataFrame, metrics: Sequence[str], user_col: Optional[str] = None,
+               sketch_metrics: Sequence[str] = ()) -> "SegmentState":
+        """Yeni bir parçayı (ör. yeni ay) duruma ekle."""
+        df = df[df[self.by].notna()]
+        self.moments = merge_moments(self.moments, chunk_moments(df, self.by, metrics))
+        if self.sketch is not None and sketch_metrics:
+            self.sketch = self.sketch.add(chunk_sketch(df, self.by, sketch_metrics), fill_value=0.0)
+        if user_col is not None:
+            for seg, ids in df.groupby(self.by, sort=False)[user_col].unique().items():
+                self.users.setdefault(str(seg), set()).update(int(u) for u in ids)
+        return self
+
+    def merge(self, other: "SegmentState") -> "SegmentState":
+        """Başka bir partition'ın durumunu birleştir (işlenmiş dönemler ayrık olmalı)."""
+        overlap = self.periods & other.periods
+        if overlap:
+            raise ValueError(f"Aynı dönem iki kez sayılır: {sorted(overlap)}")
+        users = {k: set(v) for k, v in self.users.items()}
+        for seg, ids in other.users.items():
+            users.setdefault(seg, set()).update(ids)
+        sketch = None
+        if self.sketch is not None and other.sketch is not None:
+            sketch = self.sketch.add(other.sketch, fill_value=0.0)
+        return SegmentState(by=self.by, moments=merge_moments(self.moments, other.moments),
+                            users=users, periods=self.periods | other.periods, sketch=sketch)
+
+    # --- okuma ---
+    def metric(self, name: str) -> pd.DataFrame:
+        """Segment başına n / mean / std (ddof=1, pandas std ile aynı)."""
+        m = self.moments.xs(name, level="metric") if len(self.moments) else _empty_moments(self.by)
+        std = np.sqrt(m["m2"] / (m["n"] - 1)).where(m["n"] > 1)
+        return pd.DataFrame({"n": m["n"], "mean": m["mean"], "std": std})
+
+    def n_users(self) -> pd.Series:
+        return pd.Series({seg: len(ids) for seg, ids in self.users.items()}, dtype=int)
+
+    def quantiles(self, qs: Sequence[float]) -> pd.DataFrame:
+        if self.sketch is None:
+            raise ValueError("Bu durumda çeyreklik sketch'i tutulmuyor (quantiles=False).")
+        return sketch_quantiles(self.sketch, qs)
+
+    # --- kalıcılık ---
+    def save(self, path: Path) -> None:
+        m = self.moments.reset_index()
+        doc = {
+            "by": self.by,
+            "periods": sorted(self.periods),
+            "moments": {c: m[c].tolist() for c in m.columns},
+            "users": {seg: sorted(ids) for seg, ids in sorted(self.users.items())},
+        }
+        if self.sketch is not None:
+            s = self.sketch.reset_index()
+            doc["sketch"] = {c: s[c].tolist() for c in s.columns}
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(doc, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> "SegmentState":
+        doc = json.loads(Path(path).read_text(encoding="utf-8"))
+        by = doc["by"]
+        moments = pd.DataFrame(doc["moments"])
+        moments = moments.set_index([by, "metric"])[MOMENT_COLS] if len(moments) else _empty_moments(by)
+        sketch = None
+        if "sketch" in doc:
+            s = pd.DataFrame(doc["sketch"])
+            sketch = s.set_index([by, "metric", "bin"])["count"] if len(s) else _empty_sketch(by)
+        return cls(by=by, moments=moments, users={k: set(v) for k, v in doc["users"].items()},
+                   periods=set(doc["periods"]), sketch=sketch)
+
+
+def new_periods(state: SegmentState, periods: Iterable[str]) -> List[str]:
+    """Durumda henüz işlenmemiş dönemler (sıralı)."""
+    return sorted(set(periods) - state.periods)
+
+
+def split_periods(state: SegmentState, periods: Iterable[str],
+                  closed_through: Optional[str] = None) -> Tuple[List[str], List[str]]:
+    """Durumda henüz işlenmemiş dönemleri (kapanmış, açık) olarak ayır.
+
+    Açık dönem closed_through'dan (YYYY-MM) yeni olanlardır; verilmezse verideki en son
+    dönem açık sayılır (ay henüz bitmemiş olabilir). Açık dönemler duruma yazılmamalı.
+    """
+    periods = set(periods)
+    pending = new_periods(state, periods)
+    if not pending:
+        return [], []
+    if closed_through is None:
+        latest = max(periods)
+        return [p for p in pending if p < latest], [p for p in pending if p >= latest]
+    return [p for p in pending if p <= closed_through], [p for p in pending if p > closed_through]
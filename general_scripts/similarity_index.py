@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+similarity_index.py — "Sana benzeyen kullanıcılar" kohortu (k en yakın komşu)
+
+Her (kullanıcı, dönem) için kullanım profili vektörü:
+  - kullanım: gb, minutes, sms, roaming_gb (usage_daily aylık toplamları, log1p)
+  - harcama payları: kategori tutarı / fatura toplamı (bill_summary)
+Öznitelikler dönem içinde z-skoruna çevrilir; böylece dakika gibi büyük ölçekli
+kolonlar mesafeye baskın çıkmaz.
+
+Arama dönem bazında tam (exact) Öklid k-NN'dir: ||x||² önceden hesaplanır, sorgu
+tek bir matris-vektör çarpımı + argpartition'dır (n kullanıcı, d≈11 öznitelik için
+O(n·d)). Bu boyutta ağaç/rastgele izdüşüm indeksi gerekmeden birkaç ms'de döner.
+
+Kullanım:
+    index = build_similarity_index(load_all(Path("data")), bill_summary)
+    index.neighbors(1001, "2025-07", k=20)
+    analyze_cohort_comparison(payload, cohort=index.cohort(1001, "2025-07", k=20))
+
+CLI:
+    python -m general_scripts.similarity_index --user_id 1001 --period 2025-07 --k 10
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from general_scripts.cohort_analysis import ANY, COHORT_METRICS, CohortStats
+
+USAGE_FEATURES = ["gb", "minutes", "sms", "roaming_gb"]
+SHARE_CATEGORIES = ["data", "voice", "sms", "roaming", "premium_sms", "vas", "one_off"]
+DEFAULT_K = 20
+MAX_K = 1000            # API'de izin verilen en büyük k
+
+
+@dataclass
+class _PeriodBlock:
+    user_ids: np.ndarray          # (n,)
+    X: np.ndarray                 # (n, d) standartlaştırılmış, float32
+    sq_norms: np.ndarray          # (n,)
+    metrics: Dict[str, np.ndarray]  # kohort metrikleri (total, gb, minutes, sms)
+    row_of: Dict[int, int]        # user_id -> satır
+
+
+class SimilarityIndex:
+    def __init__(self, blocks: Dict[str, _PeriodBlock], features: List[str]):
+        self.blocks = blocks
+        self.features = features
+
+    def periods(self) -> List[str]:
+        return sorted(self.blocks)
+
+    def neighbors(self, user_id: int, period: str, k: int = DEFAULT_K,
+                  include_self: bool = False) -> List[Tuple[int, float]]:
+        """(user_id, mesafe) listesi, yakından uzağa."""
+        block = self.blocks.get(str(period)[:7])
+        if block is None or int(user_id) not in block.row_of:
+            return []
+        row = block.row_of[int(user_id)]
+        q = block.X[row]
+        # ||x - q||² = ||x||² - 2 x·q + ||q||²
+        d2 = block.sq_norms - 2.0 * (block.X @ q) + block.sq_norms[row]
+        if not include_self:
+            d2[row] = np.inf
+        n_valid = len(d2) - (0 if include_self else 1)
+        k = max(0, min(k, n_valid))
+        if k == 0:
+            return []
+        top = np.argpartition(d2, k - 1)[:k]
+        top = top[np.argsort(d2[top], kind="stable")]
+        dist = np.sqrt(np.maximum(d2[top], 0.0))
+        return [(int(u), round(float(d), 4)) for u, d in zip(block.user_ids[top], dist)]
+
+    def cohort(self, user_id: int, period: str, k: int = DEFAULT_K) -> Optional[CohortStats]:
+        """En yakın k kullanıcının metriklerinden CohortStats (analyze_cohort_comparison girişi)."""
+        period = str(period)[:7]
+        nbrs = self.neighbors(user_id, period, k)
+        if not nbrs:
+            return None
+        block = self.blocks[period]
+        rows = np.fromiter((block.row_of[u] for u, _ in nbrs), dtype=np.int64, count=len(nbrs))
+        return CohortStats(
+            key=("similar", ANY, period),
+            values={m: np.sort(block.metrics[m][rows]) for m in COHORT_METRICS},
+        )
+
+
+def profile_frame(data: Mapping[str, pd.DataFrame], bill_summary: pd.DataFrame) -> pd.DataFrame:
+    """(user_id, period) başına kullanım + harcama payı + kohort metrikleri."""
+    usage = data["usage_daily"]
+    monthly = (
+        usage.assign(period=usage["date"].dt.strftime("%Y-%m"))
+        .groupby(["user_id", "period"], sort=False)[["mb_used", "minutes_used", "sms_used", "roaming_mb"]].sum()
+        .reset_index()
+    )
+    bs = bill_summary.assign(period=bill_summary["period"].astype(str).str[:7])
+    cats = [c for c in SHARE_CATEGORIES if c in bs.columns]
+    df = bs[["user_id", "period", "total_amount"] + cats].merge(monthly, on=["user_id", "period"], how="left")
+
+    total = df["total_amount"].astype(float).to_numpy()
+    safe_total = np.where(total > 0, total, 1.0)
+    out = pd.DataFrame({
+        "user_id": df["user_id"].astype(int).to_numpy(),
+        "period": df["period"].to_numpy(),
+        "total": total,
+        "gb": df["mb_used"].fillna(0.0).to_numpy(dtype=float) / 1024.0,
+        "minutes": df["minutes_used"].fillna(0.0).to_numpy(dtype=float),
+        "sms": df["sms_used"].fillna(0.0).to_numpy(dtype=float),
+        "roaming_gb": df["roaming_mb"].fillna(0.0).to_numpy(dtype=float) / 1024.0,
+    })
+    for c in cats:
+        out[f"share_{c}"] = df[c].astype(float).to_numpy() / safe_total
+    return out
+
+
+def build_similarity_index(data: Mapping[str, pd.DataFrame], bill_summary: pd.DataFrame) -> SimilarityIndex:
+    prof = profile_frame(data, bill_summary)
+    share_cols = [c for c in prof.columns if c.startswith("share_")]
+    features = USAGE_FEATURES + share_cols
+
+    blocks: Dict[str, _PeriodBlock] = {}
+    for period, idx in prof.groupby("period", sort=True).indices.items():
+        part = prof.iloc[idx].drop_duplicates("user_id", keep="last")
+        X = part[features].to_numpy(dtype=np.float64)
+        X[:, :len(USAGE_FEATURES)] = np.log1p(np.maximum(X[:, :len(USAGE_FEATURES)], 0.0))
+        std = X.std(axis=0)
+        X = ((X - X.mean(axis=0)) / np.where(std > 0, std, 1.0)).astype(np.float32)
+        user_ids = part["user_id"].to_numpy()
+        blocks[str(period)] = _PeriodBlock(
+            user_ids=user_ids,
+            X=X,
+            sq_norms=np.einsum("ij,ij->i", X, X),
+            metrics={m: part[m].to_numpy(dtype=float) for m in COHORT_METRICS},
+            row_of={int(u): i for i, u in enumerate(user_ids)},
+        )
+    return SimilarityIndex(blocks, features)
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", default="data")
+    ap.add_argument("--artifacts", default="artifacts")
+    ap.add_argument("--user_id", type=int, required=True)
+    ap.add_argument("--period", required=True, help="YYYY-MM")
+    ap.add_argument("--k", type=int, default=DEFAULT_K)
+    return ap.parse_args()
+
+
+def main():
+    from general_scripts.anomaly_engine import load_artifacts
+    from general_scripts.whatif_engine import load_all
+
+    args = parse_args()
+    bill_summary, _ = load_artifacts(Path(args.artifacts))
+    t0 = time.perf_counter()
+    index = build_similarity_index(load_all(Path(args.data)), bill_summary)
+    build_s = time.perf_counter() - t0
+
+    t1 = time.perf_counter()
+    nbrs = index.neighbors(args.user_id, args.period, args.k)
+    query_ms = (time.perf_counter() - t1) * 1000.0
+    print(json.dumps({
+        "build_s": round(build_s, 3),
+        "query_ms": round(query_ms, 3),
+        "features": index.features,
+        "neighbors": [{"user_id": u, "distance": d} for u, d in nbrs],
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
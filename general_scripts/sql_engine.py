@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+sql_engine.py — data_prep için DuckDB (gömülü SQL) arka ucu
+
+pandas arka ucu bill_items ve usage_daily'yi tamamen belleğe alır. Bu arka uçta
+CSV/Parquet dosyaları DuckDB view'ları olarak taranır; ayrıştırma, sıralama, pivot,
+header/user join'leri ve türetilmiş kolonlar (period, total_without_tax,
+diff_total_vs_items) SQL'dir. DuckDB bellek sınırını (--memory_limit) aşan ara
+sonuçları geçici klasöre taşır; pandas'ta aynı anda en fazla bir parça kalem/kullanım
+satırı ile fatura / kullanıcı-ay düzeyindeki sonuçlar tutulur.
+
+pandas arka ucuyla (--exact_floats) bit düzeyinde aynı sonuç için:
+- Sayısal kolonlar dosya bazında aynı biçim tespitiyle (numeric_parse.sniff_format)
+  VARCHAR okunup SQL'de doğru yuvarlanarak ayrıştırılır; ayrıştırılamayanlar
+  parse_report'a yazılır. pandas'ın varsayılan (hızlı) ayrıştırıcısı 17 basamaklı bazı
+  değerlerde 1 ULP sapabilir; --exact_floats olmadan çıktılar son basamakta farklı olabilir
+- Gruplu toplamlar (kategori kırılımı, kullanıcı x ay) DuckDB'de değil: satırlar
+  (grup, dosya sırası) ile sıralı akar ve data_prep'teki aynı pandas fonksiyonlarından
+  parça parça geçer (toplama sırası pandas'takiyle aynı; DuckDB'nin paralel/kısmi
+  toplamaları son basamakta farklı sonuç verebilir)
+- Satır toplamları soldan sağa, yuvarlama numpy gibi yarıda çifte (round_even, -0.0 korunur)
+- Segment istatistikleri aynı SegmentState üzerinden hesaplanır (segment_state.json,
+  --incremental ve --quantiles aynen çalışır)
+
+Girdi: <data>/<tablo>.csv, <data>/<tablo>/part-*.csv, <data>/<tablo>.parquet ya da
+<data>/<tablo>/part-*.parquet (Parquet yalnızca bu arka uçta okunur).
+
+Kullanım:
+    python general_scripts/data_prep.py --data data --out artifacts --engine duckdb
+    python general_scripts/data_prep.py --data data_big --out artifacts_big --engine duckdb --memory_limit 2GB
+"""
+from __future__ import annotations
+
+import tempfile
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # opsiyonel bağımlılık; yoksa --engine duckdb kullanılamaz
+    duckdb = None
+
+try:
+    from general_scripts.data_prep import (CATS, USAGE_METRICS, segment_stats_from_state, split_periods,
+                                           table_parts, with_open_periods)
+    from general_scripts.data_prep import build_category_breakdown as _build_category_breakdown
+    from general_scripts.data_prep import user_month_usage as _user_month_usage
+    from general_scripts.numeric_parse import NUMERIC_COLUMNS, REJECT_EXAMPLES, NumberFormat, sniff_format
+    from general_scripts.segment_moments import SegmentState
+except ImportError:  # betik olarak general_scripts/ içinden çalıştırıldığında
+    from data_prep import (CATS, USAGE_METRICS, segment_stats_from_state, split_periods, table_parts,
+                           with_open_periods)
+    from data_prep import build_category_breakdown as _build_category_breakdown
+    from data_prep import user_month_usage as _user_month_usage
+    from numeric_parse import NUMERIC_COLUMNS, REJECT_EXAMPLES, NumberFormat, sniff_format
+    from segment_moments import SegmentState
+
+REQUIRED_TABLES = ["users", "bill_headers", "bill_items", "usage_daily"]
+# pandas.read_csv'in varsayılan eksik değer dizgileri (iki arka uç aynı değerleri NaN sayar)
+NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+             "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+BATCH_ROWS = 1 << 18          # DuckDB → pandas akış parçası (satır)
+DATE_COLUMNS = {
+    "bill_headers": ["period_start", "period_end", "issue_date"],
+    "usage_daily": ["date"],
+}
+
+
+def available() -> bool:
+    return duckdb is not None
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _lit(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def connect(memory_limit: Optional[str] = None, temp_dir: Optional[Path] = None):
+    if duckdb is None:
+        raise RuntimeError("duckdb kurulu değil: pip install duckdb (ya da --engine pandas)")
+    con = duckdb.connect()
+    if memory_limit:
+        con.execute(f"SET memory_limit = {_lit(memory_limit)}")
+    if temp_dir is not None:
+        con.execute(f"SET temp_directory = {_lit(str(temp_dir))}")
+    return con
+
+
+# ==============================
+# Kaynak tablolar (view)
+# ==============================
+def _parquet_parts(root: Path, name: str) -> List[Path]:
+    p = root / f"{name}.parquet"
+    if p.exists():
+        return [p]
+    return sorted((root / name).glob("part-*.parquet")) if (root / name).is_dir() else []
+
+
+def _files(paths: Sequence[Path]) -> str:
+    return "[" + ", ".join(_lit(str(p)) for p in paths) + "]"
+
+
+def _read_csv(paths: Sequence[Path], sep: str = ",", options: str = "") -> str:
+    nulls = ", ".join(_lit(v) for v in NA_VALUES)
+    return (f"read_csv({_files(paths)}, delim={_lit(sep)}, header=true, union_by_name=true, "
+            f"nullstr=[{nulls}]{', ' + options if options else ''})")
+
+
+def _parse_number(col: str, fmt: NumberFormat) -> str:
+    s = f"trim({_q(col)})"
+    if fmt.thousands:
+        s = f"replace({s}, {_lit(fmt.thousands)}, '')"
+    if fmt.decimal != ".":
+        s = f"replace({s}, {_lit(fmt.decimal)}, '.')"
+    return f"TRY_CAST({s} AS DOUBLE)"
+
+
+def _numeric_csv_select(con, paths: Sequence[Path], fmt: NumberFormat, columns: Sequence[str],
+                        report: List[dict]) -> str:
+    """Aynı biçimdeki CSV'ler tek read_csv ile: sayısal kolonlar VARCHAR okunur, SQL'de ayrıştırılır.
+
+    Her dosya için numeric_parse.read_numeric_csv ile aynı biçimde rapor yazılır.
+    """
+    def source(files):
+        header = con.execute(f"SELECT * FROM {_read_csv(files, fmt.sep, 'all_varchar=true')} LIMIT 0").df().columns
+        cols = [c for c in columns if c in header]
+        types = ", ".join(f"{_lit(c)}: 'VARCHAR'" for c in cols)
+        return cols, _read_csv(files, fmt.sep, f"types={{{types}}}" if cols else "")
+
+    for path in paths:
+        cols, src = source([path])
+        bad = {c: f"{_parse_number(c, fmt)} IS NULL AND trim({_q(c)}) <> ''" for c in cols}
+        counts = con.execute("SELECT count(*)" + "".join(f", count(*) FILTER (WHERE {b})" for b in bad.values())
+                             + f" FROM {src}").fetchone()
+        rejected = {}
+        for c, n_bad in zip(cols, counts[1:]):
+            if n_bad:
+                rows = con.execute(f"SELECT rn, raw FROM (SELECT row_number() OVER () + 1 AS rn, {_q(c)} AS raw, "
+                                   f"{_parse_number(c, fmt)} AS v FROM {src}) WHERE v IS NULL AND trim(raw) <> '' "
+                                   f"ORDER BY rn LIMIT {REJECT_EXAMPLES}").fetchall()
+                rejected[c] = {"count": int(n_bad), "rows": [int(r[0]) for r in rows], "values": [r[1] for r in rows]}
+        report.append({"file": str(path), "rows": int(counts[0]), "format": asdict(fmt), "rejected": rejected})
+
+    cols, src = source(paths)
+    if not cols:
+        return f"SELECT * FROM {src}"
+    return f"SELECT * REPLACE ({', '.join(f'{_parse_number(c, fmt)} AS {_q(c)}' for c in cols)}) FROM {src}"
+
+
+def register_table(con, root: Path, name: str, parse_report: List[dict]) -> bool:
+    """<name> view'ını oluştur (CSV ya da Parquet parçaları); tablo yoksa False.
+
+    Parçalar tek okuyucuyla taranır (her read_csv kendi tamponunu ayırır); yalnızca
+    biçimi farklı ardışık CSV grupları ayrı okunup UNION ile birleştirilir.
+    """
+    numeric = NUMERIC_COLUMNS.get(name, [])
+    csvs = table_parts(root, name)
+    if csvs and numeric:
+        runs: List[Tuple[NumberFormat, List[Path]]] = []
+        for p in csvs:
+            fmt = sniff_format(p, numeric)
+            if runs and runs[-1][0] == fmt:
+                runs[-1][1].append(p)
+            else:
+                runs.append((fmt, [p]))
+        selects = [_numeric_csv_select(con, files, fmt, numeric, parse_report) for fmt, files in runs]
+    elif csvs:
+        selects = [f"SELECT * FROM {_read_csv(csvs)}"]
+    else:
+        parquets = _parquet_parts(root, name)
+        if not parquets:
+            return False
+        selects = [f"SELECT * FROM read_parquet({_files(parquets)}, union_by_name=true)"]
+    if numeric:
+        # Dosya sırası korunarak satır numarası: gruplu toplamlar pandas'taki sırayla
+        # (ORDER BY _file, _row) yapılır
+        selects = [f"SELECT *, {i} AS _file, row_number() OVER () AS _row FROM ({s})" for i, s in enumerate(selects)]
+    body = " UNION ALL BY NAME ".join(f"({s})" for s in selects)
+
+    cols = con.execute(f"SELECT * FROM ({body}) LIMIT 0").df().columns
+    replace = [f"TRY_CAST({_q(c)} AS TIMESTAMP) AS {_q(c)}" for c in DATE_COLUMNS.get(name, []) if c in cols]
+    for c in numeric:
+        if c in cols:
+            expr = f"TRY_CAST({_q(c)} AS DOUBLE)"
+            if name == "usage_daily":   # standardize_types: kullanımda eksik = 0
+                expr = f"coalesce({expr}, 0)"
+            replace.append(f"{expr} AS {_q(c)}")
+    if name == "bill_items" and "category" in cols:
+        replace.append("coalesce(lower(trim(category)), 'unknown') AS category")
+    select = f"SELECT * REPLACE ({', '.join(replace)}) FROM ({body})" if replace else body
+    con.execute(f"CREATE OR REPLACE VIEW {_q(name)} AS {select}")
+    return True
+
+
+# ==============================
+# Artifact'ler
+# ==============================
+def sorted_batches(con, sql: str, key: str, batch_rows: int = BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    """key'e göre sıralı sorgu sonucunu parça parça getir; aynı key'li satırlar tek parçada kalır.
+
+    Sıralama DuckDB'de (gerekirse diske taşarak) yapılır; pandas'ta aynı anda en fazla
+    bir parça (+ bir grubun satırları) tutulur.
+    """
+    res = con.execute(sql)
+    vectors = max(1, batch_rows // 2048)
+    carry: Optional[pd.DataFrame] = None
+    while True:
+        chunk = res.fetch_df_chunk(vectors)
+        if chunk.empty:
+            break
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        last = chunk[key].iloc[-1]
+        tail = chunk[key].isna() if pd.isna(last) else chunk[key].eq(last)
+        carry = chunk[tail]
+        if (~tail).any():
+            yield chunk[~tail].reset_index(drop=True)
+    if carry is not None and len(carry):
+        yield carry.reset_index(drop=True)
+
+
+def build_category_breakdown(con) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """bill_items → (category_breakdown, fatura başına items_total).
+
+    Satırlar (bill_id, category, dosya sırası) ile sıralı akar; her parça pandas
+    arka ucuyla aynı fonksiyondan geçer, böylece toplamlar bit düzeyinde aynıdır.
+    """
+    sql = ("SELECT bill_id, item_id, category, amount, unit_price, tax_rate FROM bill_items "
+           "ORDER BY bill_id, category, _file, _row")
+    parts, totals = [], []
+    for batch in sorted_batches(con, sql, "bill_id"):
+        cb = _build_category_breakdown(batch)
+        parts.append(cb)
+        totals.append(cb.groupby("bill_id")["category_total"].sum().rename("items_total"))
+    if not parts:
+        cb = _build_category_breakdown(pd.DataFrame(columns=["bill_id", "item_id", "category", "amount",
+                                                             "unit_price", "tax_rate"]))
+        return cb, pd.DataFrame(columns=["bill_id", "items_total"])
+    return pd.concat(parts, ignore_index=True), pd.concat(totals).reset_index()
+
+
+def build_bill_summary(con, cat_breakdown: pd.DataFrame, items_total: pd.DataFrame) -> pd.DataFrame:
+    """data_prep.build_bill_summary'nin SQL karşılığı: pivot, join'ler ve türetilmiş kolonlar."""
+    con.register("category_breakdown", cat_breakdown)
+    con.register("items_total", items_total)
+    found = sorted(cat_breakdown["category"].unique().tolist())
+    cats = found + [c for c in dict.fromkeys(CATS) if c not in found]
+    pivot = ", ".join(
+        f"coalesce(sum(category_total) FILTER (WHERE category = {_lit(c)}), 0) AS {_q(c)}" if c in found
+        else f"0.0 AS {_q(c)}" for c in cats)
+    row_sum = "(" + " + ".join(f"p.{_q(c)}" for c in cats) + ")"   # pandas sum(axis=1): soldan sağa
+
+    bh_cols = [c for c in con.execute("SELECT * FROM bill_headers LIMIT 0").df().columns if c != "bill_id"]
+    derived = [
+        "strftime(bh.period_start, '%Y-%m') AS period",
+        f"{row_sum} - p.{_q('tax')} AS total_without_tax",
+    ]
+    if "total_amount" in bh_cols:
+        diff = f"(bh.total_amount - {row_sum})"
+        # numpy round gibi: yarıda çifte, küçük negatifler -0.0 kalır
+        derived.append(f"CASE WHEN {diff} < 0 AND round_even({diff}, 2) = 0 THEN -0.0::DOUBLE "
+                       f"ELSE round_even({diff}, 2) END AS diff_total_vs_items")
+    derived.append("coalesce(t.items_total, 0.0) AS items_total")
+
+    sql = f"""
+        WITH p AS (SELECT bill_id, {pivot} FROM category_breakdown GROUP BY bill_id)
+        SELECT p.*, {', '.join(f'bh.{_q(c)}' for c in bh_cols)},
+               u.name, u.type, u.current_plan_id,
+               {', '.join(derived)}
+        FROM p
+        LEFT JOIN bill_headers bh USING (bill_id)
+        LEFT JOIN (SELECT user_id, name, type, current_plan_id FROM users) u ON u.user_id = bh.user_id
+        LEFT JOIN items_total t USING (bill_id)
+        ORDER BY bh.period_start, bh.user_id, p.bill_id
+    """
+    return con.execute(sql).df()
+
+
+def user_month_usage(con, periods: Sequence[str]) -> pd.DataFrame:
+    """usage_daily → user x ay kullanım toplamları + segment (yalnızca verilen dönemler).
+
+    Satırlar (user_id, dönem, dosya sırası) ile sıralı akar; sonuç pandas'taki
+    groupby(sort=False) gibi ilk görülme sırasına dizilir.
+    """
+    src = [col for col, _ in USAGE_METRICS.values()]
+    plist = ", ".join(_lit(p) for p in periods)
+    sql = (f"SELECT user_id, strftime(date, '%Y-%m') AS period, {', '.join(_q(c) for c in src)}, _file, _row "
+           f"FROM usage_daily WHERE strftime(date, '%Y-%m') IN ({plist}) ORDER BY user_id, period, _file, _row")
+    parts = []
+    for batch in sorted_batches(con, sql, "user_id"):
+        first = batch.groupby(["user_id", "period"], sort=False)[["_file", "_row"]].first()
+        parts.append(_user_month_usage(batch).join(first, on=["user_id", "period"]))
+    cols = ["user_id", "period"] + list(USAGE_METRICS)
+    if not parts:
+        return pd.DataFrame(columns=cols + ["type"])
+    use_m = pd.concat(parts, ignore_index=True).sort_values(["_file", "_row"], kind="stable")[cols]
+    users = con.execute("SELECT user_id, type FROM users").df()
+    return use_m.reset_index(drop=True).merge(users, on="user_id", how="left")
+
+
+def update_segment_state(con, state: SegmentState, bill_summary: pd.DataFrame,
+                         closed_through: Optional[str] = None) -> SegmentState:
+    """data_prep.update_segment_state ile aynı; kullanım tarafı SQL'den gelir."""
+    usage_periods = {r[0] for r in con.execute(
+        "SELECT DISTINCT strftime(date, '%Y-%m') FROM usage_daily WHERE date IS NOT NULL").fetchall()}
+    closed, open_periods = split_periods(state, usage_periods | set(bill_summary["period"].dropna()), closed_through)
+
+    def fold(st: SegmentState, periods: List[str]) -> None:
+        use_m = user_month_usage(con, periods)
+        st.update(use_m, list(USAGE_METRICS), user_col="user_id", sketch_metrics=list(USAGE_METRICS))
+        bills = bill_summary[bill_summary["period"].isin(periods)]
+        spend_cols = [c for c in bill_summary.columns if c in CATS] + ["total_amount"]
+        st.update(bills, spend_cols)
+
+    if closed:
+        fold(state, closed)
+        state.periods.update(closed)
+    return with_open_periods(state, open_periods, fold)
+
+
+def build_artifacts(root: Path, state: SegmentState, quantiles: Optional[List[float]] = None,
+                    memory_limit: Optional[str] = None, closed_through: Optional[str] = None
+                    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, List[dict]]:
+    """(category_breakdown, bill_summary, segment_stats, parse_report); state yerinde güncellenir
+    (yalnızca kapanmış dönemler)."""
+    parse_report: List[dict] = []
+    with tempfile.TemporaryDirectory(prefix="data_prep_duckdb_") as tmp:
+        con = connect(memory_limit, Path(tmp))
+        try:
+            for name in REQUIRED_TABLES:
+                if not register_table(con, root, name, parse_report):
+                    raise FileNotFoundError(f"Eksik: {root / f'{name}.csv'} (ya da {root / name}/part-*.csv|parquet)")
+            cat_breakdown, items_total = build_category_breakdown(con)
+            bill_summary = build_bill_summary(con, cat_breakdown, items_total)
+            view = update_segment_state(con, state, bill_summary, closed_through)
+        finally:
+            con.close()
+    spend_cols = [c for c in bill_summary.columns if c in CATS]
+    seg_stats = segment_stats_from_state(view, spend_cols, quantiles)
+    return cat_breakdown, bill_summary, seg_stats, parse_report
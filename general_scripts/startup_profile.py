@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+startup_profile.py — api_server soğuk başlangıç profili
+
+Ölçülenler:
+1) Import süreleri: `python -X importtime -c "import api_server"` ile temiz bir süreçte
+   modül bazında self/cumulative süre (pandas, numpy, requests, engine modülleri ...)
+2) Tablo bazında yükleme: CSV ayrıştırma (parse), tip dönüşümü (prepare), indeks kurma
+3) Her aşamadan sonra süreç bellek kullanımı (RSS, MB)
+
+Çıktı JSON'dur; sürümler arası regresyon takibi için saklanabilir.
+
+Kullanım:
+    python api_server.py --profile-startup --profile-out startup_profile.json
+"""
+from __future__ import annotations
+
+import json
+import platform
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def rss_mb() -> float:
+    """Anlık RSS (MB). Linux'ta /proc, diğerlerinde tepe RSS'e düşer."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS bayt, Linux KB döner
+        return round(peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0, 1)
+    except ImportError:
+        return float("nan")
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """-X importtime çıktısını satır satır modül kayıtlarına çevir."""
+    rows = []
+    for line in stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if not m:
+            continue
+        self_us, cum_us, indent, module = m.groups()
+        rows.append({
+            "module": module,
+            "self_ms": round(int(self_us) / 1000.0, 2),
+            "cumulative_ms": round(int(cum_us) / 1000.0, 2),
+            "depth": max(0, len(indent) - 1) // 2,
+        })
+    return rows
+
+
+def profile_imports(module: str = "api_server", top: int = 25) -> Dict[str, Any]:
+    """Modülü temiz bir alt süreçte import edip süreleri topla."""
+    code = (
+        f"import {module}\n"
+        "from general_scripts.startup_profile import rss_mb\n"
+        "print(rss_mb())\n"
+    )
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} başarısız:\n{proc.stderr[-2000:]}")
+
+    rows = parse_importtime(proc.stderr)
+    # Hedef modülün doğrudan import ettikleri (çıktı post-order: çocuklar ebeveynden önce gelir)
+    direct: Dict[str, float] = {}
+    children: List[Dict[str, Any]] = []
+    for r in rows:
+        if r["depth"] == 1:
+            children.append(r)
+        elif r["depth"] == 0:
+            if r["module"] == module:
+                for c in children:
+                    direct[c["module"]] = round(direct.get(c["module"], 0.0) + c["cumulative_ms"], 2)
+            children = []
+    target = next((r for r in rows if r["module"] == module), None)
+    return {
+        "module": module,
+        "wall_s": round(wall, 3),
+        "total_ms": target["cumulative_ms"] if target else None,
+        "rss_mb_after_import": float(proc.stdout.strip().splitlines()[-1]) if proc.stdout.strip() else None,
+        "direct_imports": dict(sorted(direct.items(), key=lambda kv: -kv[1])),
+        "top_modules": sorted(rows, key=lambda r: -r["self_ms"])[:top],
+    }
+
+
+def profile_tables(store) -> Dict[str, Any]:
+    """Snapshot'ı aç ve tabloları tek tek yükleyip aşama sürelerini/RSS'i kaydet."""
+    stages = []
+    t0 = time.perf_counter()
+    snap = store.open()
+    stages.append({"stage": "open_snapshot", "seconds": round(time.perf_counter() - t0, 4), "rss_mb": rss_mb()})
+
+    tables: Dict[str, Any] = {}
+    for group, lazy in (("data", snap.data), ("artifacts", snap.artifacts)):
+        if not hasattr(lazy, "prewarm"):
+            continue
+        for name in lazy:
+            t1 = time.perf_counter()
+            lazy.prewarm([name])
+            st = dict(lazy.stats[name])
+            st.update({"group": group, "total_s": round(time.perf_counter() - t1, 4), "rss_mb": rss_mb()})
+            tables[name] = st
+            stages.append({"stage": f"load:{name}", "seconds": st["total_s"], "rss_mb": st["rss_mb"]})
+
+    return {
+        "dataset_version": snap.version,
+        "warnings": list(snap.warnings),
+        "total_s": round(time.perf_counter() - t0, 4),
+        "stages": stages,
+        "tables": tables,
+    }
+
+
+def profile_startup(store, out_path: Path, module: str = "api_server") -> Dict[str, Any]:
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "rss_mb_start": rss_mb(),
+        "imports": profile_imports(module),
+        "load": profile_tables(store),
+    }
+    report["rss_mb_end"] = rss_mb()
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return report
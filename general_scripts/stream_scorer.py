@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+stream_scorer.py — bill_items olaylarını geldikçe puanlayan çevrimiçi anomali tespiti
+
+Fatura kesilmesini beklemeden, dönem içinde oluşan her kalemde kullanıcıyı uyarmak için:
+- Kullanıcı başına son BASELINE_MONTHS + 1 dönem listesi
+- (kullanıcı, kategori) başına yalnızca bu penceredeki dönem toplamları, alt kalemlerin
+  en son görüldüğü dönem ve güncel dönemin alt kalem tutarları tutulur (sabit boyutlu durum)
+- Kurallar ve eşikler anomaly_engine.score_category ile aynıdır (z-skoru, % artış,
+  ilk kez görülen kategori, roaming/premium_sms/vas hassasiyeti) + alt kalem first-seen
+
+Her (kullanıcı, kategori, dönem) için anomali bir kez, eşik ilk aşıldığında yayınlanır.
+
+Girdi kaynakları:
+    python -m general_scripts.stream_scorer --replay data/bill_items.csv              # dosyayı akış gibi oynat
+    python -m general_scripts.stream_scorer --follow incoming_items.csv              # dosyaya eklenenleri izle (tail -f)
+    python -m general_scripts.stream_scorer --follow new.csv --history data/bill_items.csv
+    python general_scripts/stream_scorer.py --replay data/bill_items.csv --out events.jsonl  # --append: sonuna ekle
+Yerel kuyruk: consume_queue(scorer, q, emit) — q'ya dict olaylar konur, None ile durur.
+
+Olay alanları: bill_id, category, subtype, amount, created_at (+ opsiyonel user_id, period).
+user_id/period yoksa bill_headers'tan (bill_id -> user_id, dönem) çözülür; o da yoksa
+dönem created_at'in ayıdır.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import queue
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from general_scripts import anomaly_engine as ae
+except ImportError:  # betik olarak general_scripts/ içinden çalıştırıldığında
+    import anomaly_engine as ae
+
+POLL_INTERVAL = 0.5
+
+
+class _UserState:
+    __slots__ = ("periods", "cats")
+
+    def __init__(self):
+        self.periods: List[str] = []                  # sıralı, en fazla BASELINE_MONTHS + 1
+        self.cats: Dict[str, "_CategoryState"] = {}
+
+
+class _CategoryState:
+    __slots__ = ("totals", "sub_last_seen", "sub_current", "period", "alerted", "sub_alerted")
+
+    def __init__(self):
+        self.totals: Dict[str, float] = {}            # dönem -> toplam (yalnızca pencere)
+        self.sub_last_seen: Dict[str, str] = {}       # alt kalem -> en son görüldüğü önceki dönem
+        self.sub_current: Dict[str, float] = {}       # güncel dönem alt kalem tutarları
+        self.period: Optional[str] = None             # sub_current'ın ait olduğu dönem
+        self.alerted = False
+        self.sub_alerted: set = set()
+
+    def roll_to(self, period: str) -> None:
+        if self.period == period:
+            return
+        if self.period is not None:
+            for sub in self.sub_current:
+                self.sub_last_seen[sub] = self.period
+        self.period = period
+        self.sub_current = {}
+        self.alerted = False
+        self.sub_alerted = set()
+
+
+class StreamScorer:
+    def __init__(self, bill_map: Optional[Dict[int, Tuple[int, str]]] = None,
+                 baseline_months: Optional[int] = None, config: Optional[ae.AnomalyConfig] = None):
+        self.bill_map = bill_map or {}
+        self.baseline_months = baseline_months or ae.BASELINE_MONTHS
+        self.config = config or ae.DEFAULT_CONFIG
+        self.users: Dict[int, _UserState] = {}
+        self.processed = 0
+
+    # --- olay çözümleme ---
+    def _resolve(self, event: dict) -> Optional[Tuple[int, str]]:
+        bill_id = event.get("bill_id")
+        mapped = self.bill_map.get(int(bill_id)) if bill_id not in (None, "") else None
+        user_id = event.get("user_id") or (mapped[0] if mapped else None)
+        period = event.get("period") or (mapped[1] if mapped else str(event.get("created_at") or "")[:7])
+        if user_id in (None, "") or len(period) < 7:
+            return None
+        return int(user_id), str(period)[:7]
+
+    def _window(self, user: _UserState, period: str) -> Optional[List[str]]:
+        """Dönemi kullanıcı listesine ekle, pencere dışına çıkan toplamları at.
+        Dönemin kendisi pencereden düştüyse (çok eski olay) None döner.
+        """
+        if period not in user.periods:
+            user.periods.append(period)
+            user.periods.sort()
+            if len(user.periods) > self.baseline_months + 1:
+                dropped = user.periods[:-(self.baseline_months + 1)]
+                user.periods = user.periods[-(self.baseline_months + 1):]
+                for cs in user.cats.values():
+                    for p in dropped:
+                        cs.totals.pop(p, None)
+        if period not in user.periods:
+            return None
+        idx = user.periods.index(period)
+        return user.periods[max(0, idx - self.baseline_months):idx]
+
+    # --- puanlama ---
+    def process(self, event: dict) -> List[dict]:
+        """Tek bir bill_items olayını işle; yayınlanacak anomali olaylarını döndür."""
+        self.processed += 1
+        resolved = self._resolve(event)
+        if resolved is None:
+            return []
+        user_id, period = resolved
+        cat = str(event.get("category") or "").lower().strip()
+        if not cat or cat in ae.EXCLUDE_CATEGORIES:
+            return []
+        sub = str(event.get("subtype") or "unknown").lower().strip() or "unknown"
+        amount = float(event.get("amount") or 0.0)
+
+        user = self.users.setdefault(user_id, _UserState())
+        prev_periods = self._window(user, period)
+        if prev_periods is None:
+            return []  # pencereden eski dönem
+        cs = user.cats.setdefault(cat, _CategoryState())
+        cs.totals[period] = cs.totals.get(period, 0.0) + amount
+
+        if period != user.periods[-1]:
+            # geç gelen (geçmiş dönem) kalem: yalnızca baseline'a yazılır
+            if cs.sub_last_seen.get(sub, "") < period:
+                cs.sub_last_seen[sub] = period
+            return []
+
+        cs.roll_to(period)
+        cs.sub_current[sub] = cs.sub_current.get(sub, 0.0) + amount
+
+        events = []
+        hist = [cs.totals[p] for p in prev_periods if p in cs.totals]
+        count = len(hist)
+        mean = float(np.mean(hist)) if count else 0.0
+        std = float(np.std(hist, ddof=1)) if count > 1 else 0.0
+        anomaly = ae.score_category(cat, cs.totals[period], mean, std, count, float(sum(hist)),
+                                    config=self.config)
+        if anomaly is not None and not cs.alerted:
+            cs.alerted = True
+            events.append(dict(anomaly, type="category_spike"))
+
+        last_seen = cs.sub_last_seen.get(sub)
+        if (cs.sub_current[sub] >= self.config.min_tl and sub not in cs.sub_alerted
+                and (last_seen is None or last_seen not in prev_periods)):
+            cs.sub_alerted.add(sub)
+            events.append({
+                "type": "subtype_first_seen",
+                "category": cat,
+                "subtype": sub,
+                "amount": round(cs.sub_current[sub], 2),
+                "reason": "Bu alt-kalem ilk kez görüldü",
+                "suggested_action": ae.SUGGEST_ACTION.get(cat, "Gözden geçir"),
+            })
+
+        bill_id = event.get("bill_id")
+        for e in events:
+            e.update({"user_id": user_id, "period": period,
+                      "bill_id": int(bill_id) if bill_id not in (None, "") else None,
+                      "event_at": event.get("created_at")})
+        return events
+
+    def run(self, events: Iterable[dict], emit: Callable[[dict], None]) -> int:
+        n = 0
+        for event in events:
+            for out in self.process(event):
+                emit(out)
+                n += 1
+        return n
+
+    def state_size(self) -> Dict[str, int]:
+        cats = sum(len(u.cats) for u in self.users.values())
+        totals = sum(len(c.totals) for u in self.users.values() for c in u.cats.values())
+        return {"users": len(self.users), "user_categories": cats, "period_totals": totals}
+
+
+# ==============================
+# Kaynaklar
+# ==============================
+def load_bill_map(bill_headers_csv: Path) -> Dict[int, Tuple[int, str]]:
+    """bill_id -> (user_id, YYYY-MM)."""
+    out = {}
+    with open(bill_headers_csv, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            out[int(row["bill_id"])] = (int(row["user_id"]), row["period_start"][:7])
+    return out
+
+
+def read_events(path: Path) -> Iterator[dict]:
+    """CSV'yi created_at sırasıyla olay akışı olarak oku (replay/backtest)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    rows.sort(key=lambda r: (r.get("created_at") or "", r.get("bill_id") or ""))
+    return iter(rows)
+
+
+def follow_events(path: Path, poll: float = POLL_INTERVAL, stop: Optional[Callable[[], bool]] = None) -> Iterator[dict]:
+    """Dosyaya sonradan eklenen satırları izle (tail -f). İlk satır başlık olmalıdır."""
+    with open(path, newline="", encoding="utf-8") as f:
+        header = None
+        buf = ""
+        while stop is None or not stop():
+            chunk = f.readline()
+            if not chunk:
+                time.sleep(poll)
+                continue
+            buf += chunk
+            if not buf.endswith("\n"):
+                continue  # satır henüz tam yazılmadı
+            line, buf = buf, ""
+            values = next(csv.reader([line]))
+            if header is None:
+                header = values
+                continue
+            if values:
+                yield dict(zip(header, values))
+
+
+def consume_queue(scorer: StreamScorer, q: "queue.Queue", emit: Callable[[dict], None]) -> int:
+    """Yerel kuyruktan olay tüket; None gelince durur."""
+    n = 0
+    while True:
+        event = q.get()
+        if event is None:
+            return n
+        for out in scorer.process(event):
+            emit(out)
+            n += 1
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--replay", type=str, help="bill_items CSV'sini created_at sırasıyla oynat")
+    src.add_argument("--follow", type=str, help="CSV dosyasına eklenen satırları izle")
+    ap.add_argument("--history", type=str, default=None, help="Önce sessizce işlenecek geçmiş bill_items CSV")
+    ap.add_argument("--data", type=str, default="data", help="bill_headers.csv klasörü (bill_id eşlemesi)")
+    ap.add_argument("--out", type=str, default=None, help="Olayları JSONL olarak yaz (varsayılan: stdout)")
+    ap.add_argument("--append", action="store_true", help="--out dosyasının üzerine yazma, sonuna ekle")
+    ap.add_argument("--profile", choices=sorted(ae.PROFILES), default="default", help="Eşik profili")
+    ap.add_argument("--z", type=float, default=None, help="z eşiği (profili ezer)")
+    ap.add_argument("--pct", type=float, default=None, help="%% artış eşiği (profili ezer)")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = ae.get_config(args.profile).with_values(z_thresh=args.z, pct_thresh=args.pct)
+
+    headers = Path(args.data) / "bill_headers.csv"
+    scorer = StreamScorer(load_bill_map(headers) if headers.exists() else None, config=config)
+    if args.history:
+        scorer.run(read_events(Path(args.history)), emit=lambda e: None)
+
+    out = open(args.out, "a" if args.append else "w", encoding="utf-8") if args.out else sys.stdout
+
+    def emit(e: dict) -> None:
+        out.write(json.dumps(e, ensure_ascii=False) + "\n")
+        out.flush()
+
+    events = read_events(Path(args.replay)) if args.replay else follow_events(Path(args.follow))
+    t0 = time.perf_counter()
+    try:
+        n = scorer.run(events, emit)
+    except KeyboardInterrupt:
+        n = None
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    dt = time.perf_counter() - t0
+    print(json.dumps({"events_in": scorer.processed, "anomalies_out": n, "seconds": round(dt, 3),
+                      "state": scorer.state_size()}, ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
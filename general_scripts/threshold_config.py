@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+threshold_config.py — Değişmez (frozen) eşik konfigürasyonları için ortak taban
+
+Eşikler modül global'i olarak değil, istek başına taşınan donmuş bir nesne olarak
+tutulur; böylece aynı süreçte farklı kanallar farklı profillerle paralel ve
+yarışsız (race-free) çalışır.
+
+Segment/plan bazlı ayarlar `overrides` ile verilir:
+
+    AnomalyConfig(z_thresh=2.0, overrides={("retail", 5): {"z_thresh": 1.5},
+                                            ("youth", ANY): {"pct_thresh": 1.0}})
+
+Override'lar nesne oluşturulurken bir kez derlenir (her anahtar için hazır bir
+kopya); `for_segment(segment, plan_id)` istek sırasında yalnızca sözlük araması yapar.
+Arama sırası: (segment, plan) → (segment, *) → (*, plan) → taban konfigürasyon.
+"""
+from __future__ import annotations
+
+import dataclasses
+from dataclasses import dataclass, field
+from typing import Any, Dict, Mapping, Optional, Tuple, TypeVar
+
+ANY = "*"
+
+T = TypeVar("T", bound="SegmentTuned")
+
+
+def _key(segment: Any, plan_id: Any) -> Tuple[str, str]:
+    norm = lambda v: ANY if v is None or v == ANY else str(v)
+    return norm(segment), norm(plan_id)
+
+
+@dataclass(frozen=True)
+class SegmentTuned:
+    overrides: Mapping[Tuple[Any, Any], Mapping[str, Any]] = field(
+        default_factory=dict, repr=False, compare=False, hash=False)
+    _table: Dict[Tuple[str, str], Any] = field(
+        default=None, init=False, repr=False, compare=False, hash=False)
+
+    def __post_init__(self):
+        table = {}
+        for (segment, plan_id), values in dict(self.overrides).items():
+            table[_key(segment, plan_id)] = dataclasses.replace(self, overrides={}, **values)
+        object.__setattr__(self, "_table", table)
+
+    def for_segment(self: T, segment: Any = None, plan_id: Any = None) -> T:
+        """Segment/plan için derlenmiş konfigürasyon (override yoksa kendisi)."""
+        if not self._table:
+            return self
+        seg, plan = _key(segment, plan_id)
+        for k in ((seg, plan), (seg, ANY), (ANY, plan)):
+            hit = self._table.get(k)
+            if hit is not None:
+                return hit
+        return self
+
+    def with_values(self: T, **values: Optional[Any]) -> T:
+        """None olmayan değerlerle yeni bir kopya (CLI bayrakları için); override'lar korunur."""
+        values = {k: v for k, v in values.items() if v is not None}
+        return dataclasses.replace(self, **values) if values else self
+
+
+def get_profile(profiles: Mapping[str, T], name: Optional[str]) -> T:
+    try:
+        return profiles[name or "default"]
+    except KeyError:
+        raise ValueError(f"Bilinmeyen profil: {name} (seçenekler: {', '.join(profiles)})")
@@ -16,35 +16,47 @@ import pandas as pd
 from pathlib import Path
 import json
 
+try:
+    from general_scripts.numeric_parse import NUMERIC_COLUMNS, read_numeric_csv
+except ImportError:  # betik olarak general_scripts/ içinden çalıştırıldığında
+    from numeric_parse import NUMERIC_COLUMNS, read_numeric_csv
+
 VAT_RATE = 0.18  # basit KDV
 
 # ----------------- IO -----------------
-def load_all(data_dir: Path):
-    users = pd.read_csv(data_dir / "users.csv")
-    plans = pd.read_csv(data_dir / "plans.csv")
-    bill_headers = pd.read_csv(data_dir / "bill_headers.csv")
-    bill_items = pd.read_csv(data_dir / "bill_items.csv")
-    usage_daily = pd.read_csv(data_dir / "usage_daily.csv")
-    add_on_packs = pd.read_csv(data_dir / "add_on_packs.csv")
-
-    # tipler
-    bill_headers["period_start"] = pd.to_datetime(bill_headers["period_start"])
-    bill_headers["period_end"]   = pd.to_datetime(bill_headers["period_end"])
-    bill_headers["issue_date"]   = pd.to_datetime(bill_headers["issue_date"])
-    bill_headers["period"]       = pd.to_datetime(bill_headers["period_start"]).dt.to_period("M").astype(str)
-    usage_daily["date"]          = pd.to_datetime(usage_daily["date"])
-
-    # kategorileri normalize
-    bill_items["category"] = bill_items["category"].astype(str).str.lower().str.strip()
+TABLES = ["users", "plans", "bill_headers", "bill_items", "usage_daily", "add_on_packs"]
+OPTIONAL_TABLES = ["vas_catalog", "premium_sms_catalog"]
+
+def read_table(data_dir: Path, name: str) -> pd.DataFrame:
+    """Tek bir CSV'yi ham olarak oku (ayrıştırma aşaması).
+    bill_items/usage_daily sayısal kolonları dosyanın sayı biçimiyle (numeric_parse) okunur."""
+    path = data_dir / f"{name}.csv"
+    if name not in NUMERIC_COLUMNS:
+        return pd.read_csv(path)
+    df, report = read_numeric_csv(path, NUMERIC_COLUMNS[name])
+    if report["rejected"]:
+        print(f"Warning: {path}: ayrıştırılamayan sayısal değerler {report['rejected']}")
+    return df
+
+def prepare_table(name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Tabloya özgü tip dönüşümleri (yükleme aşaması)."""
+    if name == "bill_headers":
+        df["period_start"] = pd.to_datetime(df["period_start"])
+        df["period_end"]   = pd.to_datetime(df["period_end"])
+        df["issue_date"]   = pd.to_datetime(df["issue_date"])
+        df["period"]       = df["period_start"].dt.to_period("M").astype(str)
+    elif name == "usage_daily":
+        df["date"] = pd.to_datetime(df["date"])
+    elif name == "bill_items":
+        # kategorileri normalize
+        df["category"] = df["category"].astype(str).str.lower().str.strip()
+    return df
+
+def load_table(data_dir: Path, name: str) -> pd.DataFrame:
+    return prepare_table(name, read_table(data_dir, name))
 
-    return {
-        "users": users,
-        "plans": plans,
-        "bill_headers": bill_headers,
-        "bill_items": bill_items,
-        "usage_daily": usage_daily,
-        "add_on_packs": add_on_packs,
-    }
+def load_all(data_dir: Path):
+    return {name: load_table(data_dir, name) for name in TABLES}
 
 # ----------------- çekirdek hesaplar -----------------
 def usage_for_period(user_id: int, period: str, db) -> Dict[str, float]:
@@ -621,19 +621,9 @@ class TurkcellGUI:
         def call():
             user_id = self.analysis_user_var.get()
             period = self.analysis_period_var.get()
-            cohort_data = {
-                "cohort_type": "retail",
-                "avg_total": 180.25,
-                "avg_data_gb": 12.5,
-                "avg_minutes": 450,
-                "avg_sms": 25,
-                "percentile_25": 150.0,
-                "percentile_75": 220.0
-            }
             result = self.api_call("/api/cohort", "POST", {
                 "user_id": int(user_id),
-                "period": period,
-                "cohort_data": cohort_data
+                "period": period
             })
             self.update_result(self.analysis_result, result)
         
@@ -692,19 +682,9 @@ class TurkcellGUI:
         def call():
             user_id = self.bonus_user_var.get()
             period = self.bonus_period_var.get()
-            cohort_data = {
-                "cohort_type": "retail",
-                "avg_total": 180.25,
-                "avg_data_gb": 12.5,
-                "avg_minutes": 450,
-                "avg_sms": 25,
-                "percentile_25": 150.0,
-                "percentile_75": 220.0
-            }
             result = self.api_call("/api/cohort", "POST", {
                 "user_id": int(user_id),
-                "period": period,
-                "cohort_data": cohort_data
+                "period": period
             })
             self.update_result(self.bonus_result, result)
         
@@ -758,7 +738,7 @@ class TurkcellGUI:
                 ("Anomalies", "/api/anomalies", "POST", {"user_id": 1001, "period": "2025-07"}),
                 ("What-If", "/api/whatif", "POST", {"user_id": 1001, "period": "2025-07", "scenario": {"plan_id": 3}}),
                 ("Top 3", "/api/whatif/top3/1001?period=2025-07", "GET"),
-                ("Cohort", "/api/cohort", "POST", {"user_id": 1001, "period": "2025-07", "cohort_data": {"cohort_type": "retail", "avg_total": 180.25}}),
+                ("Cohort", "/api/cohort", "POST", {"user_id": 1001, "period": "2025-07"}),
                 ("Tax Analysis", "/api/tax-analysis", "POST", {"user_id": 1001, "period": "2025-07"}),
                 ("Autofix", "/api/autofix", "POST", {"user_id": 1001, "period": "2025-07"}),
                 ("Checkout", "/api/checkout", "POST", {"user_id": 1001, "actions": [{"type": "change_plan", "payload": {"plan_id": 3}}]})
@@ -826,19 +806,9 @@ class TurkcellGUI:
                 anomaly_result = self.api_call("/api/anomalies", "POST", {"user_id": int(user_id), "period": period})
                 
                 # 5. Kohort kıyası
-                cohort_data = {
-                    "cohort_type": "retail",
-                    "avg_total": 180.25,
-                    "avg_data_gb": 12.5,
-                    "avg_minutes": 450,
-                    "avg_sms": 25,
-                    "percentile_25": 150.0,
-                    "percentile_75": 220.0
-                }
                 cohort_result = self.api_call("/api/cohort", "POST", {
                     "user_id": int(user_id),
-                    "period": period,
-                    "cohort_data": cohort_data
+                    "period": period
                 })
                 
                 # 6. Vergi analizi
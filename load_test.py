@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+load_test.py — API yük testi (senaryo karışımı, eşzamanlılık, varış hızı)
+
+test_api.py tek kullanıcıyla sıralı istek atar; bu araç veri setinden çekilen
+(kullanıcı, dönem, fatura) örnekleriyle gerçekçi bir trafik karışımını çalışan
+API'ye oynatır ve endpoint bazında throughput, gecikme yüzdelikleri ve hata
+oranlarını raporlar (filo boyutlandırması için).
+
+Senaryolar (bir senaryo = sırayla atılan bir veya birkaç istek):
+- explain     POST /api/explain
+- anomalies   POST /api/anomalies
+- whatif      POST /api/whatif (rastgele plan)
+- top3        GET  /api/whatif/top3/{user_id}
+- autofix     POST /api/autofix
+- dashboard   GUI'nin kullanıcı ekranı paketi: kullanıcı, fatura, anomali, kohort,
+              vergi, top3, autofix
+
+Yük modeli:
+- Kapalı döngü (varsayılan): --concurrency kadar sanal kullanıcı art arda senaryo çalıştırır
+- Açık döngü (--rate R): senaryolar Poisson varışlarla saniyede ortalama R kez başlatılır;
+  --concurrency işçi havuzunu sınırlar, havuz doyarsa kuyruk gecikmesi (queue_lag) büyür
+
+Kullanım:
+    python load_test.py --data data --duration 30 --concurrency 16
+    python load_test.py --mix dashboard --rate 20 --concurrency 64 --duration 60 --out load.json
+    python load_test.py --mix anomalies=3,top3=1,whatif=1 --requests 2000 --periods 2
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+from general_scripts.data_prep import table_parts
+
+BASE_URL = "http://localhost:8000"
+
+
+@dataclass(frozen=True)
+class Sample:
+    user_id: int
+    period: str
+    bill_id: int
+    plan_id: int   # what-if için rastgele hedef plan
+
+
+# (ad, method, path, body)
+Step = Tuple[str, str, str, Optional[Dict[str, Any]]]
+
+
+def _user_period(s: Sample) -> Dict[str, Any]:
+    return {"user_id": s.user_id, "period": s.period}
+
+
+SCENARIOS: Dict[str, Callable[[Sample], List[Step]]] = {
+    "explain": lambda s: [("explain", "POST", "/api/explain", {"bill_id": s.bill_id})],
+    "anomalies": lambda s: [("anomalies", "POST", "/api/anomalies", _user_period(s))],
+    "whatif": lambda s: [("whatif", "POST", "/api/whatif", {**_user_period(s), "scenario": {"plan_id": s.plan_id}})],
+    "top3": lambda s: [("top3", "GET", f"/api/whatif/top3/{s.user_id}?period={s.period}", None)],
+    "autofix": lambda s: [("autofix", "POST", "/api/autofix", _user_period(s))],
+    "dashboard": lambda s: [
+        ("user", "GET", f"/api/users/{s.user_id}", None),
+        ("bills", "GET", f"/api/bills/{s.user_id}?period={s.period}", None),
+        ("anomalies", "POST", "/api/anomalies", _user_period(s)),
+        ("cohort", "POST", "/api/cohort", _user_period(s)),
+        ("tax-analysis", "POST", "/api/tax-analysis", _user_period(s)),
+        ("top3", "GET", f"/api/whatif/top3/{s.user_id}?period={s.period}", None),
+        ("autofix", "POST", "/api/autofix", _user_period(s)),
+    ],
+}
+
+# Hazır karışımlar (ağırlıklar göreli)
+MIXES: Dict[str, Dict[str, float]] = {
+    "default": {"dashboard": 2, "anomalies": 3, "whatif": 2, "top3": 2, "autofix": 1, "explain": 1},
+    "dashboard": {"dashboard": 1},
+    "no_llm": {"anomalies": 3, "whatif": 2, "top3": 2},   # LLM çağıran endpoint'ler hariç
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """'default' gibi hazır ad ya da 'anomalies=3,top3=1' biçiminde ağırlıklar."""
+    if spec in MIXES:
+        return dict(MIXES[spec])
+    mix = {}
+    for part in spec.split(","):
+        name, _, w = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Bilinmeyen senaryo: {name} (seçenekler: {', '.join(SCENARIOS)})")
+        mix[name] = float(w) if w else 1.0
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError(f"Geçersiz karışım: {spec}")
+    return mix
+
+
+# ==============================
+# Veri setinden örnekler
+# ==============================
+def load_samples(data_dir: Path, periods: int = 1, max_samples: int = 100_000, seed: int = 42) -> Tuple[List[Tuple[int, str, int]], List[int]]:
+    """Son `periods` dönemin faturalarından (user_id, period, bill_id) örnekleri ve plan id'leri.
+    Shard'lı veri (bill_headers/part-*.csv) de okunur.
+    """
+    parts = table_parts(data_dir, "bill_headers")
+    if not parts:
+        raise FileNotFoundError(f"Eksik: {data_dir / 'bill_headers.csv'}")
+    bh = pd.concat([pd.read_csv(p, usecols=["bill_id", "user_id", "period_start"]) for p in parts], ignore_index=True)
+    bh["period"] = pd.to_datetime(bh["period_start"]).dt.strftime("%Y-%m")
+    recent = sorted(bh["period"].unique())[-max(1, periods):]
+    bh = bh[bh["period"].isin(recent)]
+    if len(bh) > max_samples:
+        bh = bh.sample(max_samples, random_state=seed)
+    samples = list(zip(bh["user_id"].astype(int), bh["period"], bh["bill_id"].astype(int)))
+
+    plans_parts = table_parts(data_dir, "plans")
+    plan_ids = pd.read_csv(plans_parts[0])["plan_id"].astype(int).tolist() if plans_parts else [1]
+    return samples, plan_ids
+
+
+# ==============================
+# Kayıt
+# ==============================
+class Recorder:
+    """İş parçacığı güvenli gecikme/durum kayıtları."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.status: Dict[str, Counter] = defaultdict(Counter)
+        self.scenarios: Counter = Counter()
+        self.queue_lag: List[float] = []
+
+    def request(self, name: str, status: str, seconds: float):
+        with self._lock:
+            self.latency[name].append(seconds)
+            self.status[name][status] += 1
+
+    def scenario(self, name: str, lag: Optional[float] = None):
+        with self._lock:
+            self.scenarios[name] += 1
+            if lag is not None:
+                self.queue_lag.append(lag)
+
+
+def _is_error(status: str) -> bool:
+    return not status.isdigit() or int(status) >= 400
+
+
+def _pct(values: List[float]) -> Dict[str, float]:
+    ms = np.asarray(values, dtype=float) * 1000.0
+    if not len(ms):
+        return {}
+    return {f"p{q}_ms": round(float(np.percentile(ms, q)), 2) for q in (50, 90, 99)} | {"max_ms": round(float(ms.max()), 2)}
+
+
+def report(rec: Recorder, wall: float, config: Dict[str, Any]) -> Dict[str, Any]:
+    endpoints = {}
+    all_lat, all_status = [], Counter()
+    for name in sorted(rec.latency):
+        lat, st = rec.latency[name], rec.status[name]
+        errors = sum(n for s, n in st.items() if _is_error(s))
+        endpoints[name] = {
+            "n": len(lat),
+            "throughput_per_s": round(len(lat) / wall, 2) if wall > 0 else None,
+            "errors": errors,
+            "error_rate": round(errors / len(lat), 4) if lat else 0.0,
+            **_pct(lat),
+            "status": dict(st),
+        }
+        all_lat += lat
+        all_status += st
+    errors = sum(n for s, n in all_status.items() if _is_error(s))
+    out = {
+        "config": config,
+        "wall_s": round(wall, 3),
+        "scenarios": dict(rec.scenarios),
+        "total": {
+            "n": len(all_lat),
+            "throughput_per_s": round(len(all_lat) / wall, 2) if wall > 0 else None,
+            "errors": errors,
+            "error_rate": round(errors / len(all_lat), 4) if all_lat else 0.0,
+            **_pct(all_lat),
+            "status": dict(all_status),
+        },
+        "endpoints": endpoints,
+    }
+    if rec.queue_lag:
+        out["queue_lag"] = _pct(rec.queue_lag)
+    return out
+
+
+def print_report(r: Dict[str, Any]):
+    print(f"\n⏱  {r['wall_s']} sn, senaryolar: {r['scenarios']}")
+    print(f"{'endpoint':<14}{'n':>8}{'req/s':>9}{'hata%':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    rows = list(r["endpoints"].items()) + [("TOPLAM", r["total"])]
+    for name, e in rows:
+        print(f"{name:<14}{e['n']:>8}{e['throughput_per_s'] or 0:>9.1f}{e['error_rate']*100:>7.2f}%"
+              f"{e.get('p50_ms', 0):>9.1f}{e.get('p90_ms', 0):>9.1f}{e.get('p99_ms', 0):>9.1f}{e.get('max_ms', 0):>9.1f}")
+    if "queue_lag" in r:
+        print(f"kuyruk gecikmesi (ms): {r['queue_lag']}")
+    bad = {k: v for k, v in r["total"]["status"].items() if _is_error(k)}
+    if bad:
+        print(f"hatalar: {bad}")
+
+
+# ==============================
+# Yük üretici
+# ==============================
+class LoadRunner:
+    def __init__(self, base_url: str, samples, plan_ids: List[int], mix: Dict[str, float],
+                 timeout: float = 30.0, seed: int = 42):
+        self.base_url = base_url.rstrip("/")
+        self.samples = samples
+        self.plan_ids = plan_ids
+        self.names = list(mix)
+        self.weights = [mix[n] for n in self.names]
+        self.timeout = timeout
+        self.seed = seed
+        self.rec = Recorder()
+        self._local = threading.local()
+        self._counter = 0
+        self._counter_lock = threading.Lock()
+
+    def _rng(self) -> random.Random:
+        r = getattr(self._local, "rng", None)
+        if r is None:
+            with self._counter_lock:
+                self._counter += 1
+                r = self._local.rng = random.Random(self.seed * 1000 + self._counter)
+            self._local.session = requests.Session()
+        return r
+
+    def run_scenario(self, lag: Optional[float] = None):
+        rng = self._rng()
+        session = self._local.session
+        name = rng.choices(self.names, weights=self.weights)[0]
+        user_id, period, bill_id = rng.choice(self.samples)
+        sample = Sample(user_id, period, bill_id, rng.choice(self.plan_ids))
+        self.rec.scenario(name, lag)
+        for step, method, path, body in SCENARIOS[name](sample):
+            t = time.perf_counter()
+            try:
+                resp = session.request(method, self.base_url + path, json=body, timeout=self.timeout)
+                status = str(resp.status_code)
+            except requests.RequestException as e:
+                status = type(e).__name__
+            self.rec.request(step, status, time.perf_counter() - t)
+
+    def closed_loop(self, concurrency: int, duration: Optional[float], n_scenarios: Optional[int]):
+        """Her işçi bir öncekinin bitmesini bekleyerek art arda senaryo çalıştırır."""
+        deadline = time.perf_counter() + duration if duration else None
+        remaining = [n_scenarios] if n_scenarios else None
+        lock = threading.Lock()
+
+        def take() -> bool:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+            if remaining is not None:
+                with lock:
+                    if remaining[0] <= 0:
+                        return False
+                    remaining[0] -= 1
+            return True
+
+        def worker():
+            while take():
+                self.run_scenario()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def open_loop(self, rate: float, concurrency: int, duration: Optional[float], n_scenarios: Optional[int]):
+        """Poisson varışlar: senaryo başlangıçları cevaplardan bağımsız planlanır."""
+        arrivals = random.Random(self.seed)
+        t0 = time.perf_counter()
+        deadline = t0 + duration if duration else None
+        next_at, sent = t0, 0
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while (n_scenarios is None or sent < n_scenarios) and (deadline is None or next_at < deadline):
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                scheduled = next_at
+                pool.submit(lambda s=scheduled: self.run_scenario(lag=time.perf_counter() - s))
+                sent += 1
+                next_at += arrivals.expovariate(rate)
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="API yük testi")
+    ap.add_argument("--url", default=BASE_URL, help="API adresi")
+    ap.add_argument("--data", default="data", help="Örneklerin çekileceği veri klasörü (bill_headers, plans)")
+    ap.add_argument("--periods", type=int, default=1, help="Son kaç dönemden örnek çekilsin")
+    ap.add_argument("--mix", default="default",
+                    help=f"Senaryo karışımı: {', '.join(MIXES)} ya da 'anomalies=3,top3=1'")
+    ap.add_argument("--concurrency", type=int, default=8, help="Eşzamanlı sanal kullanıcı / işçi sayısı")
+    ap.add_argument("--rate", type=float, default=None, help="Açık döngü: saniyede başlatılan senaryo (Poisson)")
+    ap.add_argument("--duration", type=float, default=None, help="Süre (sn); --requests yoksa varsayılan 30")
+    ap.add_argument("--requests", type=int, default=None, help="Toplam senaryo sayısı")
+    ap.add_argument("--timeout", type=float, default=30.0, help="İstek zaman aşımı (sn)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", default=None, help="Raporu JSON olarak yaz")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.duration is None and args.requests is None:
+        args.duration = 30.0
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        sys.exit(f"❌ {e}")
+
+    samples, plan_ids = load_samples(Path(args.data), args.periods, seed=args.seed)
+    if not samples:
+        sys.exit("❌ Veri setinde fatura bulunamadı")
+    try:
+        requests.get(f"{args.url.rstrip('/')}/health", timeout=5).raise_for_status()
+    except requests.RequestException as e:
+        sys.exit(f"❌ API'ye ulaşılamadı ({args.url}): {e}")
+
+    runner = LoadRunner(args.url, samples, plan_ids, mix, timeout=args.timeout, seed=args.seed)
+    mode = f"açık döngü {args.rate}/sn" if args.rate else "kapalı döngü"
+    print(f"🚀 {args.url} — {mode}, eşzamanlılık {args.concurrency}, karışım {mix}, {len(samples)} örnek")
+    t0 = time.perf_counter()
+    if args.rate:
+        runner.open_loop(args.rate, args.concurrency, args.duration, args.requests)
+    else:
+        runner.closed_loop(args.concurrency, args.duration, args.requests)
+    wall = time.perf_counter() - t0
+
+    config = {k: getattr(args, k) for k in ("url", "mix", "concurrency", "rate", "duration", "requests", "periods", "seed")}
+    result = report(runner.rec, wall, config)
+    print_report(result)
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"✓ Rapor → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+replay_requests.py — Kaydedilmiş istek günlüğünü (JSONL) API'ye tekrar oynatma
+
+REQUEST_LOG=<yol> ile çalışan sunucunun yazdığı kayıtları (general_scripts/request_log.py)
+yerel bir API'ye (--url) ya da süreç içi uygulamaya (--in-process, TestClient) oynatır.
+Performans değişikliklerini canlı ortam olmadan, üretim biçimli trafikle doğrulamak için:
+
+    # 1) Değişiklikten önce: temel koşu
+    python replay_requests.py --log logs/requests.jsonl --in-process --save replay/before.json
+    # 2) Değişiklikten sonra: aynı kayıt, temel koşuyla karşılaştır
+    python replay_requests.py --log logs/requests.jsonl --in-process --save replay/after.json \\
+        --baseline replay/before.json
+
+Zamanlama:
+- --speed 1   orijinal varış aralıkları (varsayılan)
+- --speed 10  10 kat hızlandırılmış
+- --speed 0   beklemeden, art arda (en yüksek throughput)
+
+Karşılaştırma (--baseline): aynı sıradaki isteklerin durum kodu ve yanıt özeti (JSON,
+--ignore-keys alanları çıkarılarak) eşleşmeli; endpoint bazında p50/p99 (1 + tolerans)
+katından fazla artarsa regresyon sayılır. Uyuşmazlık ya da regresyon varsa çıkış kodu 1.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from general_scripts.request_log import read_log, response_digest
+
+BASE_URL = "http://localhost:8000"
+DEFAULT_IGNORE_KEYS = ["llm_summary"]   # LLM metni deterministik değil
+DEFAULT_TOLERANCE = 0.10
+
+# (method, path, body) → (status, content bayt)
+Sender = Callable[[str, str, Any], Tuple[int, bytes]]
+
+
+def http_sender(base_url: str, timeout: float) -> Sender:
+    import requests
+
+    local = threading.local()
+    base_url = base_url.rstrip("/")
+
+    def send(method, path, body):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        resp = session.request(method, base_url + path, json=body, timeout=timeout)
+        return resp.status_code, resp.content
+
+    return send
+
+
+def in_process_sender(data: Optional[str], artifacts: Optional[str]):
+    """api_server uygulamasını TestClient ile süreç içinde çalıştır (sunucu gerekmez)."""
+    from fastapi.testclient import TestClient
+    import api_server
+
+    if data or artifacts:
+        from general_scripts.dataset_store import DatasetStore
+        api_server.STORE = DatasetStore(Path(data or "data"), Path(artifacts or "artifacts"))
+    client = TestClient(api_server.app)
+    client.__enter__()   # startup olayları (snapshot açma)
+    api_server.STORE.prewarm()
+
+    def send(method, path, body):
+        resp = client.request(method, path, json=body)
+        return resp.status_code, resp.content
+
+    return send, client
+
+
+def replay(records: Sequence[Dict[str, Any]], send: Sender, speed: float = 1.0, concurrency: int = 1,
+           ignore_keys: Sequence[str] = ()) -> List[Dict[str, Any]]:
+    """Kayıtları sırayla (speed > 0 ise orijinal aralıklar / speed ile) gönder."""
+    results: List[Optional[Dict[str, Any]]] = [None] * len(records)
+    t_first = records[0].get("ts", 0.0) if records else 0.0
+
+    def run(i: int, rec: Dict[str, Any]):
+        t = time.perf_counter()
+        try:
+            status, content = send(rec["method"], rec["path"], rec.get("body"))
+            digest = response_digest(content, ignore_keys)
+        except Exception as e:
+            status, digest = type(e).__name__, None
+        results[i] = {"i": i, "endpoint": rec.get("endpoint") or rec["path"].split("?")[0],
+                      "status": status, "digest": digest,
+                      "latency_ms": round((time.perf_counter() - t) * 1000.0, 3)}
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = []
+        for i, rec in enumerate(records):
+            if speed > 0:
+                delay = (rec.get("ts", t_first) - t_first) / speed - (time.perf_counter() - t0)
+                if delay > 0:
+                    time.sleep(delay)
+            if concurrency <= 1:
+                run(i, rec)
+            else:
+                futures.append(pool.submit(run, i, rec))
+        for f in futures:
+            f.result()
+    return results
+
+
+def summarize(results: Sequence[Dict[str, Any]], wall: float) -> Dict[str, Any]:
+    by_ep: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for r in results:
+        by_ep[r["endpoint"]].append(r)
+    endpoints = {}
+    for ep in sorted(by_ep):
+        rows = by_ep[ep]
+        lat = np.array([r["latency_ms"] for r in rows], dtype=float)
+        errors = sum(1 for r in rows if not isinstance(r["status"], int) or r["status"] >= 500)
+        endpoints[ep] = {
+            "n": len(rows),
+            "errors": errors,
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p99_ms": round(float(np.percentile(lat, 99)), 3),
+            "mean_ms": round(float(lat.mean()), 3),
+        }
+    return {"n": len(results), "wall_s": round(wall, 3),
+            "throughput_per_s": round(len(results) / wall, 2) if wall > 0 else None,
+            "endpoints": endpoints}
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> Dict[str, Any]:
+    """Aynı kayıttan iki koşu: yanıt uyuşmazlıkları + endpoint bazında gecikme oranları."""
+    base_rows, cur_rows = baseline["results"], current["results"]
+    mismatches = []
+    for b, c in zip(base_rows, cur_rows):
+        if b["status"] != c["status"] or b["digest"] != c["digest"]:
+            mismatches.append({"i": c["i"], "endpoint": c["endpoint"],
+                               "status": [b["status"], c["status"]],
+                               "digest_changed": b["digest"] != c["digest"]})
+    latency = {}
+    for ep, cur in current["summary"]["endpoints"].items():
+        base = baseline["summary"]["endpoints"].get(ep)
+        if not base:
+            continue
+        row = {}
+        for key in ("p50_ms", "p99_ms"):
+            ratio = cur[key] / base[key] if base[key] else None
+            row[key] = {"before": base[key], "after": cur[key],
+                        "ratio": round(ratio, 3) if ratio is not None else None,
+                        "regression": ratio is not None and ratio > 1.0 + tolerance}
+        latency[ep] = row
+    return {
+        "compared": min(len(base_rows), len(cur_rows)),
+        "length_mismatch": len(base_rows) != len(cur_rows),
+        "mismatches": mismatches,
+        "latency": latency,
+        "regressions": sorted(f"{ep}:{k}" for ep, row in latency.items() for k, v in row.items() if v["regression"]),
+    }
+
+
+def print_summary(summary: Dict[str, Any]):
+    print(f"\n⏱  {summary['n']} istek, {summary['wall_s']} sn, {summary['throughput_per_s']} istek/sn")
+    print(f"{'endpoint':<34}{'n':>7}{'5xx':>6}{'p50':>10}{'p99':>10}")
+    for ep, e in summary["endpoints"].items():
+        print(f"{ep:<34}{e['n']:>7}{e['errors']:>6}{e['p50_ms']:>10.2f}{e['p99_ms']:>10.2f}")
+
+
+def print_comparison(cmp: Dict[str, Any]):
+    print(f"\n🔍 Temel koşuyla karşılaştırma ({cmp['compared']} istek)")
+    if cmp["length_mismatch"]:
+        print("⚠️  Koşuların istek sayıları farklı (farklı kayıt?)")
+    print(f"{'endpoint':<34}{'p50 önce':>10}{'sonra':>10}{'p99 önce':>10}{'sonra':>10}")
+    for ep, row in cmp["latency"].items():
+        flag = " ⚠️" if any(v["regression"] for v in row.values()) else ""
+        print(f"{ep:<34}{row['p50_ms']['before']:>10.2f}{row['p50_ms']['after']:>10.2f}"
+              f"{row['p99_ms']['before']:>10.2f}{row['p99_ms']['after']:>10.2f}{flag}")
+    if cmp["mismatches"]:
+        print(f"❌ {len(cmp['mismatches'])} yanıt uyuşmazlığı, ilkler:")
+        for m in cmp["mismatches"][:10]:
+            print(f"   #{m['i']} {m['endpoint']} durum {m['status'][0]}→{m['status'][1]}"
+                  + (" (gövde farklı)" if m["digest_changed"] else ""))
+    else:
+        print("✓ Tüm yanıtlar eşleşti")
+    if cmp["regressions"]:
+        print(f"❌ Gecikme regresyonu: {', '.join(cmp['regressions'])}")
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="İstek kaydını API'ye tekrar oynat")
+    ap.add_argument("--log", required=True, help="REQUEST_LOG ile yazılmış JSONL kayıt")
+    target = ap.add_mutually_exclusive_group()
+    target.add_argument("--url", default=BASE_URL, help="Yerel API adresi")
+    target.add_argument("--in-process", action="store_true", help="api_server'ı TestClient ile süreç içinde çalıştır")
+    ap.add_argument("--data", default=None, help="--in-process: veri klasörü (varsayılan: data)")
+    ap.add_argument("--artifacts", default=None, help="--in-process: artifacts klasörü (varsayılan: artifacts)")
+    ap.add_argument("--speed", type=float, default=1.0, help="Zaman ölçeği: 1 = orijinal, 10 = 10x hızlı, 0 = beklemesiz")
+    ap.add_argument("--concurrency", type=int, default=1, help="Eşzamanlı gönderim (1 = sıralı)")
+    ap.add_argument("--limit", type=int, default=None, help="Yalnızca ilk N kayıt")
+    ap.add_argument("--timeout", type=float, default=30.0, help="--url: istek zaman aşımı (sn)")
+    ap.add_argument("--ignore-keys", nargs="*", default=DEFAULT_IGNORE_KEYS,
+                    help="Yanıt özetinde yok sayılacak JSON anahtarları")
+    ap.add_argument("--save", default=None, help="Koşu sonucunu (istek bazında durum/özet/gecikme) JSON'a yaz")
+    ap.add_argument("--baseline", default=None, help="Karşılaştırılacak önceki --save çıktısı")
+    ap.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Gecikme regresyon toleransı (0.10 = %%10)")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    records = read_log(args.log)[:args.limit]
+    if not records:
+        sys.exit(f"❌ Kayıt boş: {args.log}")
+
+    client = None
+    if args.in_process:
+        send, client = in_process_sender(args.data, args.artifacts)
+        target = "süreç içi"
+    else:
+        send, target = http_sender(args.url, args.timeout), args.url
+    span_s = records[-1].get("ts", 0.0) - records[0].get("ts", 0.0)
+    print(f"▶️  {len(records)} kayıt ({span_s:.1f} sn'lik trafik) → {target}, hız {args.speed or 'beklemesiz'}")
+
+    t0 = time.perf_counter()
+    try:
+        results = replay(records, send, args.speed, args.concurrency, args.ignore_keys)
+    finally:
+        if client is not None:
+            client.__exit__(None, None, None)
+    run = {"log": str(args.log), "speed": args.speed, "results": results,
+           "summary": summarize(results, time.perf_counter() - t0)}
+    print_summary(run["summary"])
+
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(run, ensure_ascii=False), encoding="utf-8")
+        print(f"✓ Koşu → {args.save}")
+
+    if args.baseline:
+        cmp = compare(json.loads(Path(args.baseline).read_text(encoding="utf-8")), run, args.tolerance)
+        print_comparison(cmp)
+        if cmp["mismatches"] or cmp["regressions"] or cmp["length_mismatch"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -195,20 +195,10 @@ def analysis_operations():
         elif choice == "2":
             user_id = get_user_input("Kullanıcı ID: ")
             period = get_user_input("Dönem (YYYY-MM): ")
-            cohort_data = {
-                "cohort_type": "retail",
-                "avg_total": 180.25,
-                "avg_data_gb": 12.5,
-                "avg_minutes": 450,
-                "avg_sms": 25,
-                "percentile_25": 150.0,
-                "percentile_75": 220.0
-            }
             print(f"\n{Colors.OKBLUE}👥 Kohort kıyası yapılıyor...{Colors.ENDC}")
             result = api_call("/api/cohort", "POST", {
                 "user_id": int(user_id),
-                "period": period,
-                "cohort_data": cohort_data
+                "period": period
             })
             print_result(result)
             wait_for_key()
@@ -291,20 +281,10 @@ def bonus_operations():
         elif choice == "1":
             user_id = get_user_input("Kullanıcı ID: ")
             period = get_user_input("Dönem (YYYY-MM): ")
-            cohort_data = {
-                "cohort_type": "retail",
-                "avg_total": 180.25,
-                "avg_data_gb": 12.5,
-                "avg_minutes": 450,
-                "avg_sms": 25,
-                "percentile_25": 150.0,
-                "percentile_75": 220.0
-            }
             print(f"\n{Colors.OKBLUE}👥 Kohort kıyası yapılıyor...{Colors.ENDC}")
             result = api_call("/api/cohort", "POST", {
                 "user_id": int(user_id),
-                "period": period,
-                "cohort_data": cohort_data
+                "period": period
             })
             print_result(result)
             wait_for_key()
@@ -352,7 +332,7 @@ def test_all():
         ("Anomalies", "/api/anomalies", "POST", {"user_id": 1001, "period": "2025-07"}),
         ("What-If", "/api/whatif", "POST", {"user_id": 1001, "period": "2025-07", "scenario": {"plan_id": 3}}),
         ("Top 3", "/api/whatif/top3/1001?period=2025-07", "GET"),
-        ("Cohort", "/api/cohort", "POST", {"user_id": 1001, "period": "2025-07", "cohort_data": {"cohort_type": "retail", "avg_total": 180.25}}),
+        ("Cohort", "/api/cohort", "POST", {"user_id": 1001, "period": "2025-07"}),
         ("Tax Analysis", "/api/tax-analysis", "POST", {"user_id": 1001, "period": "2025-07"}),
         ("Autofix", "/api/autofix", "POST", {"user_id": 1001, "period": "2025-07"}),
         ("Checkout", "/api/checkout", "POST", {"user_id": 1001, "actions": [{"type": "change_plan", "payload": {"plan_id": 3}}]})